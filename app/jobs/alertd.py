@@ -13,6 +13,7 @@ AUDIT      = Path("/var/lib/netprobe/logs/audit.jsonl")
 SPEED_HIST = Path("/var/lib/netprobe/speedtest/history.jsonl")
 SP_DB      = Path("/etc/smokeping/config.d/Database")
 DBG        = Path("/var/lib/netprobe/tmp/alertd.debug")
+FLOW_ANOM  = Path("/var/lib/netprobe/flowrollup/anomalies.json")
 
 def _d(msg:str):
     try:
@@ -104,6 +105,19 @@ def check_flow(cfg)->list[tuple[str,str]]:
         pass
     return []
 
+def check_flow_anomaly(cfg)->list[tuple[str,str]]:
+    """Finding recenti del rilevatore sui rollup (util/flowanomaly.py); chiave per tipo+host/porta."""
+    data = _load(Path(cfg.get("path") or FLOW_ANOM), {})
+    cut = time.time() - int(cfg.get("window_min", 15))*60
+    out = {}
+    for f in data.get("findings") or []:
+        try:
+            if int(f.get("ts", 0)) >= cut:
+                out[f"flowanom:{f['kind']}:{f['key']}"] = str(f.get("msg") or f["kind"])
+        except Exception:
+            continue
+    return list(out.items())
+
 def check_cacti(cfg)->list[tuple[str,str]]:
     alerts=[]
     url = cfg.get("url") or f"http://127.0.0.1:{_apache_port()}/cacti/"
@@ -245,6 +259,7 @@ def main():
     if isinstance(checks.get("disk"), dict) and checks["disk"].get("enabled"): alerts += check_disk(checks["disk"])
     if isinstance(checks.get("services"), dict) and checks["services"].get("enabled"): alerts += check_services(checks["services"])
     if isinstance(checks.get("flow"), dict) and checks["flow"].get("enabled"): alerts += check_flow(checks["flow"])
+    if isinstance(checks.get("flow_anomaly"), dict) and checks["flow_anomaly"].get("enabled"): alerts += check_flow_anomaly(checks["flow_anomaly"])
     if isinstance(checks.get("cacti"), dict) and checks["cacti"].get("enabled"): alerts += check_cacti(checks["cacti"])
     if isinstance(checks.get("smokeping"), dict) and checks["smokeping"].get("enabled"): alerts += check_smokeping(checks["smokeping"])
     if isinstance(checks.get("speedtest"), dict) and checks["speedtest"].get("enabled"): alerts += check_speedtest(checks["speedtest"])
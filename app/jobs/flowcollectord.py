@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+# Collector NetFlow v9/IPFIX standalone (util/flowcollector.py): prove in locale o al posto di nfcapd.
+# Uso: flowcollectord.py [host:porta] [dir_segmenti]   (default 127.0.0.1:2056, NETPROBE_FLOWSEG_DIR)
+from __future__ import annotations
+import sys, json, asyncio
+from pathlib import Path
+
+APP_ROOT = Path(__file__).resolve().parents[1]
+if str(APP_ROOT) not in sys.path:
+    sys.path.insert(0, str(APP_ROOT))
+
+from util import flowcollector
+
+STATS_EVERY = 10
+
+async def run(listen: str, seg_dir: Path):
+    col = await flowcollector.start(listen, seg_dir)
+    if col is None:
+        print(json.dumps({"ok": False, "error": "collector non avviato (numpy?)"}))
+        return
+    try:
+        while True:
+            await asyncio.sleep(STATS_EVERY)
+            print(json.dumps(col.status()), flush=True)
+    finally:
+        flowcollector.stop()
+
+def main():
+    listen = sys.argv[1] if len(sys.argv) > 1 else "127.0.0.1:2056"
+    seg_dir = Path(sys.argv[2]) if len(sys.argv) > 2 else flowcollector.SEG_DIR
+    try:
+        asyncio.run(run(listen, seg_dir))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
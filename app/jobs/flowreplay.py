@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# Rispedisce i flussi di file nfcapd come NetFlow v9 verso un collector (default 127.0.0.1:2056).
+# Uso: flowreplay.py file_nfcapd... [--to host:porta]
+from __future__ import annotations
+import sys, time, json, socket, struct
+from pathlib import Path
+
+APP_ROOT = Path(__file__).resolve().parents[1]
+if str(APP_ROOT) not in sys.path:
+    sys.path.insert(0, str(APP_ROOT))
+
+from util import nfcapd
+
+TPL_V4, TPL_V6 = 256, 257
+# (IE, lunghezza): bytes, pkts, proto, sport, src, dport, dst, last, first (uptime ms)
+_FIELDS_V4 = [(1, 8), (2, 8), (4, 1), (7, 2), (8, 4), (11, 2), (12, 4), (21, 4), (22, 4)]
+_FIELDS_V6 = [(1, 8), (2, 8), (4, 1), (7, 2), (27, 16), (11, 2), (28, 16), (21, 4), (22, 4)]
+_REC_V4 = struct.Struct("!QQBH4sH4sII")
+_REC_V6 = struct.Struct("!QQBH16sH16sII")
+_PER_PACKET = 30
+_TEMPLATE_EVERY = 20   # pacchetti tra un reinvio dei template e l'altro
+
+def _template_flowset() -> bytes:
+    body = b""
+    for tid, fields in ((TPL_V4, _FIELDS_V4), (TPL_V6, _FIELDS_V6)):
+        body += struct.pack("!HH", tid, len(fields)) + b"".join(struct.pack("!HH", *f) for f in fields)
+    return struct.pack("!HH", 0, 4 + len(body)) + body
+
+def _data_flowset(tid: int, recs: list) -> bytes:
+    body = b"".join(recs)
+    pad = (-len(body)) % 4
+    return struct.pack("!HH", tid, 4 + len(body) + pad) + body + b"\0" * pad
+
+def replay(paths: list, host: str, port: int) -> dict:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    seq, sent_pkts, sent_flows = 0, 0, 0
+    boot_ms = None
+    for p in paths:
+        for a in nfcapd.read(p):
+            if boot_ms is None:
+                boot_ms = int(a["first"].min()) - 1000
+            v4, v6 = [], []
+            for r in a.tolist():
+                first, last, pkts, byts, sport, dport, proto, src, dst = r
+                up_first = (first - boot_ms) & 0xFFFFFFFF
+                up_last = (last - boot_ms) & 0xFFFFFFFF
+                if src[:12] == b"\0" * 10 + b"\xff\xff":
+                    v4.append(_REC_V4.pack(byts, pkts, proto, sport, src[12:], dport, dst[12:], up_last, up_first))
+                else:
+                    v6.append(_REC_V6.pack(byts, pkts, proto, sport, src, dport, dst, up_last, up_first))
+            for tid, recs in ((TPL_V4, v4), (TPL_V6, v6)):
+                for i in range(0, len(recs), _PER_PACKET):
+                    chunk = recs[i:i + _PER_PACKET]
+                    # export in secondi interi: il collector ricostruisce i tempi da unix_secs
+                    export_ms = (max(int(time.time() * 1000), int(a["last"].max())) // 1000 + 1) * 1000
+                    sets = _data_flowset(tid, chunk)
+                    count = len(chunk)
+                    if sent_pkts % _TEMPLATE_EVERY == 0:
+                        sets = _template_flowset() + sets
+                        count += 2
+                    hdr = struct.pack("!HHIIII", 9, count, (export_ms - boot_ms) & 0xFFFFFFFF,
+                                      export_ms // 1000, seq, 0)
+                    sock.sendto(hdr + sets, (host, port))
+                    seq += 1; sent_pkts += 1; sent_flows += len(chunk)
+                    time.sleep(0.0005)   # evita drop sul buffer UDP locale
+    return {"ok": True, "packets": sent_pkts, "flows": sent_flows}
+
+def main():
+    args = sys.argv[1:]
+    dest = "127.0.0.1:2056"
+    if "--to" in args:
+        i = args.index("--to")
+        dest = args[i + 1]
+        del args[i:i + 2]
+    if not args:
+        print("uso: flowreplay.py file_nfcapd... [--to host:porta]", file=sys.stderr)
+        sys.exit(2)
+    host, _, port = dest.rpartition(":")
+    print(json.dumps(replay(args, host or "127.0.0.1", int(port))))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+# Piega i file nfcapd ruotati nei rollup 1m/5m/1h (util/flowrollup.py), poi il rilevatore anomalie
+# e la retention a budget (util/flowretention.py, al massimo ogni RUN_EVERY secondi).
+from __future__ import annotations
+import sys, json, fcntl
+from pathlib import Path
+
+APP_ROOT = Path(__file__).resolve().parents[1]
+if str(APP_ROOT) not in sys.path:
+    sys.path.insert(0, str(APP_ROOT))
+
+from util import flowrollup, flowanomaly, flowretention
+
+LOCK = flowrollup.ROLLUP_DIR / ".fold.lock"
+
+def main():
+    flowrollup.ROLLUP_DIR.mkdir(parents=True, exist_ok=True)
+    with open(LOCK, "w") as lk:
+        try:
+            fcntl.flock(lk.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return  # run precedente ancora in corso
+        res = flowrollup.fold_new()
+        try:
+            res["anomaly"] = flowanomaly.run()
+        except Exception as e:
+            res["anomaly"] = {"ok": False, "error": str(e)}
+    # la retention prende da sé lo stesso lock (è chiamata anche dall'API)
+    try:
+        res["retention"] = flowretention.run()
+    except Exception as e:
+        res["retention"] = {"ok": False, "error": str(e)}
+    print(json.dumps(res))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# Scoperta passiva (ARP/DHCP/mDNS/LLMNR/NetBIOS) su un'interfaccia: filtro BPF nel kernel
+# (util/passive.py), stato per host in memoria, scrittura nell'inventario Net Mapper ogni FLUSH_EVERY s.
+# Uso: netmappassived.py IFACE   (unit netprobe-netmap-passive@IFACE, serve CAP_NET_RAW)
+from __future__ import annotations
+import sys, json, time, select, signal
+from pathlib import Path
+
+APP_ROOT = Path(__file__).resolve().parents[1]
+if str(APP_ROOT) not in sys.path:
+    sys.path.insert(0, str(APP_ROOT))
+
+from util import passive, hostinv, oui
+
+FLUSH_EVERY = 30
+READ_BURST  = 512       # frame letti per risveglio prima di controllare il flush
+
+def flush(tr: passive.Tracker, iface: str) -> dict:
+    items = tr.drain()
+    for o in items:
+        o["vendor"] = oui.vendor(o["mac"])
+    new = hostinv.observe(items, iface) if items else 0
+    return {"iface": iface, "frames": tr.frames, "tracked": len(tr.hosts), "updated": len(items), "new": new}
+
+def run(iface: str):
+    sock = passive.open_socket(iface)
+    tr = passive.Tracker()
+    next_flush = time.monotonic() + FLUSH_EVERY
+    try:
+        while True:
+            r, _, _ = select.select([sock], [], [], 1.0)
+            if r:
+                now = int(time.time())
+                for _ in range(READ_BURST):
+                    try:
+                        frame, addr = sock.recvfrom(passive.SNAPLEN)
+                    except BlockingIOError:
+                        break
+                    if addr[2] == passive.PACKET_OUTGOING:
+                        continue
+                    tr.frames += 1
+                    for o in passive.parse(frame):
+                        tr.update(o, now)
+            if time.monotonic() >= next_flush:
+                next_flush = time.monotonic() + FLUSH_EVERY
+                try:
+                    print(json.dumps(flush(tr, iface)), flush=True)
+                except Exception as e:
+                    print(json.dumps({"iface": iface, "ok": False, "error": str(e)}), flush=True)
+    finally:
+        try:
+            flush(tr, iface)
+        finally:
+            sock.close()
+
+def main():
+    if len(sys.argv) < 2 or not sys.argv[1]:
+        print("uso: netmappassived.py IFACE", file=sys.stderr)
+        sys.exit(2)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        run(sys.argv[1])
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -31,6 +31,7 @@ DEFAULT_CFG = {
     "cacti":         {"enabled": True, "url": "", "log_dir": "/usr/share/cacti/site/log", "log_stale_min": 10},
     "speedtest":     {"enabled": True, "down_min_mbps": 50, "up_min_mbps": 10, "ping_max_ms": 80},
     "flow":          {"enabled": True, "dir": "/var/lib/netprobe/flows", "stale_min": 10},
+    "flow_anomaly":  {"enabled": False, "path": "/var/lib/netprobe/flowrollup/anomalies.json", "window_min": 15},
     "auth":          {"enabled": True, "fail_threshold": 3, "window_min": 5},
     # nuovo: DHCP Sentinel
     "dhcpsentinel":  {"enabled": False, "events": "/var/lib/netprobe/dhcpsentinel/events.jsonl",
@@ -147,6 +148,7 @@ def alerts_page(request: Request):
         <label class='row' style='gap:6px'><input type='checkbox' name='chk_cacti' {'checked' if cfg['checks']['cacti']['enabled'] else ''}/> Cacti</label>
         <label class='row' style='gap:6px'><input type='checkbox' name='chk_speed' {'checked' if cfg['checks']['speedtest']['enabled'] else ''}/> Speedtest soglie</label>
         <label class='row' style='gap:6px'><input type='checkbox' name='chk_flow' {'checked' if cfg['checks']['flow']['enabled'] else ''}/> Flussi</label>
+        <label class='row' style='gap:6px'><input type='checkbox' name='chk_flowanom' {'checked' if cfg['checks']['flow_anomaly']['enabled'] else ''}/> Anomalie traffico</label>
         <label class='row' style='gap:6px'><input type='checkbox' name='chk_auth' {'checked' if cfg['checks']['auth']['enabled'] else ''}/> Accesso UI</label>
         <label class='row' style='gap:6px'><input type='checkbox' name='chk_dhcps' {'checked' if cfg['checks']['dhcpsentinel']['enabled'] else ''}/> DHCPSentinel</label>
       </div>
@@ -209,7 +211,7 @@ def alerts_save(request: Request,
     # Checks
     chk_services: str | None = Form(None), chk_disk: str | None = Form(None), chk_smoke: str | None = Form(None),
     chk_speed: str | None = Form(None), chk_cacti: str | None = Form(None), chk_flow: str | None = Form(None),
-    chk_auth: str | None = Form(None), chk_dhcps: str | None = Form(None),
+    chk_auth: str | None = Form(None), chk_dhcps: str | None = Form(None), chk_flowanom: str | None = Form(None),
     services: str = Form(""), disk_pct: int = Form(90),
     spd_down: int = Form(50), spd_up: int = Form(10), spd_ping: int = Form(80),
     flow_stale: int = Form(10), sp_rrd: int = Form(10), cacti_stale: int = Form(10),
@@ -240,6 +242,7 @@ def alerts_save(request: Request,
     cfg["checks"]["speedtest"]["enabled"]  = bool(chk_speed)
     cfg["checks"]["cacti"]["enabled"]      = bool(chk_cacti)
     cfg["checks"]["flow"]["enabled"]       = bool(chk_flow)
+    cfg["checks"]["flow_anomaly"]["enabled"] = bool(chk_flowanom)
     cfg["checks"]["auth"]["enabled"]       = bool(chk_auth)
     cfg["checks"]["dhcpsentinel"]["enabled"]= bool(chk_dhcps)
 
@@ -2,10 +2,16 @@
 from fastapi import APIRouter, Request, Form, Query
 from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from html import escape
-import subprocess, time, re, datetime, os, json
+import subprocess, time, re, os, json, threading, asyncio, zlib, base64, ipaddress
+from typing import Optional
+try:
+    import zstandard as _zstd  # opzionale: export .csv.zst
+except Exception:
+    _zstd = None
 
 from routes.auth import verify_session_cookie, _load_users
 from util.audit import log_event
+from util import flowrollup, flowcollector, flowseries, flowanomaly, flowretention, ipenrich, flowparts
 
 router = APIRouter(prefix="/flow", tags=["flow"])
 
@@ -71,18 +77,18 @@ def _window_to_seconds(w: str) -> int:
         return max(1, int(re.sub(r"[^0-9]", "", w))) * 86400
     return 15 * 60
 
+def _nfdump_time(t: int) -> str:
+    return time.strftime("%Y/%m/%d.%H:%M:%S", time.localtime(t))  # formato per nfdump
+
 def _time_range_str(window: str) -> tuple[str, str, int, int]:
     sec = _window_to_seconds(window)
     t_end = int(time.time())
     t_start = t_end - sec
-    fmt = "%Y/%m/%d.%H:%M:%S"  # formato per nfdump
-    ts = time.strftime(fmt, time.localtime(t_start))
-    te = time.strftime(fmt, time.localtime(t_end))
-    return ts, te, t_start, t_end
+    return _nfdump_time(t_start), _nfdump_time(t_end), t_start, t_end
 
-def _nfdump_csv_rows(window: str = "15m", limit: int = 200000):
+def _nfdump_csv_rows(window: str = "15m", limit: int = 200000, root: str = FLOWS_DIR):
     ts, te, _, _ = _time_range_str(window)
-    args = ["nfdump", "-R", FLOWS_DIR, "-t", f"{ts}-{te}", "-o", "csv", "-c", str(limit)]
+    args = ["nfdump", "-R", root, "-t", f"{ts}-{te}", "-o", "csv", "-c", str(limit)]
     rc, out, err = _runp(args, timeout=30)
     if rc != 0 or not out:
         return []
@@ -114,11 +120,32 @@ def _to_int(x, default=0):
     except Exception:
         return default
 
-def _aggregate(rows: list[dict], n: int = 10):
+_STEPS = (60, 300, 900, 3600, 10800, 21600, 86400)
+
+def _auto_step(window: str) -> int:
+    """Step della serie per la dashboard: ~300 punti al massimo, allineato alle risoluzioni dei rollup."""
+    sec = _window_to_seconds(window)
+    return next((s for s in _STEPS if sec // s <= 300), _STEPS[-1])
+
+_TOP_MAX = 100   # righe top-N tenute in cache (le API tagliano a n)
+
+_STACKS = ("proto", "src", "dst")
+
+def _series_out(ser: dict) -> dict:
+    """Serie per le API: etichette orarie + bytes/packets/flows (+ stack se richiesto)."""
+    out = {"labels": [time.strftime("%H:%M:%S", time.localtime(x)) for x in ser["t"]], "t": ser["t"]}
+    for m in flowseries.METRICS:
+        out[m] = ser[m]
+    out["stack"] = ser.get("stack")
+    return out
+
+def _scan(rows: list[dict], t_start: int, t_end: int, step: int = 60,
+          stack: Optional[str] = None, k: int = 5) -> dict:
+    """Un solo passaggio sulle righe: totali, top-N e colonne per la serie temporale."""
     agg_srcip, agg_dstip, agg_dstport, agg_proto = {}, {}, {}, {}
     total_bytes = 0
     total_pkts = 0
-    flows = len(rows)
+    first, last, byts, pkts, keys = [], [], [], [], []
     for r in rows:
         sa = r.get("sa") or r.get("srcip") or r.get("sa:ip")
         da = r.get("da") or r.get("dstip") or r.get("da:ip")
@@ -132,38 +159,178 @@ def _aggregate(rows: list[dict], n: int = 10):
         if da: agg_dstip[da] = agg_dstip.get(da, 0) + ib
         if dp: agg_dstport[dp] = agg_dstport.get(dp, 0) + ib
         if pr: agg_proto[pr] = agg_proto.get(pr, 0) + ib
+        te = flowrollup.nfdump_epoch(r.get("te") or r.get("end") or "")
+        if te is None:
+            continue
+        ts = flowrollup.nfdump_epoch(r.get("ts") or "")
+        first.append(te if ts is None else ts); last.append(te)
+        byts.append(ib); pkts.append(ip)
+        if stack:
+            keys.append({"proto": pr, "src": sa, "dst": da}[stack] or "-")
+
+    if flowseries.available():
+        np = flowseries.np
+        ser = flowseries.series(np.array(first, np.float64), np.array(last, np.float64),
+                                np.array(byts, np.float64), np.array(pkts, np.float64),
+                                t_start, t_end, step, np.array(keys) if stack else None, k, by=stack)
+    else:
+        # senza numpy: tutto il flusso nel bin di fine, niente stack
+        bins = flowseries.bins_for(t_start, t_end, step)
+        ser = {"t": bins, "bytes": [0] * len(bins), "packets": [0] * len(bins), "flows": [0] * len(bins)}
+        for te, ib, ip in zip(last, byts, pkts):
+            idx = (te - bins[0]) // step
+            if 0 <= idx < len(bins):
+                ser["bytes"][idx] += ib; ser["packets"][idx] += ip; ser["flows"][idx] += 1
 
     def topn(d: dict):
-        return sorted(d.items(), key=lambda kv: kv[1], reverse=True)[:n]
+        return sorted(d.items(), key=lambda kv: kv[1], reverse=True)[:_TOP_MAX]
 
     return {
-        "totals": {"flows": flows, "bytes": total_bytes, "packets": total_pkts},
-        "srcip": topn(agg_srcip),
-        "dstip": topn(agg_dstip),
-        "dstport": topn(agg_dstport),
-        "proto": topn(agg_proto),
+        "top": {
+            "totals": {"flows": len(rows), "bytes": total_bytes, "packets": total_pkts},
+            "srcip": topn(agg_srcip),
+            "dstip": topn(agg_dstip),
+            "dstport": topn(agg_dstport),
+            "proto": topn(agg_proto),
+        },
+        "series": _series_out(ser),
     }
 
-def _timeseries(rows: list[dict], t_start: int, t_end: int, step: int = 60):
-    bins = []
-    t = (t_start // step) * step
-    while t <= t_end:
-        bins.append(t)
-        t += step
-    byts = [0] * len(bins)
-    for r in rows:
-        te = r.get("te") or r.get("end") or ""
+def _rollup_scan(t_start: int, t_end: int, step: int = 60, stack: Optional[str] = None, k: int = 5) -> dict:
+    """
+    Come _scan() ma dai rollup 1m/5m/1h: totali esatti, costo indipendente dalla finestra.
+    I file non ancora piegati (gli ultimi minuti, o tutto ciò che segue se il timer è fermo)
+    si leggono grezzi e si sommano; ValueError senza lettore nativo.
+    """
+    tail = flowrollup.unfolded(t_start, t_end)
+    top = flowrollup.query(t_start, t_end, _TOP_MAX, tail)
+    keys = None
+    if stack:
+        keys = [x[0] for x in top[{"proto": "proto", "src": "srcip", "dst": "dstip"}[stack]][:k]]
+    return {"top": top, "series": _series_out(flowrollup.series(t_start, t_end, step, stack, keys, tail))}
+
+def _raw_scan(t_start: int, t_end: int, step: int = 60, stack: Optional[str] = None, k: int = 5,
+              iface: Optional[str] = None) -> dict:
+    """Come _scan() ma dai file nfcapd col lettore nativo, partizioni in parallelo (niente nfdump né CSV)."""
+    res = flowparts.scan_raw(t_start, t_end, step, _TOP_MAX, root=FLOWS_DIR, stack=stack, k=k,
+                             ifaces=None if iface is None else [iface])
+    return {"top": res["top"], "series": _series_out(res["series"])}
+
+# Cache breve condivisa da /api/summary e /api/timeseries: una sola scansione nfdump
+# per (finestra, step) ogni _SCAN_TTL secondi, anche con più dashboard aperte.
+_SCAN_TTL = 10
+_scan_lock = threading.Lock()
+_scan_cache: dict = {}   # (window, step, stack, k, iface) -> (ts_calcolo, risultato)
+_scan_busy: dict = {}    # (window, step, stack, k, iface) -> Lock del calcolo in corso
+
+def _window_scan(window: str, step: int = 60, stack: Optional[str] = None, k: int = 5,
+                 iface: Optional[str] = None) -> dict:
+    """iface = None: tutte le partizioni (rollup se coprono la finestra); altrimenti solo quella."""
+    key = (window, step, stack, k, iface)
+    with _scan_lock:
+        hit = _scan_cache.get(key)
+        if hit and time.time() - hit[0] < _SCAN_TTL:
+            return hit[1]
+        busy = _scan_busy.setdefault(key, threading.Lock())
+    with busy:
+        with _scan_lock:
+            hit = _scan_cache.get(key)
+            if hit and time.time() - hit[0] < _SCAN_TTL:
+                return hit[1]
+        ts, te, t_start, t_end = _time_range_str(window)
+        cov = flowrollup.coverage()
+        res = None
+        if iface is None and cov["first"] and t_start >= cov["first"]:
+            try:
+                res = {"t_start": t_start, "t_end": t_end, "source": "rollup",
+                       **_rollup_scan(t_start, t_end, step, stack, k)}
+            except Exception:
+                res = None      # coda non piegata illeggibile: tutta la finestra dai grezzi
+        if res is None:
+            # i rollup sono globali: il filtro per interfaccia legge solo i grezzi della partizione
+            try:
+                res = {"t_start": t_start, "t_end": t_end, "source": "native",
+                       **_raw_scan(t_start, t_end, step, stack, k, iface)}
+            except Exception:
+                rows = _nfdump_csv_rows(window=window, root=flowparts.part_dir(iface or "", FLOWS_DIR))
+                res = {"t_start": t_start, "t_end": t_end, "source": "nfdump",
+                       **_scan(rows, t_start, t_end, step, stack, k)}
+        with _scan_lock:
+            now = time.time()
+            for ck in [ck for ck, v in _scan_cache.items() if now - v[0] >= _SCAN_TTL]:
+                _scan_cache.pop(ck, None)
+            _scan_cache[key] = (now, res)
+            _scan_busy.pop(key, None)
+        return res
+
+def _top_slice(top: dict, n: int) -> dict:
+    n = max(1, min(int(n), _TOP_MAX))
+    return {k: (v[:n] if isinstance(v, list) else v) for k, v in top.items()}
+
+# ----------------- ricerca flussi (filtro nfdump + cursore) -----------------
+_FLOW_SORT = {"bytes": ("bytes", "ibyt"), "packets": ("packets", "ipkt"), "time": ("tstart", None)}
+_FLOW_PROTOS = ("tcp", "udp", "icmp", "icmp6", "gre", "esp", "ah", "sctp")
+_FLOW_FIELDS = ("ts", "te", "td", "sa", "da", "sp", "dp", "pr", "flg", "ipkt", "ibyt")
+
+def _nfdump_iter(args: list[str]):
+    """Righe stdout di nfdump man mano che arrivano; il processo viene terminato se il consumer si ferma."""
+    proc = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    try:
+        for line in proc.stdout:  # type: ignore
+            yield line
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+
+def _flows_filter(host: Optional[str], net: Optional[str], port: Optional[int],
+                  proto: Optional[str], min_bytes: Optional[int]) -> tuple[list[str], Optional[str]]:
+    """Clausole del filtro nfdump costruite solo da valori validati; (clausole, errore)."""
+    out = []
+    if host:
         try:
-            dt = datetime.datetime.strptime(te.split(".")[0], "%Y-%m-%d %H:%M:%S")
-            ts_end = int(dt.timestamp())
-        except Exception:
-            continue
-        ib = _to_int(r.get("ibyt") or r.get("bytes") or "0")
-        idx = (ts_end - bins[0]) // step
-        if 0 <= idx < len(byts):
-            byts[idx] += ib
-    labels = [time.strftime("%H:%M:%S", time.localtime(x)) for x in bins]
-    return {"labels": labels, "bytes": byts}
+            out.append(f"host {ipaddress.ip_address(host.strip())}")
+        except ValueError:
+            return [], "bad_host"
+    if net:
+        try:
+            out.append(f"net {ipaddress.ip_network(net.strip(), strict=False)}")
+        except ValueError:
+            return [], "bad_net"
+    if port is not None:
+        out.append(f"port {int(port)}")
+    if proto:
+        p = proto.strip().lower()
+        if p in _FLOW_PROTOS or (p.isdigit() and int(p) <= 255):
+            out.append(f"proto {p}")
+        else:
+            return [], "bad_proto"
+    if min_bytes:
+        out.append(f"bytes > {int(min_bytes) - 1}")
+    return out, None
+
+def _flows_cursor_enc(c: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(c).encode()).decode().rstrip("=")
+
+def _flows_cursor_dec(c: str) -> Optional[list]:
+    try:
+        v = json.loads(base64.urlsafe_b64decode(c + "=" * (-len(c) % 4)))
+        sort, t0, t1, val, skip = v
+        if sort not in _FLOW_SORT:
+            return None
+        return [sort, int(t0), int(t1), None if val is None else int(val), int(skip)]
+    except Exception:
+        return None
+
+def _flows_row(r: dict) -> dict:
+    out = {k: r.get(k, "") for k in _FLOW_FIELDS}
+    out["ipkt"] = _to_int(out["ipkt"])
+    out["ibyt"] = _to_int(out["ibyt"])
+    try:
+        out["td"] = float(out["td"])
+    except Exception:
+        pass
+    return out
 
 # ----------------- helpers gestione dati -----------------
 def _parse_age(s: str) -> int:
@@ -194,6 +361,19 @@ def _cleanup_flows_older_than(seconds: int) -> dict:
     except Exception as e:
         return {"ok": False, "error": str(e), "removed": removed}
 
+# ----------------- collector live (opzionale, NETPROBE_FLOW_LISTEN) -----------------
+@router.on_event("startup")
+async def _live_collector_start():
+    try:
+        await flowcollector.start()
+    except Exception as e:
+        flowcollector.log.warning("flow collector non avviato: %s", e)
+
+@router.on_event("shutdown")
+def _live_collector_stop():
+    flowcollector.stop()
+    flowparts.shutdown()
+
 # ----------------- API JSON -----------------
 @router.get("/api/status", response_class=JSONResponse)
 def api_status():
@@ -201,49 +381,408 @@ def api_status():
         ["systemctl", "list-units", "--type=service", "--state=running", "--no-legend", "netprobe-flow-exporter@*"]
     )
     exporters = [ln.split()[0] for ln in out.splitlines() if "netprobe-flow-exporter@" in ln] if rc == 0 else []
+    col = flowcollector.current()
     return {
         "collector": "active" if _is_active("netprobe-flow-collector") else "inactive",
         "exporters": exporters,
+        "live": col.status() if col else None,
+        "partitions": flowparts.partitions(FLOWS_DIR),
     }
 
+@router.get("/api/anomalies", response_class=JSONResponse)
+def api_anomalies(hours: int = Query(24, ge=1, le=168)):
+    return {"findings": flowanomaly.recent(hours * 3600)[::-1]}
+
+@router.get("/api/live", response_class=JSONResponse)
+def api_live(seconds: int = Query(10, ge=1, le=flowcollector.LIVE_SECONDS), n: int = Query(10)):
+    """Ultimi secondi dal collector in-process: top-N e bytes per secondo di ricezione."""
+    col = flowcollector.current()
+    if col is None:
+        return {"enabled": False}
+    stamps, arrays = col.live(seconds)
+    now = int(time.time())
+    bins = list(range(now - seconds + 1, now + 1))
+    byts = [0] * len(bins)
+    for t, a in zip(stamps, arrays):
+        i = int(t) - bins[0]
+        if 0 <= i < len(byts):
+            byts[i] += int(a["bytes"].sum())
+    return {"enabled": True, "seconds": seconds, "status": col.status(),
+            "top": flowrollup.summarize(arrays, max(1, min(n, _TOP_MAX))),
+            "series": {"t": bins, "bytes": byts}}
+
+def _iface_arg(iface: Optional[str]):
+    """(iface | None, risposta 400 | None): solo partizioni esistenti; '' = tutte."""
+    if not iface:
+        return None, None
+    if not flowparts.valid_iface(iface) or iface not in flowparts.partitions(FLOWS_DIR):
+        return None, JSONResponse({"error": "bad_iface", "allowed": [p for p in flowparts.partitions(FLOWS_DIR) if p]},
+                                  status_code=400)
+    return iface, None
+
+def _stack_args(stack: Optional[str], k: int):
+    if stack in (None, "", "none"):
+        return None, 5, None
+    if stack not in _STACKS:
+        return None, 5, JSONResponse({"error": "bad_stack", "allowed": list(_STACKS)}, status_code=400)
+    return stack, max(1, min(int(k), 20)), None
+
 @router.get("/api/summary", response_class=JSONResponse)
-def api_summary(window: str = Query("15m"), n: int = Query(10)):
-    rows = _nfdump_csv_rows(window=window)
-    agg = _aggregate(rows, n=n)
-    ts, te, t_start, t_end = _time_range_str(window)
-    return {"window": window, "t_start": t_start, "t_end": t_end, "top": agg}
+def api_summary(window: str = Query("15m"), n: int = Query(10), step: int = Query(60),
+                stack: Optional[str] = Query(None), k: int = Query(5), by: Optional[str] = Query(None),
+                iface: Optional[str] = Query(None)):
+    # stack/k solo per condividere la scansione in cache con /api/timeseries; by=asn|country raggruppa src/dst
+    stack, k, bad = _stack_args(stack, k)
+    if bad:
+        return bad
+    iface, bad = _iface_arg(iface)
+    if bad:
+        return bad
+    if by not in (None, "", "asn", "country"):
+        return JSONResponse({"error": "bad_by", "allowed": ["asn", "country"]}, status_code=400)
+    return _summary_out(window, _window_scan(window, max(10, step), stack, k, iface), n, by)
+
+def _summary_out(window: str, res: dict, n: int, by: Optional[str]) -> dict:
+    top = _top_slice(res["top"], n)
+    out = {"window": window, "t_start": res["t_start"], "t_end": res["t_end"], "top": top, "geo": None}
+    if ipenrich.available():
+        # ASN/paese dal db mmdb locale, al momento della query (cache LRU per IP)
+        out["geo"] = ipenrich.annotate(x[0] for x in top["srcip"] + top["dstip"])
+        if by:
+            # aggregato sulle righe top tenute in cache (_TOP_MAX), il resto non è attribuito
+            out["by"] = {"key": by,
+                         "src": ipenrich.aggregate(res["top"]["srcip"], by, n),
+                         "dst": ipenrich.aggregate(res["top"]["dstip"], by, n)}
+    return out
 
 @router.get("/api/timeseries", response_class=JSONResponse)
-def api_timeseries(window: str = Query("60m"), step: int = Query(60)):
-    ts, te, t_start, t_end = _time_range_str(window)
-    rows = _nfdump_csv_rows(window=window)
-    serie = _timeseries(rows, t_start, t_end, step=max(10, step))
-    return {"window": window, "step": step, "series": serie}
+def api_timeseries(window: str = Query("60m"), step: int = Query(60),
+                   stack: Optional[str] = Query(None), k: int = Query(5), iface: Optional[str] = Query(None)):
+    """bytes/packets/flows per step; stack=proto|src|dst aggiunge le serie delle top-k chiavi."""
+    stack, k, bad = _stack_args(stack, k)
+    if bad:
+        return bad
+    iface, bad = _iface_arg(iface)
+    if bad:
+        return bad
+    res = _window_scan(window, max(10, step), stack, k, iface)
+    return {"window": window, "step": step, "source": res.get("source"), "series": res["series"]}
+
+# ----------------- push SSE: una aggregazione condivisa per chiave -----------------
+_PUSH_EVERY = _SCAN_TTL   # s tra due aggregazioni (allineato alla cache di _window_scan)
+_PUSH_QUEUE = 4           # messaggi in coda per client; se è pieno il client riparte da snapshot
+_PUSH_PING  = 15          # s di keep-alive sullo stream
+_push_hubs: dict = {}
+
+def _push_snapshot(window: str, step: int, stack: Optional[str], k: int, n: int, by: Optional[str],
+                   iface: Optional[str]) -> dict:
+    res = _window_scan(window, step, stack, k, iface)
+    out = _summary_out(window, res, n, by)
+    out["source"] = res.get("source")
+    out["series"] = res["series"]
+    return out
+
+def _push_delta(old: Optional[dict], new: dict) -> Optional[dict]:
+    """Solo bin nuovi/cambiati e righe top-N cambiate; None = serve uno snapshot completo."""
+    if not old:
+        return None
+    so, sn = old["series"], new["series"]
+    if not so["t"] or not sn["t"] or (so.get("stack") or {}).get("keys") != (sn.get("stack") or {}).get("keys"):
+        return None
+    if so["t"][-1] < sn["t"][0]:
+        return None           # la finestra è avanzata oltre tutto quanto inviato
+    pos = {t: i for i, t in enumerate(so["t"])}
+    start = len(sn["t"])
+    for j, t in enumerate(sn["t"]):
+        i = pos.get(t)
+        # l'ultimo bin inviato era ancora parziale; quelli prima possono cambiare per flussi tardivi
+        if i is None or i == len(so["t"]) - 1 or any(so[m][i] != sn[m][j] for m in flowseries.METRICS):
+            start = j
+            break
+    bins = {"t": sn["t"][start:], "labels": sn["labels"][start:],
+            **{m: sn[m][start:] for m in flowseries.METRICS}, "stack": None}
+    if sn.get("stack"):
+        bins["stack"] = {m: [row[start:] for row in sn["stack"][m]] for m in flowseries.METRICS}
+    top, keys = {}, set()
+    for name, rows in new["top"].items():
+        if not isinstance(rows, list):
+            top[name] = rows
+            continue
+        prev = old["top"].get(name) or []
+        changed = [[i, r] for i, r in enumerate(rows) if i >= len(prev) or list(prev[i]) != list(r)]
+        if changed or len(prev) != len(rows):
+            top[name] = {"len": len(rows), "rows": changed}
+            keys.update(r[0] for _, r in changed)
+    geo = new.get("geo")
+    return {"t_start": new["t_start"], "t_end": new["t_end"], "t0": sn["t"][0],
+            "from": sn["t"][start] if start < len(sn["t"]) else None, "bins": bins, "top": top,
+            "geo": {k: v for k, v in geo.items() if k in keys} if geo else None,
+            "by": new.get("by") if new.get("by") != old.get("by") else None}
+
+class _PushHub:
+    """Aggregatore per (window, step, stack, k, n, by, iface): gira solo finché ha iscritti."""
+
+    def __init__(self, key: tuple):
+        self.key = key
+        self.subs: set = set()
+        self.snap: Optional[dict] = None
+        self.task = None
+
+    def _send(self, q, event: str, data):
+        try:
+            q.put_nowait((event, data))
+        except asyncio.QueueFull:
+            # client lento: si scarta l'arretrato e riparte dallo stato completo
+            while not q.empty():
+                q.get_nowait()
+            # senza snapshot ancora calcolato si rimanda l'evento stesso (errore o primo stato)
+            q.put_nowait(("snapshot", self.snap) if self.snap is not None else (event, data))
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while self.subs:
+                try:
+                    snap = await loop.run_in_executor(None, _push_snapshot, *self.key)
+                except Exception as e:
+                    # non "error": è il nome dell'evento di connessione di EventSource
+                    for q in list(self.subs):
+                        self._send(q, "scan_error", {"error": str(e)})
+                else:
+                    delta = _push_delta(self.snap, snap)
+                    self.snap = snap
+                    for q in list(self.subs):
+                        self._send(q, "delta" if delta else "snapshot", delta or snap)
+                await asyncio.sleep(_PUSH_EVERY)
+        finally:
+            _push_hubs.pop(self.key, None)
+
+def _sse(event: str, data) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode()
+
+async def _push_stream(request: Request, key: tuple):
+    # lookup e iscrizione senza await in mezzo: un hub appena fermato non può "perdere" il client
+    hub = _push_hubs.get(key)
+    if hub is None:
+        hub = _push_hubs[key] = _PushHub(key)
+    q: asyncio.Queue = asyncio.Queue(_PUSH_QUEUE)
+    hub.subs.add(q)
+    if hub.task is None:
+        hub.task = asyncio.get_running_loop().create_task(hub.run())
+    try:
+        yield b"retry: 5000\n\n"
+        if hub.snap:
+            yield _sse("snapshot", hub.snap)
+        while not await request.is_disconnected():
+            try:
+                event, data = await asyncio.wait_for(q.get(), _PUSH_PING)
+            except asyncio.TimeoutError:
+                yield b": ping\n\n"
+                continue
+            yield _sse(event, data)
+    finally:
+        hub.subs.discard(q)
+
+@router.get("/api/stream")
+async def api_stream(request: Request, window: str = Query("60m"), step: int = Query(60), n: int = Query(10),
+                     stack: Optional[str] = Query(None), k: int = Query(5), by: Optional[str] = Query(None),
+                     iface: Optional[str] = Query(None)):
+    """
+    Server-Sent Events per la dashboard: 'snapshot' (stato completo) all'iscrizione e quando
+    serve, poi 'delta' con i soli bin nuovi/cambiati e le righe top-N cambiate, 'scan_error'
+    se l'aggregazione fallisce. Una sola
+    aggregazione ogni _PUSH_EVERY s per chiave, qualunque sia il numero di schermi aperti.
+    """
+    stack, k, bad = _stack_args(stack, k)
+    if bad:
+        return bad
+    if by not in (None, "", "asn", "country"):
+        return JSONResponse({"error": "bad_by", "allowed": ["asn", "country"]}, status_code=400)
+    iface, bad = _iface_arg(iface)
+    if bad:
+        return bad
+    key = (window, max(10, step), stack, k, max(1, min(int(n), _TOP_MAX)), by or None, iface)
+    return StreamingResponse(_push_stream(request, key), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+_EXPORT_CHUNK = 1 << 16   # byte di CSV per chunk inviato al client
+_EXPORT_ENC = {"none": ("text/csv", ".csv"), "gzip": ("application/gzip", ".csv.gz"),
+               "zstd": ("application/zstd", ".csv.zst")}
+
+def _export_compressor(enc: str):
+    """(compress, flush) per l'encoding scelto; identità se 'none'."""
+    if enc == "gzip":
+        c = zlib.compressobj(6, zlib.DEFLATED, 31)
+        return c.compress, c.flush
+    if enc == "zstd":
+        c = _zstd.ZstdCompressor(level=3).compressobj()
+        return c.compress, c.flush
+    return (lambda b: b), (lambda: b"")
+
+def _export_stream(args: list[str], enc: str):
+    """
+    stdout di nfdump inoltrato a chunk (mai tutto in memoria), con trailer '# rows=N'.
+    Se il client si disconnette il generatore viene chiuso e nfdump terminato nel finally.
+    """
+    proc = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    compress, flush = _export_compressor(enc)
+    rows = 0
+    header = summary = False
+    try:
+        buf, size = [], 0
+        for line in proc.stdout:  # type: ignore
+            if not summary:
+                s = line.strip()
+                if s.startswith(b"Summary"):
+                    summary = True
+                elif not header and s.lower().startswith(b"ts,"):
+                    header = True
+                elif header and s:
+                    rows += 1
+            buf.append(line); size += len(line)
+            if size >= _EXPORT_CHUNK:
+                out = compress(b"".join(buf))
+                buf, size = [], 0
+                if out:
+                    yield out
+        rc = proc.wait()
+        err = proc.stderr.read().decode("utf-8", "replace").strip() if rc != 0 else ""  # type: ignore
+        tail = f"# nfdump rc={rc}\n# {err}\n" if rc != 0 else ""
+        buf.append(f"{tail}# rows={rows}\n".encode())
+        yield compress(b"".join(buf)) + flush()
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
 
 @router.get("/api/export")
-def api_export(window: str = Query("15m")):
+def api_export(window: str = Query("15m"), enc: str = Query("none"), iface: Optional[str] = Query(None)):
+    iface, bad = _iface_arg(iface)
+    if bad:
+        return bad
+    if enc not in _EXPORT_ENC:
+        return JSONResponse({"error": "bad_encoding", "allowed": list(_EXPORT_ENC)}, status_code=400)
+    if enc == "zstd" and _zstd is None:
+        return JSONResponse({"error": "zstd_unavailable"}, status_code=400)
     ts, te, _, _ = _time_range_str(window)
-    rc, out, err = _runp(["nfdump", "-R", FLOWS_DIR, "-t", f"{ts}-{te}", "-o", "csv"], timeout=40)
-    if rc != 0:
-        out = f"# nfdump rc={rc}\n{err}"
-    fname = f"flows_{window}.csv"
+    media, ext = _EXPORT_ENC[enc]
+    fname = f"flows_{re.sub(r'[^0-9a-z]', '', window.lower()) or 'win'}{ext}"
     return StreamingResponse(
-        iter([out]),
-        media_type="text/csv",
+        _export_stream(["nfdump", "-R", flowparts.part_dir(iface or "", FLOWS_DIR), "-t", f"{ts}-{te}", "-o", "csv"], enc),
+        media_type=media,
         headers={"Content-Disposition": f'attachment; filename="{fname}"'}
     )
 
+@router.get("/api/flows", response_class=JSONResponse)
+def api_flows(window: str = Query("15m"),
+              host: Optional[str] = Query(None, max_length=64),
+              net: Optional[str] = Query(None, max_length=64),
+              port: Optional[int] = Query(None, ge=0, le=65535),
+              proto: Optional[str] = Query(None, max_length=8),
+              min_bytes: Optional[int] = Query(None, ge=0),
+              sort: str = Query("bytes"),
+              limit: int = Query(100, ge=1, le=1000),
+              cursor: Optional[str] = Query(None),
+              iface: Optional[str] = Query(None)):
+    """
+    Flussi singoli della finestra filtrati e ordinati da nfdump (-O + filtro), a pagine.
+    Il cursore fissa la finestra; per bytes/packets porta anche l'ultimo valore, così la
+    pagina successiva filtra "bytes < v+1" in nfdump e salta solo i pari merito già inviati.
+    """
+    if sort not in _FLOW_SORT:
+        return JSONResponse({"error": "bad_sort", "allowed": list(_FLOW_SORT)}, status_code=400)
+    iface, bad = _iface_arg(iface)
+    if bad:
+        return bad
+    clauses, err = _flows_filter(host, net, port, proto, min_bytes)
+    if err:
+        return JSONResponse({"error": err}, status_code=400)
+    if cursor:
+        cur = _flows_cursor_dec(cursor)
+        if not cur or cur[0] != sort:
+            return JSONResponse({"error": "bad_cursor"}, status_code=400)
+        _, t_start, t_end, last_val, skip = cur
+    else:
+        _, _, t_start, t_end = _time_range_str(window)
+        last_val, skip = None, 0
+    order, key = _FLOW_SORT[sort]
+    where = list(clauses)
+    if key and last_val is not None:
+        where.append(f"{order} < {last_val + 1}")
+    args = ["nfdump", "-R", flowparts.part_dir(iface or "", FLOWS_DIR), "-t", f"{_nfdump_time(t_start)}-{_nfdump_time(t_end)}",
+            "-o", "csv", "-O", order]
+    if where:
+        args.append(" and ".join(where))
+
+    items, header, seen = [], None, 0
+    more = False
+    for raw in _nfdump_iter(args):
+        ln = raw.strip()
+        if not ln:
+            continue
+        if ln.lower().startswith("ts,"):
+            header = [h.strip() for h in ln.split(",")]
+            continue
+        if ln.startswith("Summary") or ln.lower().startswith("flows,bytes"):
+            break
+        if header is None:
+            continue
+        parts = [x.strip() for x in ln.split(",")]
+        if len(parts) != len(header):
+            continue
+        seen += 1
+        if seen <= skip:
+            continue
+        if len(items) == limit:
+            more = True
+            break
+        items.append(_flows_row(dict(zip(header, parts))))
+
+    next_cursor = None
+    if more and items:
+        if key:
+            v = items[-1][key]
+            ties = sum(1 for it in items if it[key] == v)
+            if last_val is not None and v == last_val:
+                ties += skip     # pagina tutta di pari merito: somma anche quelli saltati
+            next_cursor = _flows_cursor_enc([sort, t_start, t_end, v, ties])
+        else:
+            next_cursor = _flows_cursor_enc([sort, t_start, t_end, None, skip + len(items)])
+    return {"window": window, "t_start": t_start, "t_end": t_end, "sort": sort,
+            "filter": " and ".join(clauses), "items": items, "next_cursor": next_cursor}
+
 # ----------------- actions (solo admin) -----------------
 @router.post("/exporter/start", response_class=JSONResponse)
-def exporter_start(request: Request, iface: str = Form(...)):
+def exporter_start(request: Request, iface: str = Form(...), partition: str = Form("")):
     if not _require_admin(request):
         return {"ok": False, "error": "forbidden"}
+    if not flowparts.valid_iface(iface):
+        return {"ok": False, "error": "bad_iface"}
     _svc("start", "netprobe-flow-collector")
+    port = None
+    if partition:
+        # partizione dedicata: nfcapd proprio su FLOWS_DIR/if-IFACE, l'exporter legge la porta dal file env
+        try:
+            port = flowparts.assign(iface)
+        except Exception as e:
+            return {"ok": False, "error": str(e)}
+        p_ok, p_msg = _svc("restart", f"netprobe-flow-partition@{iface}")
+        if not p_ok:
+            # nessun nfcapd in ascolto sulla porta dedicata: l'exporter torna sul collector condiviso
+            flowparts.release(iface)
+            port = None
+    elif flowparts.dedicated(iface):
+        flowparts.release(iface)
+        _svc("stop", f"netprobe-flow-partition@{iface}")
     ok, msg = _svc("restart", f"netprobe-flow-exporter@{iface}")
     actor = verify_session_cookie(request) or "unknown"
     ip = request.headers.get("x-forwarded-for") or (request.client.host if request.client else None)
+    if partition and port is None:
+        log_event("flow/exporter_start", ok=False, actor=actor, ip=ip,
+                  detail=f"iface={iface} partition=failed", req_path=str(request.url), extra={"msg": p_msg})
+        return {"ok": False, "error": "partizione non avviata, exporter sul collector condiviso", "detail": p_msg}
     log_event("flow/exporter_start", ok=ok, actor=actor, ip=ip,
-              detail=f"iface={iface}", req_path=str(request.url), extra={"msg": msg})
+              detail=f"iface={iface} partition={port or '-'}", req_path=str(request.url), extra={"msg": msg})
     return {"ok": ok, "detail": msg}
 
 @router.post("/exporter/stop", response_class=JSONResponse)
@@ -251,9 +790,12 @@ def exporter_stop(request: Request):
     if not _require_admin(request):
         return {"ok": False, "error": "forbidden"}
     rc, out, _ = _runp(
-        ["systemctl", "list-units", "--type=service", "--state=running", "--no-legend", "netprobe-flow-exporter@*"]
+        ["systemctl", "list-units", "--type=service", "--state=running", "--no-legend",
+         "netprobe-flow-exporter@*", "netprobe-flow-partition@*"]
     )
-    lines = [ln.split()[0] for ln in out.splitlines() if "netprobe-flow-exporter@" in ln] if rc == 0 else []
+    lines = [ln.split()[0] for ln in out.splitlines()
+             if "netprobe-flow-exporter@" in ln or "netprobe-flow-partition@" in ln] if rc == 0 else []
+    lines.sort(key=lambda u: "netprobe-flow-partition@" in u)    # prima gli exporter, poi i loro nfcapd
     stopped = []
     for unit in lines:
         ok, _ = _svc("stop", unit)
@@ -278,6 +820,27 @@ def admin_cleanup(request: Request, older: str = Form("24h")):
               detail=f"older={older}", req_path=str(request.url), extra=res)
     return res
 
+@router.get("/api/retention", response_class=JSONResponse)
+def api_retention():
+    return flowretention.usage()
+
+@router.post("/admin/retention", response_class=JSONResponse)
+def admin_retention(request: Request, budget_mb: int = Form(...)):
+    if not _require_admin(request):
+        return {"ok": False, "error": "forbidden"}
+    if budget_mb < 64:
+        return {"ok": False, "error": "budget minimo 64 MB"}
+    try:
+        flowretention.save_cfg({"raw_budget_mb": budget_mb})
+        res = flowretention.run(budget_mb, force=True)
+    except Exception as e:
+        res = {"ok": False, "error": str(e)}
+    actor = verify_session_cookie(request) or "unknown"
+    ip = request.headers.get("x-forwarded-for") or (request.client.host if request.client else None)
+    log_event("flow/retention", ok=bool(res.get("ok")), actor=actor, ip=ip,
+              detail=f"budget_mb={budget_mb}", req_path=str(request.url), extra=res)
+    return res
+
 # ----------------- UI -----------------
 def _page_head(title: str) -> str:
     return (
@@ -325,6 +888,7 @@ def flow_dashboard(request: Request, window: str = Query("15m"), n: int = Query(
         <label>Interfaccia</label>
         <select name='iface'>__IFACE_OPTIONS__</select>
       </div>
+      <label class='small'><input type='checkbox' name='partition' value='1'/> partizione dedicata</label>
       <button class='btn' type='submit' data-action='/flow/exporter/start'>Start exporter</button>
       <button class='btn danger' type='submit' data-action='/flow/exporter/stop'>Stop tutti</button>
     </form>
@@ -336,6 +900,7 @@ def flow_dashboard(request: Request, window: str = Query("15m"), n: int = Query(
       <a class='btn small' href='/flow?window=1h&n=__N__'>1h</a>
       <a class='btn small' href='/flow?window=6h&n=__N__'>6h</a>
       <a class='btn small' href='/flow?window=24h&n=__N__'>24h</a>
+      <a class='btn small' href='/flow?window=7d&n=__N__'>7d</a>
     </div>
   </div>
 
@@ -350,17 +915,34 @@ def flow_dashboard(request: Request, window: str = Query("15m"), n: int = Query(
     </form>
     <div id="flash2" class="small mono" style="margin-top:6px;"></div>
 
+    <form id="retForm" class="row" style="margin-top:10px">
+      <div>
+        <label>Budget grezzi (MB)</label>
+        <input name="budget_mb" type="number" min="64" class="mono" style="width:110px" />
+      </div>
+      <button class="btn" type="submit">Applica retention</button>
+    </form>
+    <div id="retUsage" class="small mono muted" style="margin-top:6px;"></div>
+
     <div class="row" style="margin-top:10px">
       <label>Export CSV</label>
       <a class="btn small" href="/flow/api/export?window=15m" target="_blank">15m</a>
       <a class="btn small" href="/flow/api/export?window=1h"  target="_blank">1h</a>
       <a class="btn small" href="/flow/api/export?window=6h"  target="_blank">6h</a>
       <a class="btn small" href="/flow/api/export?window=24h" target="_blank">24h</a>
+      <a class="btn small" href="/flow/api/export?window=24h&enc=gzip" target="_blank">24h .gz</a>
+      <a class="btn small" href="/flow/api/export?window=7d&enc=gzip" target="_blank">7d .gz</a>
     </div>
   </div>
 
   <div class='card full'>
-    <h3>Traffico nel tempo</h3>
+    <div class="row">
+      <h3 style="margin-right:auto">Traffico nel tempo</h3>
+      <select id="selMetric"><option value="bytes">Bytes</option><option value="packets">Pacchetti</option><option value="flows">Flussi</option></select>
+      <select id="selIface"><option value="">Tutte le interfacce</option></select>
+      <select id="selStack"><option value="">Totale</option><option value="proto">Per protocollo</option><option value="src">Top sorgenti</option><option value="dst">Top destinazioni</option></select>
+    </div>
+    <div id="pushErr" class="small mono" style="display:none;margin-top:6px;"></div>
     <div class="chart-wrap"><canvas id="chartLine"></canvas></div>
   </div>
 
@@ -379,15 +961,40 @@ def flow_dashboard(request: Request, window: str = Query("15m"), n: int = Query(
     <div class='table'><table id="tblDst"><thead><tr><th>IP destinazione</th><th>Bytes</th></tr></thead><tbody></tbody></table></div>
   </div>
 
+  <div class='card' id="cardGeo" style="display:none">
+    <div class="row">
+      <h3 style="margin-right:auto">Top per</h3>
+      <select id="selGeo"><option value="asn">ASN</option><option value="country">Paese</option></select>
+    </div>
+    <div class='table'><table id="tblGeoSrc"><thead><tr><th>Sorgenti</th><th>Bytes</th></tr></thead><tbody></tbody></table></div>
+    <div class='table'><table id="tblGeoDst"><thead><tr><th>Destinazioni</th><th>Bytes</th></tr></thead><tbody></tbody></table></div>
+  </div>
+
   <div class='card'>
     <h3>Top porte dst</h3>
     <div class='table'><table id="tblPort"><thead><tr><th>Porta</th><th>Bytes</th></tr></thead><tbody></tbody></table></div>
   </div>
 
+  <div class='card full'>
+    <h3>Flussi</h3>
+    <form id="flowsForm" class="row">
+      <input name="host" placeholder="host IP" class="mono" style="width:150px" />
+      <input name="net" placeholder="rete CIDR" class="mono" style="width:150px" />
+      <input name="port" placeholder="porta" class="mono" style="width:80px" />
+      <select name="proto"><option value="">proto</option><option>tcp</option><option>udp</option><option>icmp</option><option>icmp6</option></select>
+      <input name="min_bytes" placeholder="min bytes" class="mono" style="width:100px" />
+      <select name="sort"><option value="bytes">per bytes</option><option value="packets">per pacchetti</option><option value="time">per inizio</option></select>
+      <button class="btn" type="submit">Cerca</button>
+    </form>
+    <div id="flowsMsg" class="small mono" style="margin-top:6px;"></div>
+    <div class='table'><table id="tblFlows"><thead><tr><th>Inizio</th><th>Durata</th><th>Sorgente</th><th>Destinazione</th><th>Proto</th><th>Pkt</th><th>Bytes</th></tr></thead><tbody></tbody></table></div>
+    <button class="btn small" id="flowsMore" style="display:none;margin-top:6px">Altri</button>
+  </div>
+
 </div>
 
 <script>
-const WIN = {window: "__WINDOW__", n: __N__};
+const WIN = {window: "__WINDOW__", n: __N__, step: __STEP__};
 
 function humanBytes(b){
   if(b === undefined || b === null) return "-";
@@ -403,58 +1010,238 @@ async function fetchStatus(){
     const pills = [];
     pills.push("<span class='pill'>Collector: <b>"+(js.collector||"-")+"</b></span>");
     pills.push("<span class='pill'>Exporters: <b>"+((js.exporters||[]).length)+"</b></span>");
+    if(js.live){
+      try{
+        const lv = await (await fetch("/flow/api/live?seconds=5&n=1")).json();
+        const bps = lv.enabled ? (lv.series.bytes.reduce(function(a,b){return a+b;}, 0) / 5) : 0;
+        pills.push("<span class='pill'>Live "+js.live.listen+": <b>"+humanBytes(bps)+"/s</b></span>");
+      }catch(_){}
+    }
     st.innerHTML = pills.join(" ");
+    // partizioni per interfaccia (collector condiviso = "")
+    const sel = document.getElementById("selIface");
+    (js.partitions||[]).filter(Boolean).forEach(function(p){
+      if(![].some.call(sel.options, function(o){ return o.value === p; })){
+        const o = document.createElement("option"); o.value = p; o.textContent = p; sel.appendChild(o);
+      }
+    });
   }catch(e){}
 }
 
 let lineChart=null, protoChart=null;
 
-function updTable(id, arr){
+function geoLabel(info){
+  if(!info) return "";
+  const as = info.asn ? "AS"+info.asn+(info.as_org ? " "+info.as_org : "") : "";
+  return " <span class='small muted'>"+escapeHtml([info.country, as].filter(Boolean).join(" · "))+"</span>";
+}
+function updTable(id, arr, field, geo){
   const tb = document.querySelector(id+" tbody"); tb.innerHTML="";
   (arr||[]).forEach(function(pair){
     const k = pair[0]; const v = pair[1];
     const tr = document.createElement("tr");
-    tr.innerHTML = "<td class='mono'>"+k+"</td><td class='mono' style='text-align:right'>"+humanBytes(v)+"</td>";
+    tr.innerHTML = "<td class='mono'>"+escapeHtml(k)+(geo ? geoLabel(geo[k]) : "")+"</td><td class='mono' style='text-align:right'>"+humanBytes(v)+"</td>";
+    if(field){
+      tr.style.cursor = "pointer";
+      tr.title = "Mostra i flussi";
+      tr.addEventListener("click", function(){ flowsSearch(field, k); });
+    }
     tb.appendChild(tr);
   });
 }
 
-async function refreshAll(){
+// Ricerca flussi: filtri applicati da nfdump, paginazione a cursore
+let flowsCursor = null;
+function flowsQuery(){
+  const fd = new FormData(document.getElementById("flowsForm"));
+  const q = new URLSearchParams({window: WIN.window, limit: "50"});
+  fd.forEach(function(v, k){ if(String(v).trim()) q.set(k, String(v).trim()); });
+  const iface = document.getElementById("selIface").value;
+  if(iface) q.set("iface", iface);
+  return q;
+}
+async function flowsLoad(append){
+  const q = flowsQuery();
+  if(append && flowsCursor) q.set("cursor", flowsCursor);
+  const msg = document.getElementById("flowsMsg");
+  const tb = document.querySelector("#tblFlows tbody");
+  msg.textContent = "Ricerca...";
   try{
-    const s = await (await fetch("/flow/api/summary?window="+WIN.window+"&n="+WIN.n)).json();
-    const t = await (await fetch("/flow/api/timeseries?window="+WIN.window+"&step=60")).json();
-
-    const ctx1 = document.getElementById("chartLine").getContext("2d");
-    if(lineChart) lineChart.destroy();
-    lineChart = new Chart(ctx1, {
-      type: 'line',
-      data: { labels: t.series.labels, datasets: [{ label: 'Bytes', data: t.series.bytes }] },
-      options: {
-        responsive: true,
-        maintainAspectRatio: false,
-        resizeDelay: 150,
-        animation: { duration: 300 },
-        plugins: { legend: { display:false } },
-        interaction: { mode: 'index', intersect: false },
-        scales: { y: { beginAtZero: true } }
-      }
+    const r = await fetch("/flow/api/flows?"+q.toString()); const js = await r.json();
+    if(!r.ok){ msg.textContent = "Errore - "+(js.error||r.status); return; }
+    if(!append) tb.innerHTML = "";
+    (js.items||[]).forEach(function(f){
+      const tr = document.createElement("tr");
+      tr.innerHTML = "<td class='mono'>"+escapeHtml(f.ts)+"</td><td class='mono'>"+escapeHtml(f.td)+"</td>"+
+        "<td class='mono'>"+escapeHtml(f.sa)+":"+escapeHtml(f.sp)+"</td><td class='mono'>"+escapeHtml(f.da)+":"+escapeHtml(f.dp)+"</td>"+
+        "<td class='mono'>"+escapeHtml(f.pr)+"</td><td class='mono' style='text-align:right'>"+f.ipkt+"</td>"+
+        "<td class='mono' style='text-align:right'>"+humanBytes(f.ibyt)+"</td>";
+      tb.appendChild(tr);
     });
+    flowsCursor = js.next_cursor;
+    document.getElementById("flowsMore").style.display = flowsCursor ? "" : "none";
+    msg.textContent = (js.filter ? "Filtro: "+js.filter+" - " : "")+tb.children.length+" flussi";
+  }catch(e){ msg.textContent = "Errore di rete"; }
+}
+function flowsSearch(field, value){
+  const form = document.getElementById("flowsForm");
+  if(field){ form.reset(); form.elements[field].value = value; }
+  flowsCursor = null;
+  flowsLoad(false);
+}
+function escapeHtml(s){
+  return String(s===undefined||s===null?"":s).replace(/[&<>"']/g, function(c){
+    return {"&":"&amp;","<":"&lt;",">":"&gt;",'"':"&quot;","'":"&#39;"}[c];
+  });
+}
+document.getElementById("flowsForm").addEventListener("submit", function(ev){ ev.preventDefault(); flowsSearch(); });
+document.getElementById("flowsMore").addEventListener("click", function(){ flowsLoad(true); });
 
-    const proto = (s.top.proto||[]).map(function(x){ return {k:x[0], v:x[1]}; });
-    const ctx2 = document.getElementById("chartProto").getContext("2d");
-    if(protoChart) protoChart.destroy();
-    protoChart = new Chart(ctx2, {
-      type: 'doughnut',
-      data: { labels: proto.map(function(x){return x.k;}), datasets: [{ data: proto.map(function(x){return x.v;}) }] },
-      options: { responsive:true, maintainAspectRatio:false, animation:{duration:300}, plugins:{ legend:{ position:'bottom' } } }
-    });
+function seriesDatasets(ser, metric){
+  const names = {bytes:"Bytes", packets:"Pacchetti", flows:"Flussi"};
+  if(!ser.stack) return [{ label: names[metric], data: ser[metric] }];
+  return ser.stack.keys.map(function(k, i){
+    return { label: k, data: ser.stack[metric][i], fill: i === 0 ? 'origin' : '-1', pointRadius: 0 };
+  });
+}
+
+// Stato corrente della dashboard: {series, top, geo, by}; i grafici si aggiornano sul posto
+let cur = null, pushSrc = null, pollTimer = null;
+
+function dashQuery(){
+  const stack = document.getElementById("selStack").value;
+  const iface = document.getElementById("selIface").value;
+  return "window="+WIN.window+"&step="+WIN.step+(stack ? "&stack="+stack+"&k=5" : "")
+    +"&n="+WIN.n+"&by="+document.getElementById("selGeo").value+(iface ? "&iface="+encodeURIComponent(iface) : "");
+}
+
+function renderLine(){
+  const metric = document.getElementById("selMetric").value;
+  const ser = cur.series;
+  const sets = seriesDatasets(ser, metric);
+  if(lineChart && lineChart.data.datasets.length === sets.length && !!lineChart.options.scales.y.stacked === !!ser.stack){
+    lineChart.data.labels = ser.labels;
+    sets.forEach(function(ds, i){ lineChart.data.datasets[i].label = ds.label; lineChart.data.datasets[i].data = ds.data; });
+    lineChart.update('none');
+    return;
+  }
+  if(lineChart) lineChart.destroy();
+  lineChart = new Chart(document.getElementById("chartLine").getContext("2d"), {
+    type: 'line',
+    data: { labels: ser.labels, datasets: sets },
+    options: {
+      responsive: true,
+      maintainAspectRatio: false,
+      resizeDelay: 150,
+      animation: { duration: 300 },
+      plugins: { legend: { display: !!ser.stack } },
+      interaction: { mode: 'index', intersect: false },
+      scales: { y: { beginAtZero: true, stacked: !!ser.stack } }
+    }
+  });
+}
+
+function renderProto(){
+  const proto = cur.top.proto||[];
+  const labels = proto.map(function(x){return x[0];}), data = proto.map(function(x){return x[1];});
+  if(protoChart){
+    protoChart.data.labels = labels; protoChart.data.datasets[0].data = data;
+    protoChart.update('none');
+    return;
+  }
+  protoChart = new Chart(document.getElementById("chartProto").getContext("2d"), {
+    type: 'doughnut',
+    data: { labels: labels, datasets: [{ data: data }] },
+    options: { responsive:true, maintainAspectRatio:false, animation:{duration:300}, plugins:{ legend:{ position:'bottom' } } }
+  });
+}
+
+function renderTables(names){
+  const all = !names;
+  if(all || names.srcip) updTable("#tblSrc", cur.top.srcip, "host", cur.geo);
+  if(all || names.dstip) updTable("#tblDst", cur.top.dstip, "host", cur.geo);
+  if(all || names.dstport) updTable("#tblPort", cur.top.dstport, "port");
+  if(all || names.proto) renderProto();
+  document.getElementById("cardGeo").style.display = cur.by ? "" : "none";
+  if(cur.by && (all || names.by)){
+    updTable("#tblGeoSrc", cur.by.src);
+    updTable("#tblGeoDst", cur.by.dst);
+  }
+}
+
+function applyDelta(d){
+  const ser = cur.series, b = d.bins, metrics = ["bytes","packets","flows"];
+  // bin usciti dalla finestra a sinistra, poi sostituzione dal primo bin cambiato
+  let drop = 0;
+  while(drop < ser.t.length && ser.t[drop] < d.t0) drop++;
+  let at = d.from === null ? ser.t.length : ser.t.indexOf(d.from);
+  if(at < 0) at = ser.t.length;
+  function patch(arr, add){ return arr.slice(drop, at).concat(add); }
+  ser.t = patch(ser.t, b.t); ser.labels = patch(ser.labels, b.labels);
+  metrics.forEach(function(m){
+    ser[m] = patch(ser[m], b[m]);
+    if(ser.stack) ser.stack[m] = ser.stack[m].map(function(row, i){ return patch(row, b.stack[m][i]); });
+  });
+  const changed = {};
+  Object.keys(d.top).forEach(function(name){
+    const t = d.top[name];
+    if(!t || !Array.isArray(t.rows)){ cur.top[name] = t; return; }
+    const arr = cur.top[name] = cur.top[name] || [];
+    t.rows.forEach(function(r){ arr[r[0]] = r[1]; });
+    arr.length = t.len;
+    changed[name] = true;
+  });
+  if(d.geo) cur.geo = Object.assign(cur.geo || {}, d.geo);
+  if(d.by){ cur.by = d.by; changed.by = true; }
+  renderLine();
+  renderTables(changed);
+}
 
-    updTable("#tblSrc", s.top.srcip);
-    updTable("#tblDst", s.top.dstip);
-    updTable("#tblPort", s.top.dstport);
+async function refreshAll(){
+  // snapshot via API REST (primo caricamento senza SSE, o dopo un'azione)
+  try{
+    const qs = dashQuery();
+    const s = await (await fetch("/flow/api/summary?"+qs)).json();
+    const t = await (await fetch("/flow/api/timeseries?"+qs)).json();
+    cur = {series: t.series, top: s.top, geo: s.geo, by: s.by};
+    renderLine();
+    renderTables();
   }catch(e){}
 }
 
+function pushConnect(){
+  if(pushSrc) pushSrc.close();
+  if(!window.EventSource){
+    refreshAll();
+    if(!pollTimer) pollTimer = setInterval(refreshAll, 10000);
+    return;
+  }
+  pushSrc = new EventSource("/flow/api/stream?"+dashQuery());
+  pushSrc.addEventListener("snapshot", function(ev){
+    const s = JSON.parse(ev.data);
+    if(!s) return;
+    pushError("");
+    cur = {series: s.series, top: s.top, geo: s.geo, by: s.by};
+    renderLine();
+    renderTables();
+  });
+  pushSrc.addEventListener("delta", function(ev){
+    pushError("");
+    if(cur) applyDelta(JSON.parse(ev.data));
+  });
+  pushSrc.addEventListener("scan_error", function(ev){
+    let msg = "";
+    try{ msg = (JSON.parse(ev.data) || {}).error || ""; }catch(_){}
+    pushError("Aggiornamento non riuscito" + (msg ? " - " + msg : ""));
+  });
+}
+
+function pushError(msg){
+  const el = document.getElementById("pushErr");
+  el.textContent = msg;
+  el.style.display = msg ? "" : "none";
+}
+
 // Gestione AJAX dei pulsanti Start/Stop
 (function(){
   const form = document.getElementById("expForm");
@@ -496,9 +1283,40 @@ async function refreshAll(){
   });
 })();
 
+// Retention a budget: grezzi più vecchi eliminati per primi, rollup 1h/1d tenuti per mesi
+(function(){
+  const form = document.getElementById("retForm");
+  const out = document.getElementById("retUsage");
+  const mb = (n)=> (n/1048576).toFixed(0)+" MB";
+  async function load(){
+    try{
+      const j = await (await fetch("/flow/api/retention")).json();
+      if(!form.budget_mb.value) form.budget_mb.value = j.budget_mb;
+      out.textContent = "Grezzi: "+mb(j.raw_bytes)+" / "+j.budget_mb+" MB ("+j.raw_files+" file"
+        + (j.raw_oldest ? ", dal "+new Date(j.raw_oldest*1000).toLocaleString() : "")+")"
+        + " - Rollup: "+mb(j.rollup_bytes)
+        + (j.rollup_first ? " dal "+new Date(j.rollup_first*1000).toLocaleDateString() : "");
+    }catch(_){ out.textContent = ""; }
+  }
+  form.addEventListener("submit", async (ev)=>{
+    ev.preventDefault();
+    try{
+      const j = await (await fetch("/flow/admin/retention", { method:"POST", body: new FormData(form) })).json();
+      out.textContent = j.ok ? ("OK - rimossi "+((j.raw||{}).removed||0)+", liberati "+mb((j.raw||{}).freed||0)) : ("Errore - "+(j.error||""));
+      setTimeout(load, 3000);
+    }catch(_){ out.textContent = "Errore di rete"; }
+  });
+  load();
+})();
+
+document.getElementById("selMetric").addEventListener("change", function(){ if(cur) renderLine(); });
+document.getElementById("selStack").addEventListener("change", pushConnect);
+document.getElementById("selGeo").addEventListener("change", pushConnect);
+document.getElementById("selIface").addEventListener("change", pushConnect);
+
 fetchStatus();
-refreshAll();
-setInterval(function(){ fetchStatus(); refreshAll(); }, 10000);
+pushConnect();
+setInterval(fetchStatus, 10000);
 </script>
 <script src="/static/bg.js"></script>
 </body></html>
@@ -506,4 +1324,5 @@ setInterval(function(){ fetchStatus(); refreshAll(); }, 10000);
     html = html.replace("__IFACE_OPTIONS__", iface_options)
     html = html.replace("__WINDOW__", escape(window))
     html = html.replace("__N__", str(n))
+    html = html.replace("__STEP__", str(_auto_step(window)))
     return HTMLResponse(html)
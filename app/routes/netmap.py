@@ -3,11 +3,14 @@ from fastapi.responses import HTMLResponse, JSONResponse, FileResponse, Redirect
 from html import escape
 from pathlib import Path
 from typing import List, Dict, Any, Optional, Tuple
-import subprocess, threading, time, json, re, ipaddress, shutil, os
-from collections import Counter
+import subprocess, threading, time, json, re, ipaddress, shutil, os, base64, bisect
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import Counter, OrderedDict
 
 from routes.auth import verify_session_cookie, _load_users
 from util.audit import log_event
+from util import ipenrich, rdns, oui, hostinv
 
 router = APIRouter(prefix="/netmap", tags=["netmap"])
 
@@ -15,10 +18,145 @@ router = APIRouter(prefix="/netmap", tags=["netmap"])
 BASE_DIR   = Path("/var/lib/netprobe/netmap")
 SCANS_DIR  = BASE_DIR / "scans"
 INDEX_FILE = BASE_DIR / "index.json"  # {"scans":[{id, started, target, iface, hosts_up, note}]}
+QUEUE_FILE = BASE_DIR / "queue.json"  # {"config": {"per_iface", "iface": {...}}, "jobs": [...]}
+
+# --- coda scansioni ----------------------------------------------------------
+# Ogni scansione è un job con id proprio: queued -> running -> done|cancelled|failed.
+# Al più N job in esecuzione per interfaccia (config), gli altri attendono in ordine di
+# arrivo. Stato e avanzamento sono salvati in QUEUE_FILE: al riavvio dell'API i job
+# "running" interrotti tornano in coda (al massimo _JOB_ATTEMPTS tentativi).
+_PER_IFACE_DEFAULT = 1
+_PER_IFACE_MAX     = 8
+_JOB_ATTEMPTS      = 2
+_JOBS_KEEP         = 20     # job terminati mostrati/persistiti
+
+class _Cancelled(Exception):
+    pass
+
+class _Job:
+    def __init__(self, spec: Dict[str,Any]):
+        self.spec = spec
+        self.cancelled = threading.Event()
+        self.interrupted = False    # arresto dell'API: il job va ripreso, non annullato
+        self._procs: set = set()
+
+    @property
+    def id(self) -> str:
+        return self.spec["id"]
+
+    def update(self, **kw):
+        with _jobs_lock:
+            self.spec.update(kw)
+            _persist_queue()
+
+    def check(self):
+        if self.cancelled.is_set():
+            raise _Cancelled()
+
+    def track(self, p: subprocess.Popen):
+        with _jobs_lock:
+            self._procs.add(p)
+        if self.cancelled.is_set():
+            p.kill()
+
+    def untrack(self, p: subprocess.Popen):
+        with _jobs_lock:
+            self._procs.discard(p)
+
+    def cancel(self, interrupt: bool = False):
+        self.interrupted = interrupt
+        self.cancelled.set()
+        with _jobs_lock:
+            procs = list(self._procs)
+        for p in procs:
+            try:
+                p.kill()
+            except Exception:
+                pass
 
-# --- internal runtime state ---
-_current_lock = threading.Lock()
-_current: Dict[str,Any] = {}  # {"id":..., "phase": "...", "progress": 0..100, "started": ts}
+_jobs_lock = threading.RLock()
+_jobs: Dict[str,_Job] = {}
+_queue_cfg: Dict[str,Any] = {"per_iface": _PER_IFACE_DEFAULT, "iface": {}}
+
+def _persist_queue():
+    # chiamata con _jobs_lock preso
+    BASE_DIR.mkdir(parents=True, exist_ok=True)
+    done = [j.spec for j in _jobs.values() if j.spec["state"] not in ("queued", "running")]
+    for spec in sorted(done, key=lambda x: x.get("ended") or 0)[:-_JOBS_KEEP or None]:
+        _jobs.pop(spec["id"], None)
+    tmp = QUEUE_FILE.with_suffix(".tmp")
+    tmp.write_text(json.dumps({"config": _queue_cfg, "jobs": [j.spec for j in _jobs.values()]}, indent=1), encoding="utf-8")
+    os.replace(tmp, QUEUE_FILE)
+
+def _iface_limit(iface: str) -> int:
+    return int(_queue_cfg.get("iface", {}).get(iface) or _queue_cfg.get("per_iface") or _PER_IFACE_DEFAULT)
+
+def _dispatch():
+    """Avvia i job in coda (FIFO) finché l'interfaccia ha posti liberi."""
+    with _jobs_lock:
+        running: Dict[str,int] = {}
+        for j in _jobs.values():
+            if j.spec["state"] == "running":
+                running[j.spec["iface"]] = running.get(j.spec["iface"], 0) + 1
+        for j in sorted(_jobs.values(), key=lambda x: x.spec["queued"]):
+            if j.spec["state"] != "queued":
+                continue
+            iface = j.spec["iface"]
+            if running.get(iface, 0) >= _iface_limit(iface):
+                continue
+            running[iface] = running.get(iface, 0) + 1
+            j.spec.update({"state": "running", "phase": "discovery", "progress": 0,
+                           "started": int(time.time()), "attempts": j.spec.get("attempts", 0) + 1})
+            threading.Thread(target=_run_job, args=(j,), daemon=True).start()
+        _persist_queue()
+
+def _run_job(job: _Job):
+    try:
+        _scan_thread(job)
+        job.update(state="done", phase="done", progress=100, ended=int(time.time()))
+    except _Cancelled:
+        if not job.interrupted:
+            job.update(state="cancelled", ended=int(time.time()))
+    except Exception as e:
+        if not job.interrupted:
+            job.update(state="failed", error=str(e)[:300], ended=int(time.time()))
+    finally:
+        if not job.interrupted:
+            _dispatch()
+
+def _enqueue(spec: Dict[str,Any]) -> _Job:
+    with _jobs_lock:
+        base = f"scan-{int(time.time())}"
+        sid, n = base, 1
+        while sid in _jobs or _scan_path(sid).exists():
+            n += 1
+            sid = f"{base}-{n}"
+        job = _Job({**spec, "id": sid, "state": "queued", "phase": None, "progress": 0,
+                    "queued": time.time(), "started": None, "ended": None, "attempts": 0})
+        _jobs[sid] = job
+    _dispatch()
+    return job
+
+def _recover_queue():
+    """Ricarica coda e config; i job interrotti dal riavvio tornano in coda."""
+    try:
+        data = json.loads(QUEUE_FILE.read_text("utf-8"))
+    except Exception:
+        return
+    with _jobs_lock:
+        _queue_cfg.update(data.get("config") or {})
+        for spec in data.get("jobs", []):
+            if spec.get("state") == "running":
+                if spec.get("attempts", 0) >= _JOB_ATTEMPTS:
+                    spec.update(state="failed", error="interrotta dal riavvio", ended=int(time.time()))
+                else:
+                    spec.update(state="queued", phase=None, progress=0)
+            _jobs[spec["id"]] = _Job(spec)
+    _dispatch()
+
+def _jobs_view() -> List[Dict[str,Any]]:
+    with _jobs_lock:
+        return sorted((dict(j.spec) for j in _jobs.values()), key=lambda x: x["queued"], reverse=True)
 
 # --- helpers base ------------------------------------------------------------
 def _run(cmd: List[str], timeout: Optional[int]=None) -> Tuple[int,str,str]:
@@ -46,6 +184,20 @@ def _list_ifaces() -> List[str]:
         if d not in outl: outl.append(d)
     return outl
 
+def _svc(*args: str) -> bool:
+    return subprocess.call(["sudo", "systemctl", *args]) == 0
+
+_PASSIVE_UNIT = "netprobe-netmap-passive@{}"
+_ACTIVE_WINDOW = 900    # s: host "attivi" nella card dell'ascolto passivo
+
+def _passive_running() -> List[str]:
+    rc, out, _ = _run(["systemctl","list-units","--type=service","--state=running","--no-legend",
+                       _PASSIVE_UNIT.format("*")], timeout=10)
+    if rc != 0:
+        return []
+    return [ln.split()[0][len(_PASSIVE_UNIT.format("")):-len(".service")] for ln in out.splitlines()
+            if ln.split() and ln.split()[0].startswith(_PASSIVE_UNIT.format(""))]
+
 def _validate_cidr(s: str) -> bool:
     try:
         ipaddress.ip_network(s, strict=False)
@@ -77,31 +229,9 @@ def _save_scan(scan: Dict[str,Any]):
     tmp.write_text(json.dumps(scan, indent=2), encoding="utf-8")
     os.replace(tmp, p)
 
-def _mac_vendor_resolver() -> Dict[str,str]:
-    db = {}
-    for cand in ["/usr/share/ieee-data/oui.txt", "/usr/share/ieee-oui/oui.txt"]:
-        if Path(cand).exists():
-            try:
-                txt = Path(cand).read_text(errors="ignore")
-                for line in txt.splitlines():
-                    # "FC-34-97   (hex)        Intel Corporate"
-                    m=re.match(r"^([0-9A-F]{2})[-:]?([0-9A-F]{2})[-:]?([0-9A-F]{2}).*?\)\s+(.+)$", line.strip(), re.I)
-                    if m:
-                        key = f"{m.group(1)}:{m.group(2)}:{m.group(3)}".upper()
-                        db[key] = m.group(4).strip()
-            except Exception:
-                pass
-    return db
-
-_VENDOR_CACHE = _mac_vendor_resolver()
-
 def _vendor_from_mac(mac: Optional[str]) -> Optional[str]:
-    if not mac: return None
-    mac = mac.upper().replace("-",":")
-    parts = mac.split(":")
-    if len(parts) < 3: return None
-    key = ":".join(parts[:3])
-    return _VENDOR_CACHE.get(key)
+    # tabella OUI precompilata e mappata al primo uso (MA-L/MA-M/MA-S)
+    return oui.vendor(mac)
 
 # --- auth helpers ------------------------------------------------------------
 def _is_admin(req: Request) -> bool:
@@ -129,44 +259,392 @@ def _parse_arp_scan(out: str) -> List[Dict[str,Any]]:
             hosts.append({"ip":ip, "mac":mac.lower(), "vendor":vend})
     return hosts
 
-def _parse_nmap_sn(out: str) -> List[str]:
-    up=[]
-    cur_ip=None
-    for line in out.splitlines():
-        m=re.match(r"^Nmap scan report for\s+(.+)$", line.strip())
-        if m:
-            token = m.group(1)
-            m2=re.match(r".*\((\d+\.\d+\.\d+\.\d+)\)", token)
-            ip = m2.group(1) if m2 else (token if re.match(r"\d+\.\d+\.\d+\.\d+$", token) else None)
-            if ip:
-                cur_ip=ip
-                if ip not in up: up.append(ip)
-    return up
-
-def _parse_nmap_sv(out: str) -> Dict[str,Any]:
-    hosts={}
-    cur_ip=None
-    for line in out.splitlines():
-        m=re.match(r"^Nmap scan report for\s+(.+)$", line.strip())
-        if m:
-            token=m.group(1)
-            m2=re.match(r".*\((\d+\.\d+\.\d+\.\d+)\)", token)
-            ip = m2.group(1) if m2 else (token if re.match(r"\d+\.\d+\.\d+\.\d+$", token) else None)
-            cur_ip=ip
-            if cur_ip and cur_ip not in hosts:
-                hosts[cur_ip]={"services":[]}
+# --- nmap -oX - in streaming ------------------------------------------------
+def _xml_host(el: ET.Element) -> Dict[str,Any]:
+    """Un <host> di nmap: indirizzi, servizi aperti (versione, CPE), OS migliore, TTL e RTT."""
+    out: Dict[str,Any] = {"ip": None, "mac": None, "vendor": None, "hostname": None, "state": None,
+                          "services": [], "ttl": None}
+    st = el.find("status")
+    if st is not None:
+        out["state"] = st.get("state")
+    for a in el.findall("address"):
+        t = a.get("addrtype")
+        if t == "ipv4" or (t == "ipv6" and not out["ip"]):
+            out["ip"] = a.get("addr")
+        elif t == "mac":
+            out["mac"] = (a.get("addr") or "").lower() or None
+            out["vendor"] = a.get("vendor")
+    hn = el.find("hostnames/hostname")
+    if hn is not None:
+        out["hostname"] = hn.get("name")
+    for port in el.findall("ports/port"):
+        ps = port.find("state")
+        if ps is None:
             continue
-        m3=re.match(r"^(\d+)\/(tcp|udp)\s+open\s+([^\s]+)(.*)$", line.strip())
-        if cur_ip and m3:
-            port=int(m3.group(1)); proto=m3.group(2); name=m3.group(3)
-            rest=m3.group(4).strip()
-            prod=None; ver=None
-            if rest:
-                prod=rest[:120]
-            hosts[cur_ip]["services"].append({
-                "port":port,"proto":proto,"name":name,"product":prod,"version":ver,"state":"open"
-            })
-    return hosts
+        if out["ttl"] is None and (ps.get("reason_ttl") or "0") != "0":
+            out["ttl"] = int(ps.get("reason_ttl"))
+        if ps.get("state") != "open":
+            continue
+        svc = port.find("service")
+        sv = svc.attrib if svc is not None else {}
+        out["services"].append({
+            "port": int(port.get("portid")), "proto": port.get("protocol"),
+            "name": sv.get("name"), "product": sv.get("product"), "version": sv.get("version"),
+            "extrainfo": sv.get("extrainfo"), "cpe": [c.text for c in svc.findall("cpe") if c.text] if svc is not None else [],
+            "conf": int(sv["conf"]) if sv.get("conf") else None, "state": "open",
+        })
+    best = None
+    for m in el.findall("os/osmatch"):
+        acc = int(m.get("accuracy") or 0)
+        if best is None or acc > best["accuracy"]:
+            cls = m.find("osclass")
+            best = {"name": (m.get("name") or "")[:120], "accuracy": acc,
+                    "vendor": cls.get("vendor") if cls is not None else None,
+                    "family": cls.get("osfamily") if cls is not None else None,
+                    "cpe": [c.text for c in m.findall("osclass/cpe") if c.text]}
+    if best:
+        out["os"] = best
+    times = el.find("times")
+    if times is not None and times.get("srtt"):
+        out["srtt"] = int(times.get("srtt")) / 1e6     # µs -> s
+    return out
+
+def _nmap_stream(args: List[str], on_host, timeout: Optional[int]=None, job: Optional["_Job"]=None) -> int:
+    """
+    nmap con -oX - letto con iterparse: on_host(dict) appena un <host> si chiude, poi
+    l'albero viene svuotato (memoria costante anche su /16). Ritorna il codice di uscita,
+    -1 se il processo è stato terminato (timeout, annullamento) o l'XML è troncato.
+    """
+    # bufsize=0: read() ritorna ciò che è disponibile, ogni host arriva appena nmap lo scrive
+    p = subprocess.Popen(args + ["-oX", "-"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=0)
+    if job:
+        job.track(p)
+    killer = threading.Timer(timeout, p.kill) if timeout else None
+    if killer:
+        killer.daemon = True
+        killer.start()
+    broken = False
+    try:
+        root = None
+        for ev, el in ET.iterparse(p.stdout, events=("start", "end")):
+            if root is None:
+                root = el
+            if ev == "end" and el.tag == "host":
+                on_host(_xml_host(el))
+                root.clear()
+    except ET.ParseError:
+        broken = True
+    finally:
+        if killer:
+            killer.cancel()
+        if p.poll() is None:
+            p.kill()
+        p.stdout.close()
+        rc = p.wait()
+        if job:
+            job.untrack(p)
+    return -1 if broken or rc < 0 else rc
+
+# --- risultati parziali: un host per riga, scritto appena nmap lo chiude ----------
+def _journal_path(scan_id: str) -> Path:
+    return SCANS_DIR / f"{scan_id}.hosts.jsonl"
+
+class _Journal:
+    def __init__(self, scan_id: str):
+        SCANS_DIR.mkdir(parents=True, exist_ok=True)
+        self._f = open(_journal_path(scan_id), "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def write(self, host: Dict[str,Any]):
+        line = json.dumps(host, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._f.write(line)
+            self._f.flush()
+
+    def close(self):
+        self._f.close()
+
+def _load_scan(scan_id: str) -> Optional[Dict[str,Any]]:
+    """Scansione salvata; se ancora in corso, gli host del journal sostituiscono quelli del file."""
+    p = _scan_path(scan_id)
+    if not p.exists():
+        return None
+    js = json.loads(p.read_text("utf-8"))
+    jp = _journal_path(scan_id)
+    if not js.get("ended") and jp.exists():
+        hosts = {h["ip"]: h for h in js.get("hosts", []) if h.get("ip")}
+        with open(jp, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    h = json.loads(line)
+                except ValueError:
+                    continue        # riga in scrittura
+                hosts[h["ip"]] = h
+        js["hosts"] = sorted(hosts.values(), key=lambda x: x["ip"])
+    return js
+
+# --- host a pagine lato server ------------------------------------------------
+# La vista non incorpora più l'intero JSON: gli host arrivano da /netmap/hosts con filtri,
+# ordinamento e cursore (keyset: chiave di ordinamento dell'ultima riga restituita).
+# Le scansioni concluse restano in cache (id + mtime del file) con gli ordinamenti già
+# calcolati; quelle in corso si rileggono ogni volta (journal).
+_HOSTS_PAGE_MAX  = 500
+_HOSTS_CACHE_MAX = 4
+_hosts_lock  = threading.Lock()
+_hosts_cache: "OrderedDict[str, Tuple[int, Dict[str,Any]]]" = OrderedDict()
+
+def _ip_key(ip: Optional[str]) -> List[int]:
+    try:
+        a = ipaddress.ip_address(ip or "")
+        return [a.version, int(a)]
+    except ValueError:
+        return [9, 0]
+
+def _svc_label(s: Dict[str,Any]) -> str:
+    return s.get("name") or f"{s.get('proto','?')}/{s.get('port','?')}"
+
+_SORT_KEYS = {
+    "ip":       lambda h: [],
+    "hostname": lambda h: [(h.get("hostname") or "").lower()],
+    "mac":      lambda h: [(h.get("mac") or "").lower()],
+    "vendor":   lambda h: [(h.get("vendor") or "").lower()],
+    "os":       lambda h: [((h.get("os") or {}).get("name") or "").lower()],
+    "ports":    lambda h: [sum(1 for s in h.get("services") or [] if s.get("state", "open") == "open")],
+}
+
+def _summarize(hosts: List[Dict[str,Any]]) -> Dict[str,Any]:
+    """Contatori della vista, calcolati una volta alla chiusura della scansione."""
+    vend, asn, svc, osc = Counter(), Counter(), Counter(), Counter()
+    open_ports = 0
+    for h in hosts:
+        if h.get("vendor"):
+            vend[h["vendor"]] += 1
+        if h.get("asn"):
+            asn[ipenrich.group_key({"asn": h["asn"], "as_org": h.get("as_org") or "", "country": h.get("country")}, "asn")] += 1
+        for s in h.get("services") or []:
+            svc[_svc_label(s)] += 1
+            open_ports += s.get("state") == "open"
+        if h.get("os"):
+            osc[(h["os"] or {}).get("name") or "(sconosciuto)"] += 1
+    return {
+        "hosts_up": len(hosts),
+        "open_ports": open_ports,
+        "vendors": dict(vend),
+        "vendors_unknown": len(hosts) - sum(vend.values()),
+        "asns": dict(asn),
+        "services": dict(svc.most_common(50)),
+        "services_distinct": len(svc),
+        "os": dict(osc.most_common(50)),
+        "os_known": sum(osc.values()),
+        "probed": sum(1 for h in hosts if h.get("probed")),
+    }
+
+def _host_index(js: Dict[str,Any]) -> Dict[str,Any]:
+    hosts = js.get("hosts") or []
+    text, svc = [], []
+    for h in hosts:
+        ss = h.get("services") or []
+        tok = set()
+        for s in ss:
+            tok.update({str(s.get("port")), f"{s.get('proto')}/{s.get('port')}"})
+        svc.append((tok, " ".join(f"{s.get('name') or ''} {s.get('product') or ''}" for s in ss).lower()))
+        text.append(" ".join(str(x) for x in (h.get("ip"), h.get("hostname"), h.get("mac"), h.get("vendor"),
+                                                 (h.get("os") or {}).get("name"),
+                                                 " ".join(f"{s.get('proto')}/{s.get('port')} {_svc_label(s)}" for s in ss))
+                             if x).lower())
+    return {"scan": js, "hosts": hosts, "text": text, "svc": svc, "order": {}}
+
+def _scan_hosts(scan_id: str) -> Optional[Dict[str,Any]]:
+    p = _scan_path(scan_id)
+    try:
+        mtime = p.stat().st_mtime_ns
+    except OSError:
+        return None
+    with _hosts_lock:
+        hit = _hosts_cache.get(scan_id)
+        if hit and hit[0] == mtime:
+            _hosts_cache.move_to_end(scan_id)
+            return hit[1]
+    js = _load_scan(scan_id)
+    if js is None:
+        return None
+    if not js.get("ended") or "services" not in (js.get("summary") or {}):
+        # in corso o salvata prima dei contatori precalcolati
+        js["summary"] = {**(js.get("summary") or {}), **_summarize(js.get("hosts") or [])}
+    idx = _host_index(js)
+    if js.get("ended"):
+        with _hosts_lock:
+            _hosts_cache[scan_id] = (mtime, idx)
+            while len(_hosts_cache) > _HOSTS_CACHE_MAX:
+                _hosts_cache.popitem(last=False)
+    return idx
+
+def _sorted(idx: Dict[str,Any], sort: str) -> Tuple[List[List[Any]], List[int]]:
+    """(chiavi ordinate, posizioni degli host) per un campo; calcolato una volta per scansione."""
+    got = idx["order"].get(sort)
+    if got is None:
+        fk = _SORT_KEYS[sort]
+        keyed = sorted((fk(h) + _ip_key(h.get("ip")), i) for i, h in enumerate(idx["hosts"]))
+        got = idx["order"][sort] = ([k for k, _ in keyed], [i for _, i in keyed])
+    return got
+
+def _host_filter(ip: str, mac: str, vendor: str, service: str, os_: str, q: str):
+    net = None
+    if "/" in ip:
+        net = ipaddress.ip_network(ip, strict=False)        # ValueError -> 400
+    mac_hex = re.sub(r"[^0-9a-f]", "", mac.lower())
+    vendor, os_, q, service = vendor.lower(), os_.lower(), q.lower(), service.lower().strip()
+
+    def ok(h: Dict[str,Any], text: str, svc: Tuple[set, str]) -> bool:
+        if ip:
+            if net is not None:
+                try:
+                    if ipaddress.ip_address(h.get("ip") or "") not in net:
+                        return False
+                except ValueError:
+                    return False
+            elif not (h.get("ip") or "").startswith(ip):
+                return False
+        if mac_hex and mac_hex not in re.sub(r"[^0-9a-f]", "", (h.get("mac") or "").lower()):
+            return False
+        if vendor and vendor not in (h.get("vendor") or "").lower():
+            return False
+        if os_ and os_ not in ((h.get("os") or {}).get("name") or "").lower():
+            return False
+        if service:
+            if service[0].isdigit() or "/" in service:
+                if service not in svc[0]:
+                    return False
+            elif service not in svc[1]:
+                return False
+        return not q or q in text
+    return ok
+
+def _cursor_enc(sort: str, order: str, key: List[Any]) -> str:
+    raw = json.dumps([sort, order, key], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _cursor_dec(cursor: str, sort: str, order: str) -> List[Any]:
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+    try:
+        c_sort, c_order, key = json.loads(raw)
+    except TypeError:
+        raise ValueError("cursore non valido")
+    if c_sort != sort or c_order != order or not isinstance(key, list):
+        raise ValueError("cursore di un altro ordinamento")
+    # stessa forma delle chiavi di _sorted: campo (str, int per "ports", niente per "ip") + _ip_key
+    field = {"ip": (), "ports": (int,)}.get(sort, (str,))
+    shape = field + (int, int)
+    if len(key) != len(shape) or not all(type(v) is t for v, t in zip(key, shape)):
+        raise ValueError("cursore non valido")
+    return key
+
+# --- scansione incrementale contro l'inventario -----------------------------
+_SWEEP_CHUNK = 256      # host per invocazione della ricognizione leggera
+
+def _incremental_plan(job: "_Job", hosts: Dict[str,Dict[str,Any]], up_ips: List[str], iface: str, speed: str, tcp_top: bool,
+                      rtt: Dict[str,float]) -> Dict[str,List[str]]:
+    """
+    Ricognizione leggera (-sS senza -sV, TTL dal reason_ttl dell'XML) e confronto con
+    l'inventario: ritorna {ip da rianalizzare: motivi}; gli altri ereditano servizi/OS/hostname.
+    Lo srtt della ricognizione completa `rtt` per gli host senza riferimento dalla discovery.
+    """
+    sweep: Dict[str,Dict[str,Any]] = {}
+    def on_host(x):
+        if x["ip"] and x["state"] == "up":
+            sweep[x["ip"]] = x
+    for i in range(0, len(up_ips), _SWEEP_CHUNK):
+        args=["/usr/bin/nmap","-sS","-Pn","--top-ports","200","-T"+speed,"-n","-e",iface] + up_ips[i:i+_SWEEP_CHUNK]
+        job.check()
+        try:
+            _nmap_stream(args, on_host, _SV_TIMEOUT, job)
+        except Exception:
+            pass
+        job.update(phase="sweep", progress=25 + int(min(len(up_ips), i+_SWEEP_CHUNK) * 5 / len(up_ips)))
+    job.check()
+    known = hostinv.by_ip(hostinv.load())
+    probe: Dict[str,List[str]] = {}
+    for ip in up_ips:
+        h=hosts[ip]; sw=sweep.get(ip) or {}
+        h["ttl"]=sw.get("ttl")
+        if sw.get("srtt"):
+            rtt.setdefault(ip, sw["srtt"])
+        ports = hostinv.port_set(sw["services"]) if ip in sweep else None
+        rec = known.get(ip)
+        why = hostinv.needs_probe(rec, h.get("mac"), ports, h["ttl"])
+        if why:
+            if not tcp_top:
+                h["services"]=sw.get("services", [])
+            probe[ip]=why
+        else:
+            h["services"]=list(rec.get("services") or [])
+            for f in ("os", "hostname"):
+                if rec.get(f): h[f]=rec[f]
+    return probe
+
+# --- batch -sV paralleli a concorrenza adattiva -----------------------------
+_SV_BATCH      = 32     # host per invocazione nmap
+_SV_PAR_START  = 2
+_SV_PAR_MAX    = 6
+_SV_TIMEOUT    = 600    # s per batch
+_SV_LOSS_MAX   = 0.05   # host del batch non più "up" oltre questa quota -> concorrenza dimezzata
+_SV_RTT_FACTOR = 2.0    # srtt mediano oltre N volte quello dello stesso host in discovery -> concorrenza dimezzata
+
+def _service_batches(job: "_Job", hosts: Dict[str,Dict[str,Any]], up_ips: List[str], iface: str, speed: str,
+                     journal: _Journal, base_rtt: Optional[Dict[str,float]] = None):
+    """
+    nmap -sV a batch in un pool: la concorrenza cresce di 1 a ogni batch pulito e si dimezza
+    con host persi o srtt in aumento (AIMD). L'aumento si misura host per host rispetto allo
+    srtt della discovery/ricognizione (`base_rtt`), non tra batch con host diversi; senza
+    riferimento (arp-scan) contano solo perdite, rc e timeout. Ogni host va nel journal
+    appena nmap lo chiude.
+    """
+    base_rtt = base_rtt or {}
+    batches = [up_ips[i:i+_SV_BATCH] for i in range(0, len(up_ips), _SV_BATCH)]
+    lock = threading.Lock()
+
+    def run_batch(b: List[str]) -> Tuple[int, List[float], int]:
+        ratio: List[float] = []
+        seen: List[str] = []
+        def on_host(x):
+            if x["state"] != "up" or x["ip"] not in hosts:
+                return
+            seen.append(x["ip"])
+            if x.get("srtt") and base_rtt.get(x["ip"]):
+                ratio.append(x["srtt"] / base_rtt[x["ip"]])
+            with lock:
+                h = hosts[x["ip"]]
+                h["services"].extend(x["services"])
+                journal.write(h)
+        args = ["/usr/bin/nmap","-sS","-sV","--top-ports","200","-T"+speed,"-n","-e",iface] + b
+        rc = _nmap_stream(args, on_host, _SV_TIMEOUT, job)
+        return rc, ratio, len(b) - len(seen)
+
+    pending = list(batches)
+    running: Dict[Any, List[str]] = {}
+    par, done = min(_SV_PAR_START, len(batches)), 0
+    with ThreadPoolExecutor(max_workers=_SV_PAR_MAX) as pool:
+        while pending or running:
+            if job.cancelled.is_set():
+                pending.clear()     # i batch in corso sono già stati terminati
+            while pending and len(running) < par:
+                b = pending.pop(0)
+                running[pool.submit(run_batch, b)] = b
+            finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for fut in finished:
+                b = running.pop(fut)
+                try:
+                    rc, ratio, lost = fut.result()
+                except Exception:
+                    rc, ratio, lost = -1, [], len(b)
+                med = sorted(ratio)[len(ratio)//2] if ratio else None
+                congested = rc != 0 or lost / len(b) > _SV_LOSS_MAX or \
+                    (med is not None and med > _SV_RTT_FACTOR)
+                par = max(1, par // 2) if congested else min(_SV_PAR_MAX, par + 1)
+                done += 1
+            job.update(phase="services", progress=30 + int(done * 50 / len(batches)),  # 30→80
+                       batches={"done": done, "total": len(batches), "running": len(running), "parallel": par})
+    job.check()
 
 def _human_ts(ts:int)->str:
     try:
@@ -174,9 +652,27 @@ def _human_ts(ts:int)->str:
     except Exception:
         return "-"
 
-def _scan_thread(scan_id:str, iface:str, cidr:str, speed:str, tcp_top:bool, os_detect:bool, note:str):
-    with _current_lock:
-        _current.update({"id":scan_id, "phase":"discovery", "progress":5, "started":int(time.time())})
+def _index_add(scan: Dict[str,Any], **extra):
+    idx=_load_index()
+    idx_scans=[s for s in idx.get("scans",[]) if s.get("id")!=scan["id"]]
+    idx_scans.append({
+        "id": scan["id"],
+        "started": scan["started"],
+        "ended": scan["ended"],
+        "target": scan["target"],
+        "iface": scan["iface"],
+        "hosts_up": len(scan["hosts"]),
+        "note": scan.get("note") or "",
+        **extra
+    })
+    idx["scans"]=sorted(idx_scans, key=lambda s: s["started"], reverse=True)
+    _save_index(idx)
+
+def _scan_thread(job: _Job):
+    spec = job.spec
+    scan_id, iface, cidr, speed = spec["id"], spec["iface"], spec["cidr"], spec["speed"]
+    tcp_top, os_detect, incremental, note = spec["tcp_top"], spec["os_detect"], spec["incremental"], spec.get("note")
+    job.update(phase="discovery", progress=5)
 
     started=int(time.time())
     scan = {
@@ -185,136 +681,129 @@ def _scan_thread(scan_id:str, iface:str, cidr:str, speed:str, tcp_top:bool, os_d
         "target": cidr,
         "started": started,
         "ended": None,
-        "options": {"speed": speed, "tcp_top": tcp_top, "os": os_detect},
+        "options": {"speed": speed, "tcp_top": tcp_top, "os": os_detect, "incremental": incremental},
         "summary": {"hosts_up": 0, "open_ports": 0, "vendors": {}},
         "hosts": [],
         "note": note or None,
     }
     _save_scan(scan)
-
-    # 1) discovery
+    _journal_path(scan_id).unlink(missing_ok=True)     # tentativo precedente interrotto
+    journal = _Journal(scan_id)
     hosts: Dict[str,Dict[str,Any]] = {}
+    try:
+        _scan_phases(job, scan, hosts, journal)
+    except _Cancelled:
+        if job.interrupted:
+            raise
+        # risultati parziali conservati, inventario non toccato (la scansione non è completa)
+        scan.update({"ended": int(time.time()), "cancelled": True,
+                     "hosts": sorted(hosts.values(), key=lambda x: _ip_key(x["ip"]))})
+        scan["summary"] = _summarize(scan["hosts"])
+        _save_scan(scan)
+        _index_add(scan, mode="incr" if incremental else "full", state="cancelled")
+        raise
+    finally:
+        journal.close()
+        _journal_path(scan_id).unlink(missing_ok=True)
+
+def _scan_phases(job: _Job, scan: Dict[str,Any], hosts: Dict[str,Dict[str,Any]], journal: _Journal):
+    spec = job.spec
+    scan_id, iface, cidr, speed = spec["id"], spec["iface"], spec["cidr"], spec["speed"]
+    tcp_top, os_detect, incremental = spec["tcp_top"], spec["os_detect"], spec["incremental"]
+
+    # 1) discovery (fallita = niente "spariti" nel diff: non si sa chi manca davvero)
     rc, out, err = _run(["/usr/sbin/arp-scan","--interface",iface,"--localnet","--plain"])
-    if rc==0 and out.strip():
+    discovery_ok = rc==0 and bool(out.strip())
+    rtt: Dict[str,float] = {}       # srtt per host fuori carico, riferimento per i batch -sV
+    if discovery_ok:
         for h in _parse_arp_scan(out):
             ip=h["ip"]; mac=h.get("mac"); vend=h.get("vendor") or _vendor_from_mac(mac)
             hosts[ip]={"ip":ip,"mac":mac,"vendor":vend,"hostname":None,"services":[]}
+            journal.write(hosts[ip])
     else:
-        args=["/usr/bin/nmap","-sn","-PR","-PE","-T"+speed,"-n","-e",iface, cidr]
-        rc2, out2, err2 = _run(args)
-        up = _parse_nmap_sn(out2 if rc2==0 else "")
-        for ip in up:
-            hosts[ip]={"ip":ip,"mac":None,"vendor":None,"hostname":None,"services":[]}
+        def on_up(x):
+            if x["state"]=="up" and x["ip"]:
+                hosts[x["ip"]]={"ip":x["ip"],"mac":x["mac"],"vendor":x["vendor"] or _vendor_from_mac(x["mac"]),
+                                "hostname":None,"services":[]}
+                if x.get("srtt"):
+                    rtt[x["ip"]]=x["srtt"]
+                journal.write(hosts[x["ip"]])
+        discovery_ok = _nmap_stream(["/usr/bin/nmap","-sn","-PR","-PE","-T"+speed,"-n","-e",iface, cidr], on_up, job=job) == 0
         rc3, neigh, _ = _run(["/usr/sbin/ip","neigh","show"])
         for line in neigh.splitlines():
             m=re.match(r"^(\d+\.\d+\.\d+\.\d+)\s+.*\s+lladdr\s+([0-9a-f:]{17})", line.strip(), re.I)
-            if m and m.group(1) in hosts:
+            if m and m.group(1) in hosts and not hosts[m.group(1)]["mac"]:
                 mac=m.group(2).lower()
                 hosts[m.group(1)]["mac"]=mac
                 hosts[m.group(1)]["vendor"]=_vendor_from_mac(mac)
 
-    with _current_lock:
-        _current.update({"phase":"discovery", "progress":25})
-
-    with _current_lock:
-        _current.update({"phase":"services", "progress":30})
+    job.check()
+    job.update(phase="services", progress=30)
 
-    # 2) services
+    # 2) services (incrementale: solo host nuovi o con MAC/porte/TTL cambiati)
     up_ips = list(hosts.keys())
-    if tcp_top and up_ips:
-        batched=[up_ips[i:i+64] for i in range(0,len(up_ips),64)]
-        for i,b in enumerate(batched, start=1):
-            args=["/usr/bin/nmap","-sS","-sV","--top-ports","200","-T"+speed,"-n","-e",iface] + b
-            rc, out, err = _run(args, timeout=600)
-            parsed = _parse_nmap_sv(out if rc==0 else "")
-            for ip, data in parsed.items():
-                if ip in hosts:
-                    hosts[ip]["services"].extend(data.get("services",[]))
-            with _current_lock:
-                pct = 30 + int(i * 50 / max(1, len(batched)))  # 30→80
-                _current.update({"phase":"services", "progress":pct})
-
-    with _current_lock:
-        _current.update({"phase":"services", "progress":80})
+    why: Dict[str,List[str]] = {ip: ["completa"] for ip in up_ips}
+    if incremental and up_ips:
+        job.update(phase="sweep", progress=25)
+        why = _incremental_plan(job, hosts, up_ips, iface, speed, tcp_top, rtt)
+    probe_ips = list(why)
+    probed = set()      # "probed" solo sugli host passati davvero da -sV/-O
+    if tcp_top and probe_ips:
+        _service_batches(job, hosts, probe_ips, iface, speed, journal, rtt)
+        probed.update(probe_ips)
+
+    job.update(phase="services", progress=80)
 
     # 3) OS detection (light)
-    if os_detect and up_ips:
-        with _current_lock:
-            _current.update({"phase":"os-detect", "progress":85})
+    if os_detect and probe_ips:
+        job.update(phase="os-detect", progress=85)
+        def on_os(x):
+            if x["ip"] in hosts and x.get("os"):
+                hosts[x["ip"]]["os"]=x["os"]
+                journal.write(hosts[x["ip"]])
         try:
-            args=["/usr/bin/nmap","-O","--osscan-guess","-T"+speed,"-n","-e",iface] + up_ips[:64]
-            rc, out, err = _run(args, timeout=600)
-            cur=None
-            for line in out.splitlines():
-                m=re.match(r"^Nmap scan report for\s+(.+)$", line.strip())
-                if m:
-                    token=m.group(1)
-                    m2=re.match(r".*\((\d+\.\d+\.\d+\.\d+)\)", token)
-                    cur = m2.group(1) if m2 else (token if re.match(r"\d+\.\d+\.\d+\.\d+$", token) else None)
-                    continue
-                if cur:
-                    m2=re.match(r"^OS details:\s+(.+)$", line.strip())
-                    if m2 and cur in hosts:
-                        hosts[cur]["os"]={"name": m2.group(1)[:120], "accuracy": None}
+            args=["/usr/bin/nmap","-O","--osscan-guess","-T"+speed,"-n","-e",iface] + probe_ips[:64]
+            _nmap_stream(args, on_os, 600, job)
+            probed.update(probe_ips[:64])
         except Exception:
             pass
-        with _current_lock:
-            _current.update({"phase":"os-detect", "progress":92})
+        job.update(phase="os-detect", progress=92)
+    for ip in probed:
+        hosts[ip]["probed"]=why[ip]
 
     # 4) finalize
-    with _current_lock:
-        _current.update({"phase":"finalize", "progress":98})
+    job.check()
+    job.update(phase="finalize", progress=98)
 
     ended=int(time.time())
     host_list=[]
-    vend_count={}
-    open_ports=0
+    # PTR in parallelo (concorrenza limitata, timeout per query, cache TTL tra scansioni)
+    try:
+        ptr = rdns.lookup_many(hosts.keys())
+    except Exception:
+        ptr = {}
     for ip,h in hosts.items():
-        rdns=None
-        try:
-            rc, out, _ = _run(["/usr/bin/dig","+short","-x",ip])
-            rdns = out.splitlines()[0].strip(".") if (rc==0 and out.strip()) else None
-        except Exception:
-            pass
-        h["hostname"]=rdns
-        if h.get("vendor"):
-            vend_count[h["vendor"]]=vend_count.get(h["vendor"],0)+1
-        open_ports += sum(1 for s in h.get("services",[]) if s.get("state")=="open")
+        h["hostname"]=ptr.get(ip) or h.get("hostname")
+        geo = ipenrich.lookup(ip)   # solo IP pubblici, db mmdb locale
+        if geo:
+            h["asn"]=geo["asn"]; h["as_org"]=geo["as_org"]; h["country"]=geo["country"]
         h["last_seen"]=ended
         host_list.append(h)
 
     scan.update({
         "ended": ended,
-        "summary": {
-            "hosts_up": len(host_list),
-            "open_ports": open_ports,
-            "vendors": vend_count
-        },
-        "hosts": sorted(host_list, key=lambda x: x["ip"])
+        "summary": _summarize(host_list),
+        "hosts": sorted(host_list, key=lambda x: _ip_key(x["ip"]))
     })
+    # inventario persistente + diff rispetto allo stato precedente
+    try:
+        scan["diff"] = hostinv.record_scan(host_list, ended, cidr if discovery_ok else None, scan_id,
+                                           ports_known=tcp_top or incremental)
+    except Exception as e:
+        scan["diff"] = {"error": str(e)}
     _save_scan(scan)
-
-    # index
-    idx=_load_index()
-    idx_scans=idx.get("scans",[])
-    idx_scans=[s for s in idx_scans if s.get("id")!=scan_id]
-    idx_scans.append({
-        "id": scan_id,
-        "started": started,
-        "ended": ended,
-        "target": cidr,
-        "iface": iface,
-        "hosts_up": len(host_list),
-        "note": note or ""
-    })
-    idx["scans"]=sorted(idx_scans, key=lambda s: s["started"], reverse=True)
-    _save_index(idx)
-
-    with _current_lock:
-        _current.update({"phase":"done", "progress":100})
-    time.sleep(0.6)
-    with _current_lock:
-        _current.clear()
+    diff_n = {k: len(v) for k, v in scan["diff"].items() if isinstance(v, list)}
+    _index_add(scan, mode="incr" if incremental else "full", diff=diff_n)
 
 # --- UI ----------------------------------------------------------------------
 def _page_head(title:str)->str:
@@ -340,13 +829,16 @@ def netmap_home():
         sid=escape(s["id"])
         note = s.get("note") or ""
         short = (note[:40] + "…") if len(note) > 40 else note
+        d = s.get("diff") or {}
+        diff_txt = f" <span class='muted tiny' title='aggiunti / rimossi / cambiati'>+{d.get('added',0)} −{d.get('removed',0)} ~{d.get('changed',0)}</span>" if d else ""
+        mode_txt = " <span class='muted tiny'>(incr.)</span>" if s.get("mode") == "incr" else ""
         rows.append(
             "<tr>"
             f"<td class='mono'>{sid}</td>"
             f"<td class='mono'>{escape(s.get('iface','-'))}</td>"
             f"<td class='mono'>{escape(s.get('target','-'))}</td>"
             f"<td class='mono'>{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(int(s.get('started',0) or 0)))}</td>"
-            f"<td class='mono'>{int(s.get('hosts_up',0) or 0)}</td>"
+            f"<td class='mono'>{int(s.get('hosts_up',0) or 0)}{mode_txt}{diff_txt}</td>"
             f"<td class='muted' title='{escape(note)}'>{escape(short) or '-'}</td>"
             f"<td>"
             f"  <a class='btn small' href='/netmap/view?id={sid}'>Apri</a>"
@@ -400,18 +892,54 @@ def netmap_home():
           <label>Opzioni</label>
           <label class='row' style='gap:8px;align-items:center'><input type='checkbox' name='tcp_top' checked/> TCP top-ports</label>
           <label class='row' style='gap:8px;align-items:center'><input type='checkbox' name='os_detect'/> OS fingerprint</label>
+          <label class='row' style='gap:8px;align-items:center' title='-sV/-O solo su host nuovi o con MAC, porte o TTL cambiati rispetto all&#39;inventario'><input type='checkbox' name='incremental'/> Incrementale</label>
         </div>
       </div>
       <label>Nota (facoltativa)</label>
       <input name='note' placeholder='es. ufficio 2° piano'/>
       <div class='row' style='gap:8px;flex-wrap:wrap;margin-top:8px'>
-        <button class='btn' type='submit'>Avvia</button>
+        <button class='btn' type='submit'>Avvia / accoda</button>
         <button class='btn secondary' type='button' onclick='pollStatus(true)'>Aggiorna stato</button>
       </div>
     </form>
-    <div id='statusBox' class='tiny muted-row' style='margin-top:8px'>
-      <div>Stato: <b id='st_phase'>-</b> — <span id='st_prog'>0%</span></div>
-      <div class='progress'><div id='st_bar' class='bar'></div></div>
+    <h3 style='margin-top:14px'>Coda</h3>
+    <div class='table'>
+      <table>
+        <thead><tr><th>ID</th><th>If</th><th>Target</th><th>Stato</th><th style='min-width:180px'>Avanzamento</th><th></th></tr></thead>
+        <tbody id='jobs'><tr><td colspan='6' class='muted'>-</td></tr></tbody>
+      </table>
+    </div>
+    <form id='qcfg' class='row tiny' style='gap:8px;align-items:end;flex-wrap:wrap;margin-top:8px' onsubmit='saveQueueCfg(event)'>
+      <div>
+        <label>Scansioni parallele per interfaccia</label>
+        <input name='per_iface' type='number' min='1' max='8' value='1' style='width:80px'/>
+      </div>
+      <div>
+        <label>Interfaccia</label>
+        <select name='iface'><option value=''>(default)</option>__OPT__</select>
+      </div>
+      <button class='btn small secondary' type='submit'>Salva</button>
+      <span class='muted' id='qcfgTxt'></span>
+    </form>
+  </div>
+
+  <div class='card'>
+    <h2>Ascolto passivo</h2>
+    <div class='tiny muted'>ARP, DHCP, mDNS/LLMNR e NetBIOS con filtro BPF nel kernel: l'inventario si aggiorna senza scansioni.</div>
+    <div class='row' style='gap:8px;align-items:end;flex-wrap:wrap;margin-top:8px'>
+      <div>
+        <label>Interfaccia</label>
+        <select id='pIface'>__OPT__</select>
+      </div>
+      <button class='btn' type='button' onclick="passive('start')">Attiva</button>
+      <button class='btn secondary' type='button' onclick="passive('stop')">Disattiva</button>
+      <span class='tiny muted'>In ascolto: <b id='pRunning' class='mono'>-</b></span>
+    </div>
+    <div class='table' style='margin-top:8px'>
+      <table>
+        <thead><tr><th>IP</th><th>MAC</th><th>Vendor</th><th>Nome</th><th>Visto</th><th>Via</th></tr></thead>
+        <tbody id='pHosts'><tr><td colspan='6' class='muted'>-</td></tr></tbody>
+      </table>
     </div>
   </div>
 
@@ -429,47 +957,71 @@ def netmap_home():
 </div>
 
 <script>
+const JOB_STATE = {queued:'in coda', running:'in corso', done:'completata', cancelled:'annullata', failed:'fallita'};
+let pollTimer = null;
 async function pollStatus(forceOnce){
+  clearTimeout(pollTimer);
+  let active = false;
   try{
-    const r = await fetch('/netmap/status'); const js = await r.json();
-    const bar = document.getElementById('st_bar');
-    const lbl = document.getElementById('st_prog');
-    const phase = document.getElementById('st_phase');
-    const form = document.getElementById('startForm');
-    const inputs = form.querySelectorAll('input, select, button[type=submit]');
-
-    if(js.active){
-      const p = Math.max(0, Math.min(100, Number(js.progress||0)));
-      phase.textContent = js.phase || '-';
-      lbl.textContent = p + '%';
-      bar.style.inset = `0 ${100-p}% 0 0`;
-      inputs.forEach(el => el.disabled = (el.type === 'button') ? false : true);
-      setTimeout(()=>pollStatus(), 1000);
-    }else{
-      phase.textContent = '-';
-      lbl.textContent = '0%';
-      bar.style.inset = '0 100% 0 0';
-      inputs.forEach(el => el.disabled = false);
-      if(forceOnce!==true){ /* noop */ }
-    }
-  }catch(e){
-    const form = document.getElementById('startForm');
-    form.querySelectorAll('input, select, button[type=submit]').forEach(el => el.disabled = false);
-  }
+    const js = await (await fetch('/netmap/status')).json();
+    const jobs = js.jobs || [];
+    active = jobs.some(j => j.state === 'queued' || j.state === 'running');
+    document.getElementById('jobs').innerHTML = jobs.map(j => {
+      const p = Math.max(0, Math.min(100, Number(j.progress||0)));
+      const b = j.batches;
+      const phase = j.state === 'running' ? (j.phase || '-') + (b && j.phase === 'services' ? ` (batch ${b.done}/${b.total}, ${b.parallel} in parallelo)` : '') : '';
+      const bar = j.state === 'running' ? `<div class='progress'><div class='bar' style='inset:0 ${100-p}% 0 0'></div></div>` : '';
+      const act = (j.state === 'queued' || j.state === 'running')
+        ? `<button class='btn small danger' onclick="cancelJob('${escHtml(j.id)}')">Annulla</button>`
+        : (j.state === 'done' || j.state === 'cancelled') ? `<a class='btn small' href='/netmap/view?id=${encodeURIComponent(j.id)}'>Apri</a>` : '';
+      return `<tr><td class='mono'>${escHtml(j.id)}</td><td class='mono'>${escHtml(j.iface)}</td><td class='mono'>${escHtml(j.cidr)}</td>`+
+        `<td title='${escHtml(j.error||'')}'>${JOB_STATE[j.state]||escHtml(j.state)}${j.attempts>1 ? ' <span class="tiny muted">(ripresa)</span>' : ''}</td>`+
+        `<td class='tiny'>${escHtml(phase)} ${j.state==='running' ? p+'%' : ''}${bar}</td><td>${act}</td></tr>`;
+    }).join('') || "<tr><td colspan='6' class='muted'>Nessuna scansione in coda.</td></tr>";
+    const cfg = js.config || {};
+    const over = Object.entries(cfg.iface||{}).map(([k,v]) => `${k}=${v}`).join(', ');
+    document.getElementById('qcfgTxt').textContent = `default ${cfg.per_iface||cfg.default||1}` + (over ? ` · ${over}` : '');
+  }catch(e){}
+  if(active) pollTimer = setTimeout(()=>pollStatus(), 1500);
 }
 pollStatus(true);
 
-setInterval(async () => {
+async function cancelJob(id){
+  if(!confirm('Annullare '+id+'?')) return;
+  await fetch('/netmap/cancel', {method:'POST', headers:{'Content-Type':'application/x-www-form-urlencoded'}, body:'id='+encodeURIComponent(id)});
+  pollStatus(true);
+}
+async function saveQueueCfg(ev){
+  ev.preventDefault();
+  const r = await fetch('/netmap/queue/config', {method:'POST', body:new FormData(ev.target)});
+  const js = await r.json().catch(()=>({}));
+  if(!r.ok || js.ok===false) alert('Errore: '+(js.error||r.status));
+  pollStatus(true);
+}
+
+function escHtml(s){
+  return String(s==null?'':s).replaceAll('&','&amp;').replaceAll('<','&lt;').replaceAll('>','&gt;');
+}
+async function loadPassive(){
   try{
-    const r = await fetch('/netmap/status'); const js = await r.json();
-    const rows = document.querySelectorAll('tbody tr');
-    rows.forEach(tr => tr.classList.remove('muted-row'));
-    if(js.active){
-      const first = document.querySelector('tbody tr');
-      if(first) first.classList.add('muted-row');
-    }
+    const js = await (await fetch('/netmap/passive')).json();
+    document.getElementById('pRunning').textContent = (js.running||[]).join(', ') || 'nessuna interfaccia';
+    const now = Date.now()/1000;
+    const rows = (js.hosts||[]).map(h => `<tr><td class='mono'>${escHtml(h.ip||'-')}</td><td class='mono'>${escHtml(h.mac||'-')}</td>`+
+      `<td>${escHtml(h.vendor||'-')}</td><td class='mono'>${escHtml(h.hostname||'-')}</td>`+
+      `<td class='tiny'>${Math.max(0, Math.round((now-(h.last_seen||0))/60))} min fa</td><td class='tiny muted'>${escHtml((h.passive||{}).via||'scan')}</td></tr>`);
+    document.getElementById('pHosts').innerHTML = rows.join('') || "<tr><td colspan='6' class='muted'>Nessun host attivo negli ultimi minuti.</td></tr>";
   }catch(e){}
-}, 3000);
+}
+async function passive(action){
+  const iface = document.getElementById('pIface').value;
+  const r = await fetch('/netmap/passive/'+action, {method:'POST', headers:{'Content-Type':'application/x-www-form-urlencoded'}, body:'iface='+encodeURIComponent(iface)});
+  const js = await r.json().catch(()=>({}));
+  if(!r.ok || js.ok===false) alert('Errore: '+(js.error||js.detail||r.status));
+  loadPassive();
+}
+loadPassive();
+setInterval(loadPassive, 10000);
 
 async function delScan(id){
   if(!confirm('Eliminare '+id+'?')) return;
@@ -493,67 +1045,60 @@ async function editNote(id){
 
 @router.get("/view", response_class=HTMLResponse)
 def netmap_view(id: str = Query(...)):
-    p=_scan_path(id)
-    if not p.exists():
+    idx = _scan_hosts(id)
+    if idx is None:
         return HTMLResponse("<h3 style='margin:2rem'>Scan non trovato</h3>", status_code=404)
-    js = json.loads(p.read_text("utf-8"))
-    hosts = js.get("hosts", []) or []
-
-    # ---- riassunti ---------------------------------------------------------
-    vend_counter = Counter((h.get("vendor") or "(Unknown)") for h in hosts)
-    vend_top = vend_counter.most_common(6)
-    vend_html = "".join(
-        f"<div class='bar'><span class='lbl'>{escape(v)}</span><span class='val'>{n}</span></div>"
-        for v, n in vend_top
-    ) or "<div class='muted'>N/A</div>"
-
-    svc_list = []
-    for h in hosts:
-        for s in h.get("services", []) or []:
-            name = s.get("name") or f"{s.get('proto','?')}/{s.get('port','?')}"
-            svc_list.append(name)
-    svc_counter = Counter(svc_list)
-    svc_top = svc_counter.most_common(6)
-    svc_html = "".join(
-        f"<div class='bar'><span class='lbl'>{escape(s)}</span><span class='val'>{n}</span></div>"
-        for s, n in svc_top
-    ) or "<div class='muted'>N/A</div>"
-
-    os_counter = Counter(((h.get("os") or {}).get("name") or "(sconosciuto)") for h in hosts if h.get("os"))
-    os_top = os_counter.most_common(6)
-    os_html = "".join(
-        f"<div class='bar'><span class='lbl'>{escape(o)}</span><span class='val'>{n}</span></div>"
-        for o, n in os_top
-    ) or "<div class='muted'>N/A</div>"
-
-    # ---- tabella host ------------------------------------------------------
-    rows=[]
-    for h in hosts:
-        ports = [f"{s.get('proto')}/{s.get('port')} {escape(s.get('name') or '')}" for s in (h.get("services") or [])]
-        ip = escape(h.get('ip','-'))
-        rows.append(
-            "<tr data-ip='{ip}'>"
-            f"<td class='mono'>{ip}</td>"
-            f"<td class='mono'>{escape(h.get('hostname') or '-')}</td>"
-            f"<td class='mono'>{escape(h.get('mac') or '-')}</td>"
-            f"<td class='mono'>{escape(h.get('vendor') or '-')}</td>"
-            f"<td class='mono'>{escape((h.get('os') or {}).get('name') or '-')}</td>"
-            f"<td>{escape(', '.join(ports) or '-')}</td>"
-            f"<td><button class='btn small' onclick=\"showHost('{ip}')\">Dettagli</button></td>"
-            "</tr>"
-        )
-    table_html = "".join(rows) or "<tr><td colspan='7' class='muted'>Nessun host rilevato.</td></tr>"
+    js = idx["scan"]
+    summ = js.get("summary") or {}
+
+    # ---- riassunti (contatori precalcolati alla chiusura) ----------------------
+    def _bars(counter: Counter) -> str:
+        return "".join(
+            f"<div class='bar'><span class='lbl'>{escape(k)}</span><span class='val'>{n}</span></div>"
+            for k, n in counter.most_common(6)
+        ) or "<div class='muted'>N/A</div>"
+    vend_counter = Counter(summ.get("vendors") or {})
+    if summ.get("vendors_unknown"):
+        vend_counter["(Unknown)"] = summ["vendors_unknown"]
+    vend_html = _bars(vend_counter)
+    svc_html  = _bars(Counter(summ.get("services") or {}))
+    os_html   = _bars(Counter(summ.get("os") or {}))
 
     # Nota / KPI
     note = js.get("note")
     note_html = f"<div class='muted tiny'>Nota: <span class='mono'>{escape(note)}</span></div>" if note else ""
-    hosts_up   = js.get("summary", {}).get("hosts_up", len(hosts))
-    open_ports = js.get("summary", {}).get("open_ports", 0)
+    hosts_up   = summ.get("hosts_up", 0)
+    open_ports = summ.get("open_ports", 0)
     vendors_num= len(vend_counter)
-    os_known   = sum(1 for h in hosts if h.get("os"))
-
-    # JSON al client (escape </)
-    data_json = json.dumps(js).replace("</", "<\\/")
+    os_known   = summ.get("os_known", 0)
+
+    # Diff rispetto all'inventario
+    diff = js.get("diff") or {}
+    def _diff_rows(items, fmt):
+        return "".join(f"<div class='bar'><span class='lbl mono'>{escape(fmt(x))}</span></div>" for x in items[:50]) or "<div class='muted'>Nessuno</div>"
+    def _chg(x):
+        parts = []
+        if x.get("ip"): parts.append(x["ip"] if not isinstance(x.get("ip"), list) else " → ".join(map(str, x["ip"])))
+        if isinstance(x.get("ports"), dict):
+            parts.append(" ".join(["+"+p for p in x["ports"].get("added",[])] + ["−"+p for p in x["ports"].get("removed",[])]))
+        if x.get("ttl"): parts.append(f"ttl {x['ttl'][0]}→{x['ttl'][1]}")
+        if x.get("os"): parts.append(f"os {x['os'][1]}")
+        return " · ".join(p for p in parts if p)
+    def _add(x):
+        return " ".join(str(v) for v in (x.get("ip"), x.get("mac"), x.get("vendor")) if v)
+    def _rem(x):
+        return _add(x) + " — visto " + _human_ts(x.get("last_seen") or 0)
+    diff_html = ""
+    if isinstance(diff.get("added"), list):
+        diff_html = (
+            "<div class='row3 full'>"
+            f"<div class='card'><h3>Nuovi ({len(diff['added'])})</h3>{_diff_rows(diff['added'], _add)}</div>"
+            f"<div class='card'><h3>Spariti ({len(diff['removed'])})</h3>{_diff_rows(diff['removed'], _rem)}</div>"
+            f"<div class='card'><h3>Cambiati ({len(diff['changed'])})</h3>{_diff_rows(diff['changed'], _chg)}</div>"
+            "</div>"
+        )
+    probed = summ.get("probed")
+    probed_html = f"<span class='pill'>🔁 Rianalizzati <b>{probed}</b>/{hosts_up}</span>" if (js.get("options") or {}).get("incremental") and probed is not None else ""
 
     html = _page_head("Net Mapper – Risultati") + """
 <style>
@@ -571,6 +1116,8 @@ def netmap_view(id: str = Query(...)):
   .lbl{overflow:hidden;text-overflow:ellipsis;white-space:nowrap;max-width:75%}
   .val{font-weight:700;opacity:.9}
   .searchbox{margin:8px 0 12px; display:flex; gap:10px; align-items:center}
+  th.sort{cursor:pointer; user-select:none}
+  th.sort.on::after{content:' ▲'} th.sort.on.desc::after{content:' ▼'}
   .modal{position:fixed; inset:0; background:rgba(0,0,0,.55); display:none; align-items:center; justify-content:center; z-index:50}
   .modal .panel{background:rgba(17,24,39,.98); border:1px solid rgba(255,255,255,.12); border-radius:16px; padding:16px; width:min(860px, 94vw)}
   .badges>span{display:inline-block; margin:3px 6px 0 0; padding:3px 8px; border-radius:999px; border:1px solid rgba(255,255,255,.12)}
@@ -590,8 +1137,10 @@ def netmap_view(id: str = Query(...)):
       <span class='pill'>🔓 Porte aperte <b>__OPEN__</b></span>
       <span class='pill'>🏷️ Vendors <b>__VNUM__</b></span>
       <span class='pill'>🧪 OS noti <b>__OSKNOWN__</b></span>
+      __PROBED__
     </div>
   </div>
+__DIFF__
 
   <div class='row3 full'>
     <div class='card'>
@@ -611,16 +1160,25 @@ def netmap_view(id: str = Query(...)):
   <div class='card full'>
     <h3>Elenco Host</h3>
     <div class='searchbox'>
-      <input id='q' placeholder='Cerca IP/hostname/MAC/vendor/porta…' style='flex:1'/>
+      <select id='qf'>
+        <option value='q'>Tutto</option><option value='ip'>IP / CIDR</option><option value='mac'>MAC</option>
+        <option value='vendor'>Vendor</option><option value='service'>Servizio / porta</option><option value='os'>OS</option>
+      </select>
+      <input id='q' placeholder='Cerca IP/hostname/MAC/vendor/porta…' style='flex:1' onkeydown="if(event.key==='Enter') doFilter()"/>
       <button class='btn small secondary' onclick='doFilter()'>Filtra</button>
       <button class='btn small' onclick='resetFilter()'>Reset</button>
+      <span id='hcount' class='muted tiny'></span>
     </div>
     <div class='table' style='margin-top:8px'>
       <table id='hostsTable'>
-        <thead><tr><th>IP</th><th>Hostname</th><th>MAC</th><th>Vendor</th><th>OS</th><th>Servizi</th><th></th></tr></thead>
-        <tbody>__TABLE__</tbody>
+        <thead><tr>
+          <th class='sort' data-k='ip'>IP</th><th class='sort' data-k='hostname'>Hostname</th><th class='sort' data-k='mac'>MAC</th>
+          <th class='sort' data-k='vendor'>Vendor</th><th class='sort' data-k='os'>OS</th><th class='sort' data-k='ports'>Servizi</th><th></th>
+        </tr></thead>
+        <tbody id='hbody'></tbody>
       </table>
     </div>
+    <div style='margin-top:8px'><button id='more' class='btn small secondary' style='display:none' onclick='loadHosts(false)'>Carica altri</button></div>
     <div class='row' style='gap:8px;margin-top:10px'>
       <a class='btn secondary' href='/netmap/export?id=__ID__&fmt=json'>Export JSON</a>
       <a class='btn secondary' href='/netmap/export?id=__ID__&fmt=csv'>Export CSV</a>
@@ -641,22 +1199,65 @@ def netmap_view(id: str = Query(...)):
 </div>
 
 <script>
-const DATA = __DATA__;
-
+const SCAN_ID = __IDJS__;
+const PAGE = 200;
+const HOSTS = {};
+let view = {sort:'ip', order:'asc', filter:{}, next:null, total:null, shown:0, busy:false};
+
+function hostRow(h){
+  const ports = (h.services||[]).map(s=>(s.proto||'?')+'/'+(s.port||'?')+' '+(s.name||'')).join(', ');
+  const geo = [h.country||'', h.asn ? ('AS'+h.asn+' '+(h.as_org||'')).trim() : ''].filter(Boolean).join(' · ');
+  const ip = escapeHtml(h.ip||'-');
+  return `<tr><td class='mono'>${ip}${geo ? ` <span class='muted tiny'>${escapeHtml(geo)}</span>` : ''}</td>`
+    + `<td class='mono'>${escapeHtml(h.hostname||'-')}</td><td class='mono'>${escapeHtml(h.mac||'-')}</td>`
+    + `<td class='mono'>${escapeHtml(h.vendor||'-')}</td><td class='mono'>${escapeHtml((h.os||{}).name||'-')}</td>`
+    + `<td>${escapeHtml(ports||'-')}</td>`
+    + `<td><button class='btn small' onclick="showHost('${ip}')">Dettagli</button></td></tr>`;
+}
+async function loadHosts(reset){
+  if(view.busy) return;
+  view.busy = true;
+  const tb = document.getElementById('hbody');
+  if(reset){ view.next = null; view.total = null; view.shown = 0; tb.innerHTML = ''; }
+  const qs = new URLSearchParams({id:SCAN_ID, sort:view.sort, order:view.order, limit:PAGE, ...view.filter});
+  if(view.next) qs.set('cursor', view.next);
+  try{
+    const r = await fetch('/netmap/hosts?'+qs);
+    const js = await r.json();
+    if(!r.ok){ tb.innerHTML = `<tr><td colspan='7' class='muted'>${escapeHtml(js.detail||js.error||'errore')}</td></tr>`; return; }
+    if(js.total !== undefined) view.total = js.total;
+    js.hosts.forEach(h=>{ HOSTS[h.ip] = h; });
+    view.shown += js.hosts.length;
+    tb.insertAdjacentHTML('beforeend', js.hosts.map(hostRow).join(''));
+    if(!view.shown) tb.innerHTML = "<tr><td colspan='7' class='muted'>Nessun host rilevato.</td></tr>";
+    view.next = js.next;
+    document.getElementById('more').style.display = js.next ? '' : 'none';
+    document.getElementById('hcount').textContent = view.total !== null ? `${view.shown} / ${view.total}` : '';
+  } finally {
+    view.busy = false;
+  }
+}
 function doFilter(){
-  const q = (document.getElementById('q').value||'').toLowerCase().trim();
-  const rows = document.querySelectorAll('#hostsTable tbody tr');
-  rows.forEach(r=>{
-    const txt = r.innerText.toLowerCase();
-    r.style.display = (!q || txt.indexOf(q)>=0) ? '' : 'none';
-  });
+  const q = (document.getElementById('q').value||'').trim();
+  view.filter = q ? {[document.getElementById('qf').value]: q} : {};
+  loadHosts(true);
 }
 function resetFilter(){
   document.getElementById('q').value='';
   doFilter();
 }
+document.querySelectorAll('th.sort').forEach(th=>th.addEventListener('click', ()=>{
+  const k = th.dataset.k;
+  view.order = (view.sort === k && view.order === 'asc') ? 'desc' : 'asc';
+  view.sort = k;
+  document.querySelectorAll('th.sort').forEach(x=>x.classList.remove('on','desc'));
+  th.classList.add('on'); if(view.order === 'desc') th.classList.add('desc');
+  loadHosts(true);
+}));
+document.querySelector("th.sort[data-k='ip']").classList.add('on');
+loadHosts(true);
 function showHost(ip){
-  const h = (DATA.hosts||[]).find(x=>x.ip===ip);
+  const h = HOSTS[ip];
   if(!h) return;
   const body = document.getElementById('m_body');
   const title = document.getElementById('m_title');
@@ -665,7 +1266,8 @@ function showHost(ip){
   const badges = (h.services||[]).map(s=>{
     const nm = s.name || '';
     const pp = (s.proto||'?') + '/' + (s.port||'?');
-    return `<span>${pp} ${escapeHtml(nm)}</span>`;
+    const ver = [s.product, s.version, s.extrainfo ? '('+s.extrainfo+')' : ''].filter(Boolean).join(' ');
+    return `<span title="${escapeHtml((s.cpe||[]).join(' '))}">${pp} ${escapeHtml(nm)}${ver ? ' <span class="muted">'+escapeHtml(ver)+'</span>' : ''}</span>`;
   }).join('');
 
   body.innerHTML = `
@@ -674,7 +1276,7 @@ function showHost(ip){
       <div><div class='tiny muted'>Hostname</div><div class='mono'>${escapeHtml(h.hostname||'-')}</div></div>
       <div><div class='tiny muted'>MAC</div><div class='mono'>${escapeHtml(h.mac||'-')}</div></div>
       <div><div class='tiny muted'>Vendor</div><div class='mono'>${escapeHtml(h.vendor||'-')}</div></div>
-      <div><div class='tiny muted'>OS</div><div class='mono'>${escapeHtml((h.os||{}).name||'-')}</div></div>
+      <div><div class='tiny muted'>OS</div><div class='mono'>${escapeHtml((h.os||{}).name||'-')}${(h.os||{}).accuracy ? ' ('+h.os.accuracy+'%)' : ''}</div></div>
     </div>
     <div style='margin-top:12px'>
       <div class='tiny muted' style='margin-bottom:6px'>Servizi</div>
@@ -706,11 +1308,12 @@ function escapeHtml(s){
         .replace("__OPEN__",  str(open_ports))
         .replace("__VNUM__",  str(vendors_num))
         .replace("__OSKNOWN__", str(os_known))
+        .replace("__PROBED__", probed_html)
+        .replace("__DIFF__", diff_html)
         .replace("__VEND__", vend_html)
         .replace("__SVC__",  svc_html)
         .replace("__OS__",   os_html)
-        .replace("__TABLE__", table_html)
-        .replace("__DATA__", data_json)
+        .replace("__IDJS__", json.dumps(id).replace("</", "<\\/"))
     )
     return HTMLResponse(html)
 
@@ -723,46 +1326,176 @@ def start(request: Request,
           speed: str = Form("T3"),
           tcp_top: Optional[str] = Form(None),
           os_detect: Optional[str] = Form(None),
+          incremental: Optional[str] = Form(None),
           note: str = Form("")):
     if _require_admin(request): return _require_admin(request)
     if iface not in _list_ifaces():
         return HTMLResponse("<script>alert('Interfaccia non valida');history.back();</script>", status_code=400)
     if not _validate_cidr(cidr):
         return HTMLResponse("<script>alert('CIDR non valida');history.back();</script>", status_code=400)
-    with _current_lock:
-        if _current:
-            return HTMLResponse("<script>alert('Scansione già in corso. Attendere la fine.');history.back();</script>", status_code=409)
-    scan_id = f"scan-{int(time.time())}"
-    t = threading.Thread(target=_scan_thread, kwargs=dict(
-        scan_id=scan_id, iface=iface, cidr=cidr, speed=speed,
-        tcp_top=bool(tcp_top), os_detect=bool(os_detect), note=note.strip()
-    ), daemon=True)
-    t.start()
+    speed = speed.lstrip("Tt")      # la UI manda "T3", nmap vuole -T3
+    if speed not in ("0","1","2","3","4","5"):
+        speed = "3"
     actor = verify_session_cookie(request) or "unknown"
+    # in coda: parte subito se l'interfaccia ha posti liberi (vedi _dispatch)
+    job = _enqueue({"iface": iface, "cidr": cidr, "speed": speed, "tcp_top": bool(tcp_top),
+                    "os_detect": bool(os_detect), "incremental": bool(incremental),
+                    "note": note.strip(), "actor": actor})
+    scan_id = job.id
     ip = request.headers.get("x-forwarded-for") or (request.client.host if request.client else None)
     log_event("netmap/start", ok=True, actor=actor, ip=ip, req_path=str(request.url),
               detail=f"id={scan_id}", extra={"iface": iface, "cidr": cidr, "speed": speed,
-                                             "tcp_top": bool(tcp_top), "os_detect": bool(os_detect)})
+                                             "tcp_top": bool(tcp_top), "os_detect": bool(os_detect),
+                                             "incremental": bool(incremental)})
     return RedirectResponse(url="/netmap", status_code=303)
 
 @router.get("/status", response_class=JSONResponse)
 def status():
-    with _current_lock:
-        if not _current:
-            return {"active": False}
-        return {"active": True, **_current}
+    jobs = _jobs_view()
+    running = [j for j in jobs if j["state"] == "running"]
+    # campi del primo job in esecuzione al livello principale: compatibilità con i client esistenti
+    return {"active": bool(running), **(running[0] if running else {}), "jobs": jobs,
+            "config": {**_queue_cfg, "default": _PER_IFACE_DEFAULT}}
+
+@router.post("/cancel", response_class=JSONResponse)
+def cancel(request: Request, id: str = Form(...)):
+    if _require_admin(request): return _require_admin(request)
+    with _jobs_lock:
+        job = _jobs.get(id)
+        if job is None or job.spec["state"] not in ("queued", "running"):
+            return JSONResponse({"ok": False, "error": "not_active"}, status_code=404)
+        was = job.spec["state"]
+        if was == "queued":
+            job.spec.update(state="cancelled", ended=int(time.time()))
+            _persist_queue()
+    if was == "running":
+        job.cancel()            # il thread salva i parziali e chiude il job
+    actor = verify_session_cookie(request) or "unknown"
+    ip = request.headers.get("x-forwarded-for") or (request.client.host if request.client else None)
+    log_event("netmap/cancel", ok=True, actor=actor, ip=ip, req_path=str(request.url), detail=f"id={id} state={was}")
+    return {"ok": True}
+
+@router.post("/queue/config", response_class=JSONResponse)
+def queue_config(request: Request, per_iface: int = Form(...), iface: str = Form("")):
+    """Scansioni parallele per interfaccia: default (iface vuota) o override per una interfaccia."""
+    if _require_admin(request): return _require_admin(request)
+    if not 1 <= per_iface <= _PER_IFACE_MAX:
+        return JSONResponse({"ok": False, "error": f"per_iface deve essere tra 1 e {_PER_IFACE_MAX}"}, status_code=400)
+    if iface and iface not in _list_ifaces():
+        return JSONResponse({"ok": False, "error": "bad_iface"}, status_code=400)
+    with _jobs_lock:
+        if iface:
+            _queue_cfg.setdefault("iface", {})[iface] = per_iface
+        else:
+            _queue_cfg["per_iface"] = per_iface
+        _persist_queue()
+    _dispatch()
+    actor = verify_session_cookie(request) or "unknown"
+    ip = request.headers.get("x-forwarded-for") or (request.client.host if request.client else None)
+    log_event("netmap/queue_config", ok=True, actor=actor, ip=ip, req_path=str(request.url),
+              detail=f"iface={iface or '*'} per_iface={per_iface}")
+    return {"ok": True, "config": _queue_cfg}
+
+@router.on_event("startup")
+def _queue_start():
+    try:
+        _recover_queue()
+    except Exception:
+        pass
+
+@router.on_event("shutdown")
+def _queue_stop():
+    # i job in corso restano "running" nel file: al prossimo avvio tornano in coda
+    with _jobs_lock:
+        running = [j for j in _jobs.values() if j.spec["state"] == "running"]
+    for j in running:
+        j.cancel(interrupt=True)
 
 @router.get("/list", response_class=JSONResponse)
 def list_scans():
     idx=_load_index()
     return idx
 
+@router.get("/inventory", response_class=JSONResponse)
+def inventory(active: int = Query(0, ge=0)):
+    """Inventario host; `active` (s) limita agli host visti in quella finestra."""
+    since = int(time.time()) - active if active else 0
+    hosts = [r for r in hostinv.load()["hosts"].values() if not since or (r.get("last_seen") or 0) >= since]
+    return {"hosts": sorted(hosts, key=lambda r: r.get("ip") or "")}
+
+@router.get("/passive", response_class=JSONResponse)
+def passive_status():
+    since = int(time.time()) - _ACTIVE_WINDOW
+    hosts = [r for r in hostinv.load()["hosts"].values() if (r.get("last_seen") or 0) >= since and not r.get("gone")]
+    return {"running": _passive_running(), "window": _ACTIVE_WINDOW,
+            "hosts": sorted(hosts, key=lambda r: r.get("last_seen") or 0, reverse=True)[:200]}
+
+@router.post("/passive/{action}", response_class=JSONResponse)
+def passive_action(request: Request, action: str, iface: str = Form(...)):
+    if _require_admin(request): return _require_admin(request)
+    if action not in ("start", "stop"):
+        return JSONResponse({"ok": False, "error": "bad_action"}, status_code=400)
+    if iface not in _list_ifaces():
+        return JSONResponse({"ok": False, "error": "bad_iface"}, status_code=400)
+    unit = _PASSIVE_UNIT.format(iface)
+    # enable/disable: l'ascolto sopravvive al riavvio
+    ok = _svc("enable", "--now", unit) if action == "start" else _svc("disable", "--now", unit)
+    actor = verify_session_cookie(request) or "unknown"
+    ip = request.headers.get("x-forwarded-for") or (request.client.host if request.client else None)
+    log_event(f"netmap/passive_{action}", ok=ok, actor=actor, ip=ip, req_path=str(request.url), detail=f"iface={iface}")
+    return {"ok": ok, "running": _passive_running()}
+
 @router.get("/result", response_class=JSONResponse)
 def result(id: str = Query(...)):
-    p=_scan_path(id)
-    if not p.exists():
+    js = _load_scan(id)
+    if js is None:
         return JSONResponse({"error":"not_found"}, status_code=404)
-    return json.loads(p.read_text("utf-8"))
+    return js
+
+@router.get("/hosts", response_class=JSONResponse)
+def hosts_page(id: str = Query(...), ip: str = Query(""), mac: str = Query(""), vendor: str = Query(""),
+               service: str = Query(""), os: str = Query(""), q: str = Query(""),
+               sort: str = Query("ip"), order: str = Query("asc"),
+               limit: int = Query(100, ge=1, le=_HOSTS_PAGE_MAX), cursor: str = Query("")):
+    """
+    Host di una scansione a pagine. Filtri (in AND): ip = prefisso o CIDR, mac = frammento
+    (separatori ignorati), vendor/os = sottostringa, service = porta, proto/porta o nome/prodotto,
+    q = testo libero. `next` è il cursore della pagina successiva; `total` solo sulla prima.
+    """
+    if sort not in _SORT_KEYS or order not in ("asc", "desc"):
+        return JSONResponse({"error": "bad_sort"}, status_code=400)
+    idx = _scan_hosts(id)
+    if idx is None:
+        return JSONResponse({"error": "not_found"}, status_code=404)
+    try:
+        ok = _host_filter(ip.strip(), mac, vendor, service, os, q)
+        after = _cursor_dec(cursor, sort, order) if cursor else None
+    except ValueError as e:
+        return JSONResponse({"error": "bad_request", "detail": str(e)}, status_code=400)
+    keys, pos = _sorted(idx, sort)
+    hosts, text, svc = idx["hosts"], idx["text"], idx["svc"]
+    filtered = any((ip.strip(), mac, vendor, service, os, q))
+    if order == "asc":
+        start = bisect.bisect_right(keys, after) if after is not None else 0
+        rng = range(start, len(keys))
+    else:
+        start = bisect.bisect_left(keys, after) if after is not None else len(keys)
+        rng = range(start - 1, -1, -1)
+    page, last = [], None
+    more = False
+    for r in rng:
+        i = pos[r]
+        if filtered and not ok(hosts[i], text[i], svc[i]):
+            continue
+        if len(page) == limit:
+            more = True
+            break
+        page.append(hosts[i])
+        last = keys[r]
+    out: Dict[str,Any] = {"hosts": page, "next": _cursor_enc(sort, order, last) if more else None}
+    if not cursor:
+        out["total"] = sum(1 for i in range(len(hosts)) if ok(hosts[i], text[i], svc[i])) if filtered else len(hosts)
+    return out
 
 @router.get("/export")
 def export(id: str = Query(...), fmt: str = Query("json")):
@@ -819,6 +1552,7 @@ def delete(request: Request, id: str = Form(...)):
         return {"status":"error","detail":"not_found"}
     try:
         p.unlink()
+        _journal_path(id).unlink(missing_ok=True)
     except Exception as e:
         return {"status":"error","detail":str(e)}
     idx=_load_index()
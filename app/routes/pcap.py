@@ -8,6 +8,7 @@ from stat import S_IMODE
 
 router = APIRouter(prefix="/pcap", tags=["pcap"])
 from util.audit import log_event
+from util import ipenrich
 
 CAP_DIR   = Path("/var/lib/netprobe/pcap")
 META_FILE = CAP_DIR / "captures.json"
@@ -457,11 +458,15 @@ function humanBytes(b){
 }
 function humanInt(x){ if(x==null) return "-"; return Number(x).toLocaleString(); }
 
+function escHtml(s){
+  return String(s ?? "").replace(/[&<>"']/g, c=>({"&":"&amp;","<":"&lt;",">":"&gt;",'"':"&quot;","'":"&#39;"}[c]));
+}
+// le celle sono testo (escapato); {html:...} per celle già costruite
 function tbl(title, headers, rows){
   let h = "<div class='card'><h3>"+title+"</h3><div class='table'><table><thead><tr>";
   for(const th of headers) h += "<th>"+th+"</th>";
   h += "</tr></thead><tbody>";
-  for(const row of rows) h += "<tr>"+row.map(x=>"<td>"+x+"</td>").join("")+"</tr>";
+  for(const row of rows) h += "<tr>"+row.map(x=>"<td>"+(x && x.html !== undefined ? x.html : escHtml(x))+"</td>").join("")+"</tr>";
   h += "</tbody></table></div></div>";
   return h;
 }
@@ -482,7 +487,18 @@ async function loadSummary(){
 
   html += "<div class='grid2'>";
   if(js.phs?.rows?.length){ html += tbl("Protocol hierarchy", ["Layer/Proto","Percent","Pkts"], js.phs.rows); }
-  if(js.endpoints?.rows?.length){ html += tbl("Top endpoints", ["Endpoint","Pkts","Bytes","TxPkts","TxBytes","RxPkts","RxBytes"], js.endpoints.rows.slice(0,10)); }
+  if(js.endpoints?.rows?.length){
+    const geo = js.endpoints_geo || {};
+    const rows = js.endpoints.rows.slice(0,10).map(r=>{
+      const g = geo[r[0]];
+      if(!g) return r;
+      const tag = [g.country, g.asn ? "AS"+g.asn+" "+(g.as_org||"") : ""].filter(Boolean).join(" · ");
+      return [{html: escHtml(r[0])+" <span class='muted'>"+escHtml(tag)+"</span>"}].concat(r.slice(1));
+    });
+    html += tbl("Top endpoints", ["Endpoint","Pkts","Bytes","TxPkts","TxBytes","RxPkts","RxBytes"], rows);
+  }
+  if(js.endpoints_by?.asn?.length){ html += tbl("Endpoint per ASN", ["ASN","Pkts"], js.endpoints_by.asn.map(x=>[x[0], String(x[1])])); }
+  if(js.endpoints_by?.country?.length){ html += tbl("Endpoint per paese", ["Paese","Pkts"], js.endpoints_by.country.map(x=>[x[0], String(x[1])])); }
   if(js.conversations?.rows?.length){ html += tbl("Top conversations", ["Peers","Pkts","Bytes","Rel Start","Duration"], js.conversations.rows.slice(0,10)); }
   if(js.ports?.length){ html += tbl("Top porte (TCP/UDP)", ["Porta","Count"], js.ports.map(x=>[x.port, String(x.count)])); }
   if(js.dns?.length){ html += tbl("Top DNS queries", ["Name","Count"], js.dns.map(x=>[x.value, String(x.count)])); }
@@ -691,6 +707,12 @@ def summary(file: str = Query(...)):
         ["/usr/bin/tshark","-r",str(path),"-Y","tls.handshake.extensions_server_name","-T","fields","-e","tls.handshake.extensions_server_name"],
         "tls.handshake.extensions_server_name", 10)
     data["ports"] = _top_ports(path, 10)
+    if ipenrich.available():
+        rows = data["endpoints"].get("rows") or []
+        data["endpoints_geo"] = ipenrich.annotate(r[0] for r in rows if r)
+        pkts = [(r[0], int(r[1])) for r in rows if len(r) > 1 and r[1].isdigit()]
+        data["endpoints_by"] = {"asn": ipenrich.aggregate(pkts, "asn", 10),
+                                "country": ipenrich.aggregate(pkts, "country", 10)}
     return JSONResponse(data)   # <-- QUI
 
 @router.get("/settings", response_class=HTMLResponse)
@@ -1,12 +1,17 @@
 from fastapi import APIRouter, Form, Query, Request
-from fastapi.responses import HTMLResponse, JSONResponse, FileResponse, RedirectResponse, PlainTextResponse
+from fastapi.responses import HTMLResponse, JSONResponse, FileResponse, RedirectResponse, PlainTextResponse, StreamingResponse
 from html import escape
 from pathlib import Path
-import os, json, time, subprocess, re, signal, shlex, tempfile, shutil
+import os, json, time, subprocess, re, signal, shlex, tempfile, shutil, threading, base64
 from typing import List, Dict, Any, Tuple, Optional
 from routes.auth import verify_session_cookie, _load_users
 from statistics import mean
 
+try:
+    import numpy as np
+except Exception:  # numpy opzionale: fallback scalare in _mos_batch
+    np = None  # type: ignore
+
 router = APIRouter(prefix="/voip", tags=["voip"])
 
 # --- paths ---
@@ -14,6 +19,9 @@ VOIP_DIR   = Path("/var/lib/netprobe/voip")
 CAP_DIR    = VOIP_DIR / "captures"
 META_FILE  = VOIP_DIR / "captures.json"   # {"captures":[{file,iface,start_ts,duration_s,pid,filter}]}
 INDEX_FILE = VOIP_DIR / "index.json"      # {"calls":{callid:{...}}, "rtp_streams":[], "built_ts":..., "built_src": "..."}
+CDR_FILE   = VOIP_DIR / "cdr.jsonl"       # una chiamata "slim" per riga (senza msgs), ordinate per (last_ts, callid) desc
+CDR_META   = VOIP_DIR / "cdr.meta.json"   # {"built_ts","built_src","calls","errors","rtp_streams"}
+SUMMARY_FMT = "summary-{}.json"           # per cattura: {"key":[file,size,mtime_ns], ...statistiche SIP/DNS...}
 CFG_PATH   = Path("/etc/netprobe/voip.json")
 
 # --- default config ---
@@ -67,6 +75,53 @@ def _save_index(idx:dict):
     tmp = INDEX_FILE.with_suffix(".tmp")
     tmp.write_text(json.dumps(idx, indent=2), encoding="utf-8")
     os.replace(tmp, INDEX_FILE)
+    _save_cdr(idx)
+
+# --- CDR: vista slim dell'indice, leggibile riga per riga ---
+CDR_FIELDS = ["callid","first_ts","last_ts","from","to","status","final_code","method","duration_s","msgs","codecs"]
+
+def _cdr_row(o:dict) -> dict:
+    return {
+        "callid": o.get("callid"), "first_ts": o.get("first_ts"), "last_ts": o.get("last_ts"),
+        "from": o.get("from"), "to": o.get("to"), "status": o.get("status"),
+        "final_code": o.get("final_code"), "method": o.get("method"), "duration_s": o.get("duration_s"),
+        "msgs": len(o.get("msgs") or []),
+        "codecs": sorted({m.get("codec") for m in (o.get("media") or []) if m.get("codec")}),
+    }
+
+def _cdr_key(r:dict) -> Tuple[float,str]:
+    return (float(r.get("last_ts") or 0), str(r.get("callid") or ""))
+
+def _save_cdr(idx:dict):
+    rows = sorted((_cdr_row(o) for o in idx.get("calls",{}).values()), key=_cdr_key, reverse=True)
+    tmp = CDR_FILE.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        for r in rows:
+            f.write(json.dumps(r, ensure_ascii=False, separators=(",",":")) + "\n")
+    os.replace(tmp, CDR_FILE)
+    meta = {"built_ts": idx.get("built_ts",0), "built_src": idx.get("built_src"), "calls": len(rows),
+            "errors": sum(1 for r in rows if (r.get("final_code") or 0) >= 400),
+            "rtp_streams": len(idx.get("rtp_streams",[]))}
+    tmp = CDR_META.with_suffix(".tmp")
+    tmp.write_text(json.dumps(meta, indent=2), encoding="utf-8")
+    os.replace(tmp, CDR_META)
+
+def _load_cdr_meta() -> Dict[str,Any]:
+    if not CDR_FILE.exists() or not CDR_META.exists():
+        _save_cdr(_load_index())  # indice costruito prima dell'introduzione del CDR
+    try:
+        return json.loads(CDR_META.read_text("utf-8"))
+    except Exception:
+        return {"built_ts":0, "built_src":None, "calls":0, "errors":0, "rtp_streams":0}
+
+def _iter_cdr():
+    try:
+        with open(CDR_FILE, "r", encoding="utf-8") as f:
+            for ln in f:
+                try: yield json.loads(ln)
+                except Exception: continue
+    except FileNotFoundError:
+        return
 
 def _alive(pid:int|None)->bool:
     if not pid: return False
@@ -113,6 +168,7 @@ def _apply_quota_rotation(quota_bytes:int) -> int:
         try:
             sz=p.stat().st_size
             p.unlink()
+            _summary_drop(p.name)
             removed+=1
             total-=sz
             meta["captures"]= [c for c in meta.get("captures",[]) if c.get("file")!=p.name]
@@ -224,27 +280,120 @@ def _tshark_rtp_streams(path:Path) -> List[List[str]]:
             rows.append(cols)
     return rows
 
-def _extract_sdp_media_from_sip_pcap(sip_pcap:Path) -> List[Dict[str,Any]]:
-    cmd=["/usr/bin/tshark","-r",str(sip_pcap),"-Y","sdp","-T","fields",
-         "-e","sdp.media.port","-e","sdp.media.proto","-e","sdp.connection_info.address","-e","sdp.fmtp.payload_type","-e","sdp.media.attr"]
-    rc, out, err = _run(cmd, timeout=60)
-    medias=[]
-    if rc!=0: return medias
-    for line in out.splitlines():
+def _tshark_iter(cmd:List[str]):
+    """Righe stdout di tshark man mano che arrivano; il processo viene terminato se il consumer si ferma."""
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, bufsize=1)
+    try:
+        for line in proc.stdout:  # type: ignore
+            yield line.rstrip("\n")
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+
+def _rtp_frame_index(path:Path) -> Dict[str,Dict[str,Any]]:
+    """
+    Indice frame per stream RTP (chiave SSRC): primo/ultimo frame, pacchetti, PT,
+    primo timestamp RTP e span (unwrapped), ora di cattura del primo pacchetto.
+    """
+    cmd=["/usr/bin/tshark","-r",str(path),"-o","rtp.heuristic_rtp:TRUE","-Y","rtp","-T","fields",
+         "-e","frame.number","-e","frame.time_epoch","-e","rtp.ssrc","-e","rtp.p_type","-e","rtp.timestamp",
+         "-e","ip.src","-e","udp.srcport","-e","ip.dst","-e","udp.dstport"]
+    out: Dict[str,Dict[str,Any]] = {}
+    for line in _tshark_iter(cmd):
         parts=line.split("\t")
-        port = parts[0].split(",")[0] if parts and parts[0] else ""
-        proto= parts[1] if len(parts)>1 else ""
-        addr = parts[2] if len(parts)>2 else ""
-        payload = parts[3] if len(parts)>3 else ""
-        attr = parts[4] if len(parts)>4 else ""
+        if len(parts)<9 or not parts[2]: continue
         try:
-            p=int(port)
-            if 1<=p<=65535 and ("RTP" in proto.upper() or "UDP" in proto.upper()):
-                medias.append({"ip":addr or None, "port":p, "proto":proto, "payload":payload, "attr":attr})
+            fno=int(parts[0]); t=float(parts[1]); ts=int(parts[4])
+            ssrc=parts[2].split(",")[0].lower()
         except Exception:
             continue
+        e=out.get(ssrc)
+        if e is None:
+            out[ssrc]={"ssrc":ssrc, "first_frame":fno, "last_frame":fno, "pkts":1, "pt":parts[3].split(",")[0],
+                       "ts_first":ts, "ts_span":0, "first_time":t,
+                       "ip_src":parts[5], "port_src":int(parts[6] or 0), "ip_dst":parts[7], "port_dst":int(parts[8] or 0)}
+            continue
+        e["last_frame"]=fno; e["pkts"]+=1
+        rel=(ts - e["ts_first"]) & 0xFFFFFFFF
+        if rel < 0x80000000 and rel > e["ts_span"]:
+            e["ts_span"]=rel
+    return out
+
+_STATIC_PT = {"0":"PCMU", "8":"PCMA", "9":"G722", "18":"G729"}
+
+def _codec_norm(name:Optional[str]) -> Optional[str]:
+    """Nome codec canonico (PCMU/PCMA/G722/G729/OPUS/...) da rtpmap, nome tshark o PT statico."""
+    raw=(name or "").strip().split("/")[0]
+    if raw in _STATIC_PT: return _STATIC_PT[raw]
+    c=re.sub(r"[^A-Z0-9]", "", raw.upper())
+    if not c or c.startswith("RTPTYPE") or c.isdigit(): return None
+    if "PCMU" in c or "G711U" in c or "ULAW" in c or c=="G711": return "PCMU"
+    if "PCMA" in c or "G711A" in c or "ALAW" in c: return "PCMA"
+    for k in ("G729","G722","OPUS"):
+        if k in c: return k
+    return c
+
+def _parse_sdp_fields(parts:List[str]) -> List[Dict[str,Any]]:
+    """
+    parts = [m-lines, connection addr, attr fields, attr values] (aggregator '|').
+    Ritorna un media per ogni m= audio/video con PT offerti e codec da rtpmap.
+    """
+    mlines = [x for x in (parts[0] if parts else "").split("|") if x.strip()]
+    addr   = ((parts[1] if len(parts)>1 else "").split("|") or [""])[0]
+    fields = (parts[2] if len(parts)>2 else "").split("|")
+    values = (parts[3] if len(parts)>3 else "").split("|")
+    rtpmap: Dict[str,str] = {}
+    for f,v in zip(fields, values):
+        if f.strip().lower()!="rtpmap": continue
+        m=re.match(r"\s*(\d+)\s+([^/\s]+)", v)
+        if m: rtpmap[m.group(1)] = m.group(2)
+    medias=[]
+    for ml in mlines:
+        tok=ml.split()
+        if len(tok)<3: continue
+        try: port=int(tok[1].split("/")[0])
+        except Exception: continue
+        if not (1<=port<=65535): continue
+        proto=tok[2]
+        if "RTP" not in proto.upper() and "UDP" not in proto.upper(): continue
+        pts=tok[3:]
+        codec=None
+        for pt in pts:
+            name = rtpmap.get(pt) or _STATIC_PT.get(pt)
+            if name and name.lower() not in ("telephone-event","cn","red","ulpfec"):
+                codec=_codec_norm(name); break
+        medias.append({"ip":addr or None, "port":port, "proto":proto, "media":tok[0],
+                       "payload":",".join(pts), "pts":pts,
+                       "rtpmap":{pt:rtpmap[pt] for pt in pts if pt in rtpmap}, "codec":codec})
     return medias
 
+def _tshark_sdp_rows(path:Path, timeout:int=60) -> List[List[str]]:
+    cmd=["/usr/bin/tshark","-r",str(path),"-Y","sdp","-T","fields","-E","aggregator=|",
+         "-e","sip.Call-ID","-e","sdp.media","-e","sdp.connection_info.address",
+         "-e","sdp.media_attribute.field","-e","sdp.media_attribute.value"]
+    rc, out, err = _run(cmd, timeout=timeout)
+    if rc!=0: return []
+    return [line.split("\t") for line in out.splitlines()]
+
+def _extract_sdp_media_from_sip_pcap(sip_pcap:Path) -> List[Dict[str,Any]]:
+    medias=[]
+    for parts in _tshark_sdp_rows(sip_pcap):
+        medias.extend(_parse_sdp_fields(parts[1:]))
+    return medias
+
+def _sdp_media_by_call(path:Path) -> Dict[str,List[Dict[str,Any]]]:
+    """Media SDP (ip/porta/codec negoziato) raggruppati per Call-ID, senza duplicati."""
+    out: Dict[str,List[Dict[str,Any]]] = {}
+    for parts in _tshark_sdp_rows(path, timeout=90):
+        callid=(parts[0] if parts else "").split("|")[0]
+        if not callid: continue
+        lst=out.setdefault(callid, [])
+        for m in _parse_sdp_fields(parts[1:]):
+            if not any(x["ip"]==m["ip"] and x["port"]==m["port"] for x in lst):
+                lst.append(m)
+    return out
+
 def _build_index_from_pcap(path:Path, privacy_mask=False)->dict:
     calls={}
     rows=_tshark_sip_rows(path)
@@ -289,8 +438,28 @@ def _build_index_from_pcap(path:Path, privacy_mask=False)->dict:
             if o.get("to_full"):
                 o["to_full"]=re.sub(r'(?<=:)[^@>]+(?=@)', lambda m:_mask_user(m.group(0)).split("@")[0], o["to_full"])    # type: ignore
 
+    sdp_media=[]
+    for callid, medias in _sdp_media_by_call(path).items():
+        if callid in calls:
+            calls[callid]["media"]=[{k:m[k] for k in ("ip","port","media","pts","codec")} for m in medias]
+        for m in medias:
+            sdp_media.append({"callid":callid, "ip":m["ip"], "port":m["port"], "pts":m["pts"],
+                              "rtpmap":m["rtpmap"], "codec":m["codec"]})
+
+    for ent in _rtp_frame_index(path).values():
+        for m in sdp_media:
+            if m["callid"] not in calls: continue
+            if m["port"] not in (ent["port_dst"], ent["port_src"]): continue
+            if m["ip"] and m["ip"] not in (ent["ip_dst"], ent["ip_src"]): continue
+            ent["codec"] = _codec_norm((m.get("rtpmap") or {}).get(ent["pt"])) or _codec_norm(ent["pt"])
+            lst=calls[m["callid"]].setdefault("rtp", [])
+            if not any(x["ssrc"]==ent["ssrc"] for x in lst):
+                lst.append(ent)
+            break
+
     rtp_rows = _tshark_rtp_streams(path)
-    idx={"calls":calls, "rtp_streams":rtp_rows, "built_ts":int(time.time()), "built_src": path.name}
+    idx={"calls":calls, "rtp_streams":rtp_rows, "sdp_media":sdp_media,
+         "built_ts":int(time.time()), "built_src": path.name}
     return idx
 
 # --------------- Auth / Permessi ---------------
@@ -353,6 +522,7 @@ def voip_page():
             f"  <a class='btn small' href='/voip/ladder?callid={cid}'>Ladder</a>"
             f"  <a class='btn small secondary' href='/voip/pcap?callid={cid}'>PCAP (SIP+RTP)</a>"
             f"  <a class='btn small secondary' href='/voip/rtp/stats?callid={cid}'>RTP Stats</a>"
+            f"  <a class='btn small secondary' href='/voip/rtp/audio?callid={cid}&mix=both'>Audio</a>"
             f"</td>"
             "</tr>"
         )
@@ -529,11 +699,10 @@ async function pollStatus(){
 
 async function refreshIndex(){
   try{
-    const r = await fetch('/voip/calls'); const js = await r.json();
-    const calls = js.calls||[];
-    const errors = calls.filter(c=> (c.final_code||0)>=400).length;
-    const errpct = calls.length? Math.round(errors/calls.length*100):0;
-    document.getElementById('k_calls').textContent = String(calls.length);
+    const r = await fetch('/voip/cdr?limit=1&fields=callid'); const js = await r.json();
+    const total = js.total_calls||0;
+    const errpct = total? Math.round((js.errors||0)/total*100):0;
+    document.getElementById('k_calls').textContent = String(total);
     document.getElementById('k_err').textContent   = errpct+'%';
     document.getElementById('k_rtp').textContent   = String(js.rtp_streams||0);
     document.getElementById('k_built').textContent = tsHuman(js.built_ts||0);
@@ -699,6 +868,8 @@ def delete_capture(request: Request, file: str = Form(...)):
         return {"status":"error","detail":"file non trovato"}
     try:
         p.unlink()
+        _kpi_invalidate(p.name)
+        _summary_drop(p.name)
         meta=_load_meta()
         meta["captures"] = [c for c in meta.get("captures",[]) if c.get("file")!=p.name]
         _save_meta(meta)
@@ -724,6 +895,11 @@ def reindex(file: Optional[str] = Query(None)):
         return {"ok": False, "error":"no_pcap"}
     idx=_build_index_from_pcap(p, privacy_mask=bool(cfg.get("privacy_mask_user", False)))
     _save_index(idx)
+    _kpi_invalidate(p.name)  # il binding codec dipende dall'SDP indicizzato
+    try:
+        _summary_cached(p)  # riepilogo SIP accanto all'indice
+    except Exception:
+        pass
     return {"ok": True, "calls": len(idx.get("calls",{})), "rtp_streams": len(idx.get("rtp_streams",[])), "src_file": p.name}
 
 @router.get("/calls", response_class=JSONResponse)
@@ -747,6 +923,112 @@ def call_detail(callid:str):
         return JSONResponse({"error":"not_found"}, status_code=404)
     return o
 
+# --------------- CDR: paginazione, filtri, export ---------------
+def _cdr_cursor_enc(r:dict) -> str:
+    ts, cid = _cdr_key(r)
+    return base64.urlsafe_b64encode(json.dumps([ts, cid]).encode()).decode().rstrip("=")
+
+def _cdr_cursor_dec(c:str) -> Optional[Tuple[float,str]]:
+    try:
+        ts, cid = json.loads(base64.urlsafe_b64decode(c + "=" * (-len(c) % 4)))
+        return (float(ts), str(cid))
+    except Exception:
+        return None
+
+def _cdr_match(r:dict, status:Optional[str], code:Optional[str], frm:Optional[str], to:Optional[str],
+               since:Optional[float], until:Optional[float]) -> bool:
+    if status and r.get("status") != status: return False
+    if code:
+        fc = r.get("final_code")
+        if re.fullmatch(r"[1-6]xx", code.lower()):
+            if not fc or int(fc)//100 != int(code[0]): return False
+        elif str(fc or "") != code: return False
+    if frm and frm.lower() not in str(r.get("from") or "").lower(): return False
+    if to  and to.lower()  not in str(r.get("to") or "").lower(): return False
+    if since is not None and float(r.get("last_ts") or 0) < since: return False
+    if until is not None and float(r.get("first_ts") or 0) > until: return False
+    return True
+
+def _cdr_select(status, code, frm, to, since, until, cursor:Optional[str]=None):
+    """Righe CDR filtrate, in ordine (last_ts, callid) desc, a partire dal cursore (escluso)."""
+    after = _cdr_cursor_dec(cursor) if cursor else None
+    for r in _iter_cdr():
+        if after is not None and _cdr_key(r) >= after:
+            continue
+        if _cdr_match(r, status, code, frm, to, since, until):
+            yield r
+
+def _cdr_bad_filter(status:Optional[str], code:Optional[str]) -> Optional[JSONResponse]:
+    if status and status not in ("ok","failed","in-progress"):
+        return JSONResponse({"error":"bad_status"}, status_code=400)
+    if code and not re.fullmatch(r"[1-6]([0-9][0-9]|xx)", code.lower()):
+        return JSONResponse({"error":"bad_code"}, status_code=400)
+    return None
+
+def _cdr_fields(fields:Optional[str]) -> List[str]:
+    sel = [f.strip() for f in (fields or "").split(",") if f.strip() in CDR_FIELDS]
+    return sel or CDR_FIELDS
+
+@router.get("/cdr", response_class=JSONResponse)
+def cdr(limit:int=Query(50, ge=1, le=1000),
+        cursor:Optional[str]=Query(None),
+        status:Optional[str]=Query(None),
+        code:Optional[str]=Query(None),
+        frm:Optional[str]=Query(None, alias="from", max_length=128),
+        to:Optional[str]=Query(None, max_length=128),
+        since:Optional[float]=Query(None), until:Optional[float]=Query(None),
+        fields:Optional[str]=Query(None)):
+    bad = _cdr_bad_filter(status, code)
+    if bad: return bad
+    meta = _load_cdr_meta()
+    cols = _cdr_fields(fields)
+    items, last, more = [], None, False
+    for r in _cdr_select(status, code, frm, to, since, until, cursor):
+        if len(items) >= limit:
+            more = True; break
+        items.append({k: r.get(k) for k in cols}); last = r
+    return {
+        "items": items,
+        "next_cursor": _cdr_cursor_enc(last) if (more and last) else None,
+        "total_calls": meta.get("calls",0), "errors": meta.get("errors",0),
+        "rtp_streams": meta.get("rtp_streams",0),
+        "built_ts": meta.get("built_ts",0), "built_src": meta.get("built_src"),
+    }
+
+@router.get("/cdr/export")
+def cdr_export(fmt:str=Query("csv"),
+               status:Optional[str]=Query(None),
+               code:Optional[str]=Query(None),
+               frm:Optional[str]=Query(None, alias="from", max_length=128),
+               to:Optional[str]=Query(None, max_length=128),
+               since:Optional[float]=Query(None), until:Optional[float]=Query(None),
+               fields:Optional[str]=Query(None)):
+    bad = _cdr_bad_filter(status, code)
+    if bad: return bad
+    if fmt not in ("csv","ndjson"):
+        return JSONResponse({"error":"bad_format"}, status_code=400)
+    _load_cdr_meta()
+    cols = _cdr_fields(fields)
+    rows = _cdr_select(status, code, frm, to, since, until)
+
+    if fmt == "ndjson":
+        def gen():
+            for r in rows:
+                yield json.dumps({k: r.get(k) for k in cols}, ensure_ascii=False) + "\n"
+        return StreamingResponse(gen(), media_type="application/x-ndjson",
+                                 headers={"Content-Disposition": 'attachment; filename="voip_cdr.jsonl"'})
+
+    def esc(v:Any) -> str:
+        if isinstance(v, list): v = ";".join(str(x) for x in v)
+        s = "" if v is None else str(v)
+        return '"' + s.replace('"','""') + '"'
+    def gen_csv():
+        yield ",".join(cols) + "\n"
+        for r in rows:
+            yield ",".join(esc(r.get(k)) for k in cols) + "\n"
+    return StreamingResponse(gen_csv(), media_type="text/csv",
+                             headers={"Content-Disposition": 'attachment; filename="voip_cdr.csv"'})
+
 # --------------- Export PCAP per-call (SIP + RTP) ---------------
 def _export_sip_for_call(src_pcap:Path, callid:str, out_sip:Path) -> bool:
     display_filter = f'sip.Call-ID == "{callid}"'
@@ -838,52 +1120,188 @@ def ladder(callid:str = Query(...)):
     return HTMLResponse(html)
 
 # --------------- RTP Stats + MOS ---------------
+# E-model semplificato (ITU-T G.107) con impairment per codec:
+#   codec -> (Ie, Bpl). Valori G.113 App. I dove disponibili (G.711 con PLC, G.729A);
+#   G.722 e Opus sono riportati su scala narrowband (nessun bonus wideband).
+_CODEC_IMPAIRMENT: Dict[str, Tuple[float,float]] = {
+    "PCMU": (0.0, 25.1),
+    "PCMA": (0.0, 25.1),
+    "G722": (0.0, 20.0),
+    "G729": (11.0, 19.0),
+    "OPUS": (0.0, 30.0),
+}
+_CODEC_FALLBACK = (5.0, 19.0)
+_R0 = 93.2
+
+def _mos_batch(loss_pct, jitter_ms, codecs) -> Tuple[List[float], List[float]]:
+    """
+    R-factor e MOS per tutti gli stream (o stream x intervalli) in un colpo solo.
+    loss_pct/jitter_ms/codecs: sequenze della stessa lunghezza (o array NumPy della stessa forma).
+    """
+    imp = [_CODEC_IMPAIRMENT.get((c or "").upper(), _CODEC_FALLBACK) for c in codecs]
+    if np is not None:
+        ppl = np.clip(np.asarray(loss_pct, dtype=float), 0.0, 100.0)
+        j   = np.maximum(np.asarray(jitter_ms, dtype=float), 0.0)
+        ie  = np.asarray([x[0] for x in imp], dtype=float).reshape(ppl.shape)
+        bpl = np.asarray([x[1] for x in imp], dtype=float).reshape(ppl.shape)
+        ie_eff = ie + (95.0 - ie) * ppl / (ppl + bpl)
+        r = _R0 - np.minimum(20.0, j / 10.0) - ie_eff
+        mos = np.where(r <= 0, 1.0, np.where(r >= 100, 4.5,
+                       1.0 + 0.035*r + r*(r-60.0)*(100.0-r)*7e-6))
+        mos = np.clip(mos, 1.0, 4.5)
+        return np.round(r, 1).tolist(), np.round(mos, 2).tolist()
+    rs, ms = [], []
+    for ppl, j, (ie, bpl) in zip(loss_pct, jitter_ms, imp):
+        ppl = min(100.0, max(0.0, float(ppl))); j = max(0.0, float(j))
+        r = _R0 - min(20.0, j/10.0) - (ie + (95.0 - ie) * ppl / (ppl + bpl))
+        if r <= 0: mos = 1.0
+        elif r >= 100: mos = 4.5
+        else: mos = 1.0 + 0.035*r + r*(r-60.0)*(100.0-r)*7e-6
+        rs.append(round(r, 1)); ms.append(round(max(1.0, min(4.5, mos)), 2))
+    return rs, ms
+
 def _estimate_mos(loss_pct:float, jitter_ms:float, codec:str="PCMU") -> float:
-    codec=codec.upper()
-    Ie = 0.0 if codec in ("PCMU","PCMA","G711","G.711") else 5.0
-    Bpl = 10.0 if Ie==0 else 19.0
-    Ppl = max(0.0, float(loss_pct))
-    Ie_eff = Ie + (95.0 - Ie) * (Ppl) / (Ppl / Bpl + 95.0)
-    J = max(0.0, float(jitter_ms))
-    Id = min(20.0, J/10.0)
-    R = 94.2 - Id - Ie_eff
-    if R < 0: mos = 1.0
-    elif R > 100: mos = 4.5
-    else:
-        mos = 1.0 + 0.035*R + R*(R-60.0)*(100.0-R)*7e-6
-    return round(max(1.0, min(4.5, mos)), 2)
+    return _mos_batch([loss_pct], [jitter_ms], [codec])[1][0]
+
+_RTP_ROW_RE = re.compile(
+    r"^\s*(?:[\d.]+\s+[\d.]+\s+)?(\S+)\s+(\d+)\s+(\S+)\s+(\d+)\s+(0x[0-9a-fA-F]+)\s+(.+?)\s+(\d+)\s+(-?\d+)\s+\(([-\d.]+)%\)\s+(.*)$")
+
+def _parse_rtp_stream_row(line:str) -> Dict[str,Any]:
+    """Riga di 'tshark -z rtp,streams' (formato a colonne, con fallback al vecchio formato key=val)."""
+    m=_RTP_ROW_RE.match(line.replace("\t"," "))
+    if m:
+        nums=[float(x) for x in re.findall(r"-?\d+(?:\.\d+)?", m.group(10))]
+        # 6 valori: min/mean/max delta + min/mean/max jitter; 3 valori: max delta, max jitter, mean jitter
+        jit = nums[4] if len(nums)>=6 else (nums[2] if len(nums)>=3 else 0.0)
+        return {
+            "ssrc": m.group(5), "ip_src": m.group(1), "port_src": int(m.group(2)),
+            "ip_dst": m.group(3), "port_dst": int(m.group(4)),
+            "pkt": int(m.group(7)), "lost": max(0, int(m.group(8))),
+            "jitter_ms": jit, "kbps": None, "pt": m.group(6).strip(),
+        }
+    def grab(pattern:str, default:Optional[float]=None) -> Optional[float]:
+        m=re.search(pattern, line)
+        try:
+            return float(m.group(1)) if m else default
+        except Exception:
+            return default
+    mf=re.search(r"From (\S+):(\d+)", line); mt=re.search(r"To (\S+):(\d+)", line)
+    ms=re.search(r"SSRC=([0-9a-fxA-F]+)", line); mp=re.search(r"PT=([0-9]+)", line)
+    return {
+        "ssrc": ms.group(1) if ms else None,
+        "ip_src": mf.group(1) if mf else None,
+        "port_src": int(mf.group(2)) if mf else None,
+        "ip_dst": mt.group(1) if mt else None,
+        "port_dst": int(mt.group(2)) if mt else None,
+        "pkt": grab(r"Packets:(\d+)", 0) or 0,
+        "lost": grab(r"Lost:(\d+)", 0) or 0,
+        "jitter_ms": grab(r"Jitter:\s*([0-9.]+)") or 0.0,
+        "kbps": grab(r"Bandwidth:\s*([0-9.]+)\s*kbits/s") or None,
+        "pt": mp.group(1) if mp else None,
+    }
 
-def _rtp_stats_from_pcap(path:Path) -> List[Dict[str,Any]]:
+def _stream_codec(s:Dict[str,Any], media:List[Dict[str,Any]], default:str) -> str:
+    """Codec dello stream: rtpmap SDP del PT -> nome payload tshark/PT statico -> codec SDP negoziato -> default."""
+    pt = str(s.get("pt") or "")
+    sdp_codec = None
+    for m in media:
+        if m.get("port") not in (s.get("port_dst"), s.get("port_src")): continue
+        if m.get("ip") and m["ip"] not in (s.get("ip_dst"), s.get("ip_src")): continue
+        name = (m.get("rtpmap") or {}).get(pt)
+        if _codec_norm(name): return _codec_norm(name)  # type: ignore
+        sdp_codec = sdp_codec or m.get("codec")
+    return _codec_norm(pt) or _codec_norm(sdp_codec) or _codec_norm(default) or "PCMU"
+
+# MOS per intervallo: perdita (numeri di sequenza attesi vs ricevuti) e jitter RFC 3550
+# (valore a fine intervallo) ogni _MOS_INTERVAL secondi per SSRC, da un solo passaggio tshark.
+_MOS_INTERVAL = 5
+_CODEC_CLOCK = {"OPUS": 48000}     # clock RTP; G.711/G.722/G.729: 8000
+
+def _rtp_intervals(path:Path, clocks:Dict[str,int]) -> Dict[str,List[Tuple[float,float,float]]]:
+    """ssrc -> [(inizio intervallo s dal primo pacchetto, loss %, jitter ms)] per gli SSRC in `clocks`."""
+    cmd=["/usr/bin/tshark","-r",str(path),"-o","rtp.heuristic_rtp:TRUE","-Y","rtp","-T","fields",
+         "-e","frame.time_epoch","-e","rtp.ssrc","-e","rtp.seq","-e","rtp.timestamp"]
+    st: Dict[str,Dict[str,Any]] = {}
+    out: Dict[str,List[Tuple[float,float,float]]] = {}
+
+    def close(e:Dict[str,Any], ssrc:str):
+        expected = e["max"] - e["base"]
+        loss = max(0, expected - e["n"]) * 100.0 / expected if expected > 0 else 0.0
+        out.setdefault(ssrc, []).append((e["k"] * _MOS_INTERVAL, round(loss, 2), round(e["j"] * 1000.0 / e["clock"], 2)))
+        e["base"], e["n"] = e["max"], 0
+
+    for line in _tshark_iter(cmd):
+        parts=line.split("\t")
+        if len(parts)<4: continue
+        try:
+            t=float(parts[0]); ssrc=parts[1].split(",")[0].lower()
+            seq=int(parts[2].split(",")[0]); ts=int(parts[3].split(",")[0])
+        except Exception:
+            continue
+        if ssrc not in clocks: continue
+        e=st.get(ssrc)
+        if e is None:
+            st[ssrc]={"t0":t, "k":0, "ext":seq, "base":seq-1, "max":seq, "n":1, "j":0.0,
+                      "prev":(t, ts), "clock":clocks[ssrc]}
+            continue
+        k=int((t - e["t0"]) // _MOS_INTERVAL)
+        if k != e["k"]:
+            close(e, ssrc)
+            e["k"]=k
+        # sequenza estesa (wrap a 16 bit), pacchetti fuori ordine contati ma senza spostare il massimo
+        d=(seq - e["ext"]) & 0xFFFF
+        ext = e["ext"] + d if d < 0x8000 else e["ext"] - (0x10000 - d)
+        if ext > e["max"]:
+            e["max"]=ext
+        e["ext"]=max(e["ext"], ext); e["n"]+=1
+        pt, pts = e["prev"]
+        dts=((ts - pts + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+        D=(t - pt) * e["clock"] - dts
+        e["j"] += (abs(D) - e["j"]) / 16.0
+        e["prev"]=(t, ts)
+    for ssrc, e in st.items():
+        close(e, ssrc)
+    return out
+
+def _rtp_stats_from_pcap(path:Path, media:Optional[List[Dict[str,Any]]]=None) -> List[Dict[str,Any]]:
     rows=_tshark_rtp_streams(path)
+    if media is None:
+        idx=_load_index()
+        media = idx.get("sdp_media", []) if idx.get("built_src")==path.name else _extract_sdp_media_from_sip_pcap(path)
+    default = _load_cfg().get("default_codec","PCMU")
     stats=[]
     for r in rows:
-        line='\t'.join(r)
-        def grab(pattern:str, default:Optional[float]=None) -> Optional[float]:
-            m=re.search(pattern, line)
-            try:
-                return float(m.group(1)) if m else default
-            except Exception:
-                return default
-        s={
-            "ssrc": re.search(r"SSRC=([0-9a-fxA-F]+)", line).group(1) if re.search(r"SSRC=([0-9a-fxA-F]+)", line) else None,
-            "ip_src": re.search(r"From (\S+):(\d+)", line).group(1) if re.search(r"From (\S+):(\d+)", line) else None,
-            "port_src": int(re.search(r"From (\S+):(\d+)", line).group(2)) if re.search(r"From (\S+):(\d+)", line) else None,
-            "ip_dst": re.search(r"To (\S+):(\d+)", line).group(1) if re.search(r"To (\S+):(\d+)", line) else None,
-            "port_dst": int(re.search(r"To (\S+):(\d+)", line).group(2)) if re.search(r"To (\S+):(\d+)", line) else None,
-            "pkt": grab(r"Packets:(\d+)", 0) or 0,
-            "lost": grab(r"Lost:(\d+)", 0) or 0,
-            "jitter_ms": grab(r"Jitter:\s*([0-9.]+)") or 0.0,
-            "kbps": grab(r"Bandwidth:\s*([0-9.]+)\s*kbits/s") or None,
-            "pt": re.search(r"PT=([0-9]+)", line).group(1) if re.search(r"PT=([0-9]+)", line) else None,
-        }
+        s=_parse_rtp_stream_row('\t'.join(r))
         try:
             loss_pct = (float(s["lost"]) / max(1.0, float(s["pkt"])))*100.0
         except Exception:
             loss_pct = 0.0
-        codec = _load_cfg().get("default_codec","PCMU")
         s["loss_pct"]= round(loss_pct, 2)
-        s["mos"] = _estimate_mos(loss_pct, float(s["jitter_ms"] or 0.0), codec)
+        s["codec"] = _stream_codec(s, media or [], default)
         stats.append(s)
+    if stats:
+        clocks = {str(s["ssrc"]).lower(): _CODEC_CLOCK.get(s["codec"], 8000) for s in stats if s.get("ssrc")}
+        try:
+            iv = _rtp_intervals(path, clocks)
+        except Exception:
+            iv = {}
+        # stream e stream x intervalli in un'unica chiamata vettoriale
+        loss = [s["loss_pct"] for s in stats]
+        jit = [float(s["jitter_ms"] or 0.0) for s in stats]
+        codecs = [s["codec"] for s in stats]
+        for s in stats:
+            for _, l, j in iv.get(str(s.get("ssrc")).lower(), []):
+                loss.append(l); jit.append(j); codecs.append(s["codec"])
+        rs, ms = _mos_batch(loss, jit, codecs)
+        i = len(stats)
+        for s, r, m in zip(stats, rs, ms):
+            s["r_factor"] = r
+            s["mos"] = m
+            s["intervals"] = []
+            for t, l, j in iv.get(str(s.get("ssrc")).lower(), []):
+                s["intervals"].append({"t": t, "loss_pct": l, "jitter_ms": j, "r_factor": rs[i], "mos": ms[i]})
+                i += 1
+            s["mos_min"] = min((x["mos"] for x in s["intervals"]), default=m)
     return stats
 
 @router.get("/rtp/stats", response_class=JSONResponse)
@@ -896,32 +1314,287 @@ def rtp_stats(callid:str = Query(...), file: Optional[str] = Query(None)):
         out_path = td/"call.pcapng"
         if not _export_call_with_rtp(p, callid, out_path):
             return JSONResponse({"error":"export_failed"}, status_code=500)
-        stats = _rtp_stats_from_pcap(out_path)
+        stats = _rtp_stats_from_pcap(out_path, media=_extract_sdp_media_from_sip_pcap(out_path))
         return {"callid":callid, "src_file": p.name, "rtp_streams": stats}
 
+# --------------- Audio G.711 -> WAV ---------------
+def _ulaw_to_lin(b:int) -> int:
+    b = ~b & 0xFF
+    t = (((b & 0x0F) << 3) + 0x84) << ((b & 0x70) >> 4)
+    return (0x84 - t) if (b & 0x80) else (t - 0x84)
+
+def _alaw_to_lin(b:int) -> int:
+    b ^= 0x55
+    t = (b & 0x0F) << 4
+    seg = (b & 0x70) >> 4
+    if seg == 0: t += 8
+    elif seg == 1: t += 0x108
+    else: t = (t + 0x108) << (seg - 1)
+    return t if (b & 0x80) else -t
+
+# byte G.711 -> campione PCM 16 bit little-endian (2 byte)
+_G711_PCM = {
+    "PCMU": [_ulaw_to_lin(i).to_bytes(2, "little", signed=True) for i in range(256)],
+    "PCMA": [_alaw_to_lin(i).to_bytes(2, "little", signed=True) for i in range(256)],
+}
+_G711_RATE = 8000
+_RTP_REORDER = 64       # pacchetti trattenuti per il riordino per sequence number
+_PCM_CHUNK = 1600       # campioni per blocco in uscita (200 ms)
+
+def _wav_header(samples:int, channels:int) -> bytes:
+    data = samples * channels * 2
+    return (b"RIFF" + (36 + data).to_bytes(4, "little") + b"WAVE" +
+            b"fmt " + (16).to_bytes(4, "little") + (1).to_bytes(2, "little") + channels.to_bytes(2, "little") +
+            _G711_RATE.to_bytes(4, "little") + (_G711_RATE * channels * 2).to_bytes(4, "little") +
+            (channels * 2).to_bytes(2, "little") + (16).to_bytes(2, "little") +
+            b"data" + data.to_bytes(4, "little"))
+
+def _rtp_samples(ent:Dict[str,Any]) -> int:
+    return int(ent.get("ts_span") or 0) + 160  # ultimo pacchetto: 20 ms tipici
+
+def _rtp_pcm(src:Path, ent:Dict[str,Any]):
+    """
+    PCM 16 bit dello stream, letto solo fino all'ultimo frame indicizzato (tshark -c).
+    Riordino per sequence number (esteso) su una finestra limitata; buchi -> silenzio
+    posizionato sul timestamp RTP; esattamente _rtp_samples(ent) campioni.
+    """
+    import heapq
+    table = _G711_PCM[ent["codec"]]
+    total = _rtp_samples(ent)
+    base = int(ent["ts_first"])
+    dfilter = f"rtp.ssrc == {ent['ssrc']} && frame.number >= {int(ent['first_frame'])}"
+    cmd=["/usr/bin/tshark","-r",str(src),"-c",str(int(ent["last_frame"])),"-o","rtp.heuristic_rtp:TRUE",
+         "-Y",dfilter,"-T","fields","-e","rtp.seq","-e","rtp.timestamp","-e","rtp.payload"]
+    heap: List[Tuple[int,int,bytes]] = []
+    pos = 0
+    last_seq: Optional[int] = None
+    ext = 0
+
+    def emit(rel:int, payload:bytes):
+        nonlocal pos
+        out = []
+        if rel > pos:
+            gap = min(rel, total) - pos
+            out.append(b"\x00\x00" * gap); pos += gap
+        elif rel < pos:
+            payload = payload[pos - rel:]  # duplicato/sovrapposto
+        payload = payload[:max(0, total - pos)]
+        if payload:
+            out.append(b"".join(map(table.__getitem__, payload))); pos += len(payload)
+        return b"".join(out)
+
+    for line in _tshark_iter(cmd):
+        parts=line.split("\t")
+        if len(parts)<3 or not parts[2]: continue
+        try:
+            seq=int(parts[0]); ts=int(parts[1]); payload=bytes.fromhex(parts[2].replace(":",""))
+        except Exception:
+            continue
+        if last_seq is None:
+            last_seq = seq
+        d = (seq - last_seq) & 0xFFFF
+        if d < 0x8000:
+            ext += d; last_seq = seq; key = ext
+        else:
+            key = ext - (0x10000 - d)
+        rel = (ts - base) & 0xFFFFFFFF
+        if rel >= 0x80000000: continue  # precedente all'inizio indicizzato
+        heapq.heappush(heap, (key, rel, payload))
+        if len(heap) > _RTP_REORDER:
+            _, r, pl = heapq.heappop(heap)
+            chunk = emit(r, pl)
+            if chunk: yield chunk
+    while heap:
+        _, r, pl = heapq.heappop(heap)
+        chunk = emit(r, pl)
+        if chunk: yield chunk
+    if pos < total:
+        yield b"\x00\x00" * (total - pos)
+
+class _PcmReader:
+    """Legge blocchi di n campioni da un generatore PCM, con silenzio iniziale (offset) e finale."""
+    def __init__(self, gen, lead:int):
+        self._gen = gen; self._buf = b"\x00\x00" * max(0, lead)
+    def read(self, n:int) -> bytes:
+        need = n * 2
+        while len(self._buf) < need and self._gen is not None:
+            try: self._buf += next(self._gen)
+            except StopIteration: self._gen = None
+        out, self._buf = self._buf[:need], self._buf[need:]
+        return out + b"\x00" * (need - len(out))
+    def close(self):
+        if self._gen is not None: self._gen.close()
+
+def _interleave(left:bytes, right:bytes) -> bytes:
+    # campioni s16 L/R alternati, con assegnazioni a passo invece di un loop per campione
+    out = bytearray(len(left) * 2)
+    out[0::4] = left[0::2]; out[1::4] = left[1::2]
+    out[2::4] = right[0::2]; out[3::4] = right[1::2]
+    return bytes(out)
+
+@router.get("/rtp/audio")
+def rtp_audio(callid:str = Query(...), ssrc:Optional[str] = Query(None), mix:str = Query("mono")):
+    idx=_load_index()
+    o=idx.get("calls",{}).get(callid)
+    src=_pcap_path_from_param(idx.get("built_src"))
+    if not o or not src:
+        return JSONResponse({"error":"not_found", "detail":"Call-ID non indicizzata (ricostruisci indice?)"}, status_code=404)
+    legs=[e for e in (o.get("rtp") or []) if e.get("codec") in _G711_PCM]
+    if not legs:
+        return JSONResponse({"error":"no_g711", "detail":"Nessuno stream G.711 (PCMU/PCMA) per la chiamata"}, status_code=415)
+    if ssrc:
+        want=ssrc.lower() if ssrc.lower().startswith("0x") else f"0x{int(ssrc):08x}" if ssrc.isdigit() else ssrc.lower()
+        first=next((e for e in legs if e["ssrc"]==want), None)
+        if not first:
+            return JSONResponse({"error":"ssrc_not_found"}, status_code=404)
+    else:
+        first=legs[0]
+    safe = re.sub(r'[^A-Za-z0-9_.-]','_', f"{callid}_{first['ssrc']}")
+
+    other=None
+    if mix=="both":
+        other=next((e for e in legs if e is not first and e["ip_src"]==first["ip_dst"] and e["port_src"]==first["port_dst"]), None) \
+              or next((e for e in legs if e is not first), None)
+    if other is None:
+        total=_rtp_samples(first)
+        def gen():
+            yield _wav_header(total, 1)
+            yield from _rtp_pcm(src, first)
+        return StreamingResponse(gen(), media_type="audio/wav",
+                                 headers={"Content-Disposition": f'attachment; filename="call_{safe}.wav"'})
+
+    # stereo: sinistra = first, destra = other, allineati sull'ora di cattura del primo pacchetto
+    t0=min(first["first_time"], other["first_time"])
+    off_l=int(round((first["first_time"]-t0)*_G711_RATE)); off_r=int(round((other["first_time"]-t0)*_G711_RATE))
+    total=max(off_l+_rtp_samples(first), off_r+_rtp_samples(other))
+    def gen_stereo():
+        left=_PcmReader(_rtp_pcm(src, first), off_l); right=_PcmReader(_rtp_pcm(src, other), off_r)
+        try:
+            yield _wav_header(total, 2)
+            done=0
+            while done < total:
+                n=min(_PCM_CHUNK, total-done)
+                yield _interleave(left.read(n), right.read(n))
+                done+=n
+        finally:
+            left.close(); right.close()
+    return StreamingResponse(gen_stereo(), media_type="audio/wav",
+                             headers={"Content-Disposition": f'attachment; filename="call_{safe}_both.wav"'})
+
 # --------------- Riepiloghi rapidi (SIP/RTP/DNS in pcap) ---------------
+_STORM_MIN_PER_MIN = 30     # REGISTER/min minimi per considerare una tempesta
+_STORM_FACTOR      = 5.0    # ... e almeno N volte la mediana dei minuti attivi
+_SUMMARY_DNS_MAX   = 2000
+
+def _sip_traffic_stats(path:Path) -> Dict[str,Any]:
+    """
+    Un solo passaggio tshark (in streaming) per metodi, status code, DNS NAPTR/SRV, endpoint
+    e serie per minuto (INVITE/REGISTER, rapporti 4xx/5xx, tempeste di REGISTER).
+    """
+    from collections import Counter
+    cmd=["/usr/bin/tshark","-r",str(path),"-Y","sip || (dns.flags.response == 1 && (dns.naptr || dns.srv.name))",
+         "-T","fields","-e","frame.time_epoch","-e","ip.src","-e","ip.dst","-e","sip.Method","-e","sip.Status-Code",
+         "-e","dns.qry.name","-e","dns.srv.name","-e","dns.naptr.service"]
+    methods, codes, ep = Counter(), Counter(), Counter()
+    dns: List[List[str]] = []
+    buckets: Dict[int, List[int]] = {}   # minuto -> [invite, register, risposte, 4xx, 5xx]
+    for line in _tshark_iter(cmd):
+        parts=line.split("\t")
+        while len(parts) < 8: parts.append("")
+        t, src, dst, meth, code = parts[0], parts[1], parts[2], parts[3], parts[4]
+        if parts[5] or parts[6] or parts[7]:
+            if len(dns) < _SUMMARY_DNS_MAX: dns.append(parts[5:8])
+            if not (meth or code): continue
+        try: minute=int(float(t))//60*60
+        except Exception: continue
+        b=buckets.setdefault(minute, [0,0,0,0,0])
+        if src: ep[src]+=1
+        if dst: ep[dst]+=1
+        for m in meth.split(","):
+            if not m: continue
+            methods[m]+=1
+            if m=="INVITE": b[0]+=1
+            elif m=="REGISTER": b[1]+=1
+        for c in code.split(","):
+            if not c.isdigit(): continue
+            codes[c]+=1; b[2]+=1
+            if 400<=int(c)<500: b[3]+=1
+            elif int(c)>=500: b[4]+=1
+
+    series={"t":[], "invite":[], "register":[], "responses":[], "err4xx_ratio":[], "err5xx_ratio":[]}
+    if buckets:
+        t0, t1 = min(buckets), max(buckets)
+        for minute in range(t0, t1+60, 60):
+            inv, reg, resp, e4, e5 = buckets.get(minute, [0,0,0,0,0])
+            series["t"].append(minute); series["invite"].append(inv); series["register"].append(reg)
+            series["responses"].append(resp)
+            series["err4xx_ratio"].append(round(e4/resp, 3) if resp else 0.0)
+            series["err5xx_ratio"].append(round(e5/resp, 3) if resp else 0.0)
+    def bursts(key:str) -> List[Dict[str,Any]]:
+        active=sorted(x for x in series[key] if x)
+        median=active[len(active)//2] if active else 0
+        thr=max(_STORM_MIN_PER_MIN, median*_STORM_FACTOR)
+        return [{"t":t, key:v, "baseline":median} for t,v in zip(series["t"], series[key]) if v>=thr]
+    return {
+        "src_file": path.name,
+        "methods": methods.most_common(20),
+        "status": codes.most_common(20),
+        "dns": dns,
+        "top_endpoints": ep.most_common(20),
+        "series": series,
+        "register_storms": bursts("register"),
+        "invite_bursts": bursts("invite"),
+        "built_ts": int(time.time()),
+    }
+
+# Cache su disco per cattura, accanto all'indice; come per i KPI le richieste
+# concorrenti sullo stesso file attendono un unico passaggio tshark, gli altri file no.
+_summary_lock = threading.Lock()
+_summary_busy: Dict[str, threading.Lock] = {}   # file -> lock calcolo in corso
+
+def _summary_path(name:str) -> Path:
+    return VOIP_DIR / SUMMARY_FMT.format(name)
+
+def _summary_key(p:Path) -> List[Any]:
+    st=p.stat()
+    return [p.name, st.st_size, st.st_mtime_ns]
+
+def _summary_load(path:Path, key:List[Any]) -> Optional[Dict[str,Any]]:
+    try:
+        data=json.loads(path.read_text("utf-8"))
+        return data if data.get("key")==key else None
+    except Exception:
+        return None
+
+def _summary_cached(p:Path) -> Dict[str,Any]:
+    path=_summary_path(p.name)
+    hit=_summary_load(path, _summary_key(p))
+    if hit: return hit
+    with _summary_lock:
+        busy=_summary_busy.setdefault(p.name, threading.Lock())
+    with busy:
+        key=_summary_key(p)
+        hit=_summary_load(path, key)
+        if hit: return hit
+        data={"key":key, **_sip_traffic_stats(p)}
+        tmp=path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(data), encoding="utf-8")
+        os.replace(tmp, path)
+        with _summary_lock:
+            _summary_busy.pop(p.name, None)
+        return data
+
+def _summary_drop(name:str):
+    try: _summary_path(name).unlink()
+    except FileNotFoundError: pass
+
 @router.get("/summary", response_class=JSONResponse)
 def quick_summary(limit:int=Query(200, ge=10, le=2000), file: Optional[str] = Query(None)):
     p = _pcap_path_from_param(file) if file else _latest_pcap()
     if not p or not p.exists():
         return JSONResponse({"error":"no_pcap"}, status_code=404)
-    rc1, out1, _ = _run(["/usr/bin/tshark","-r",str(p),"-Y","sip.Method","-T","fields","-e","sip.Method"], timeout=90)
-    rc2, out2, _ = _run(["/usr/bin/tshark","-r",str(p),"-Y","sip.Status-Code","-T","fields","-e","sip.Status-Code"], timeout=90)
-    rc3, out3, _ = _run(["/usr/bin/tshark","-r",str(p),"-Y","dns.flags.response == 1 && (dns.naptr || dns.srv.name)","-T","fields","-e","dns.qry.name","-e","dns.srv.name","-e","dns.naptr.service"], timeout=90)
-    from collections import Counter
-    mcount = Counter(out1.split()) if rc1==0 else Counter()
-    scount = Counter(out2.split()) if rc2==0 else Counter()
-    dns_rows = [l.split("\t") for l in out3.splitlines()] if rc3==0 else []
-    rc4, out4, _ = _run(["/usr/bin/tshark","-r",str(p),"-Y","sip","-T","fields","-e","ip.src","-e","ip.dst"], timeout=90)
-    pairs = [tuple(x.split("\t")) for x in out4.splitlines() if "\t" in x] if rc4==0 else []
-    ep = Counter([a for a,_ in pairs] + [b for _,b in pairs])
-    return {
-        "src_file": p.name,
-        "methods": mcount.most_common(20),
-        "status": scount.most_common(20),
-        "dns": dns_rows[:limit],
-        "top_endpoints": ep.most_common(20)
-    }
+    data = _summary_cached(p)
+    return {**{k:v for k,v in data.items() if k!="key"}, "dns": data.get("dns", [])[:limit]}
 
 # --------------- Settings page ---------------
 @router.get("/settings", response_class=HTMLResponse)
@@ -1002,29 +1675,76 @@ def settings_save(sip_ports: str = Form(...),
     cfg["privacy_mask_user"]= bool(privacy_mask_user)
     cfg["ui_poll_ms"]= max(250, min(int(ui_poll_ms), 20000))
     _save_cfg(cfg)
+    _kpi_invalidate()
     return RedirectResponse(url="/voip/settings", status_code=303)
 
-@router.get("/kpi", response_class=JSONResponse)
-def kpi_latest_capture(file: Optional[str] = Query(None)):
-    p = _pcap_path_from_param(file) if file else _latest_pcap()
-    if not p or not p.exists():
-        return {"error": "no_pcap"}
+# --------------- KPI (cache per file) ---------------
+# Il polling della UI chiama /voip/kpi ogni ui_poll_ms: il risultato viene
+# memorizzato per (file, size, mtime) e ricalcolato solo se la cattura cambia.
+# Le richieste concorrenti sullo stesso file attendono un unico calcolo.
+_kpi_lock = threading.Lock()
+_kpi_cache: Dict[str, Tuple[Tuple[int,int], Dict[str,Any]]] = {}   # file -> ((size, mtime_ns), out)
+_kpi_busy: Dict[str, threading.Lock] = {}                          # file -> lock calcolo in corso
+_KPI_CACHE_MAX = 16
+
+def _kpi_compute(p:Path) -> Dict[str,Any]:
     stats = _rtp_stats_from_pcap(p)
     if not stats:
         return {
             "src_file": p.name,
             "rtp_streams": 0,
-            "mos_avg": None, "jitter_avg_ms": None, "loss_avg_pct": None, "kbps_avg": None,
+            "mos_avg": None, "mos_min": None, "jitter_avg_ms": None, "loss_avg_pct": None, "kbps_avg": None,
             "streams": []
         }
     def vals(k): return [float(s[k]) for s in stats if s.get(k) is not None]
-    out = {
+    return {
         "src_file": p.name,
         "rtp_streams": len(stats),
         "mos_avg": round(mean(vals("mos")), 2) if vals("mos") else None,
+        "mos_min": min(vals("mos_min")) if vals("mos_min") else None,
         "jitter_avg_ms": round(mean(vals("jitter_ms")), 2) if vals("jitter_ms") else None,
         "loss_avg_pct": round(mean(vals("loss_pct")), 2) if vals("loss_pct") else None,
         "kbps_avg": round(mean(vals("kbps")), 2) if vals("kbps") else None,
         "streams": stats
     }
-    return out
+
+def _kpi_cached(p:Path) -> Dict[str,Any]:
+    def key() -> Tuple[int,int]:
+        st = p.stat()
+        return (st.st_size, st.st_mtime_ns)
+
+    with _kpi_lock:
+        hit = _kpi_cache.get(p.name)
+        if hit and hit[0] == key():
+            return hit[1]
+        busy = _kpi_busy.setdefault(p.name, threading.Lock())
+
+    with busy:
+        # un'altra richiesta può aver già calcolato mentre si attendeva
+        k = key()
+        with _kpi_lock:
+            hit = _kpi_cache.get(p.name)
+            if hit and hit[0] == k:
+                return hit[1]
+        out = _kpi_compute(p)
+        with _kpi_lock:
+            _kpi_cache[p.name] = (k, out)
+            while len(_kpi_cache) > _KPI_CACHE_MAX:
+                _kpi_cache.pop(next(iter(_kpi_cache)))
+            _kpi_busy.pop(p.name, None)
+        return out
+
+def _kpi_invalidate(name:Optional[str]=None):
+    with _kpi_lock:
+        if name: _kpi_cache.pop(name, None)
+        else: _kpi_cache.clear()
+
+@router.get("/kpi", response_class=JSONResponse)
+def kpi_latest_capture(file: Optional[str] = Query(None)):
+    p = _pcap_path_from_param(file) if file else _latest_pcap()
+    if not p or not p.exists():
+        return {"error": "no_pcap"}
+    try:
+        return _kpi_cached(p)
+    except FileNotFoundError:
+        return {"error": "no_pcap"}
@@ -0,0 +1,180 @@
+# /opt/netprobe/app/util/flowanomaly.py
+"""
+Rilevatore di anomalie sul traffico dai rollup da 1 minuto (util/flowrollup.py).
+
+Per ogni chiave seguita (host sorgente: bytes e flussi, porta dst: bytes, più due serie
+globali: flussi e porte distinte al minuto) tiene una baseline EWMA di media e varianza:
+4 numeri per chiave, al massimo MAX_TRACKED chiavi (si scartano le più piccole/vecchie).
+Ogni minuto chiuso produce z-score; i picchi diventano "finding" in FINDINGS_FILE, che
+alertd legge (check_flow_anomaly) passando per il solito invio con throttle.
+
+Tipi: egress (picco bytes di un host), port (picco su una porta), scan (molti flussi da un
+host insieme a tante porte distinte), heavy (host nuovo che parte già con volumi alti).
+"""
+from __future__ import annotations
+import os, json, math, time
+from typing import Dict, List, Optional
+
+from util import flowrollup, nfcapd
+
+STATE_FILE    = flowrollup.ROLLUP_DIR / "anomaly.state.json"
+FINDINGS_FILE = flowrollup.ROLLUP_DIR / "anomalies.json"
+
+ALPHA          = 0.1          # peso EWMA (~10 minuti di memoria)
+Z_ALERT        = 6.0
+WARMUP         = 30           # minuti osservati prima di poter segnalare una chiave
+MAX_TRACKED    = 5000
+TRACK_MIN      = {"src": 1 << 20, "port": 1 << 20, "srcflows": 50}   # sotto soglia non si segue
+ALERT_MIN      = {"src": 10 << 20, "port": 10 << 20, "srcflows": 200}
+HEAVY_BYTES    = 100 << 20    # bytes/min di un host non ancora in baseline
+HEAVY_SHARE    = 0.3          # ...oppure questa quota del traffico del minuto
+SCAN_PORTS_Z   = 3.0
+LAG            = 120          # s dopo l'ultimo file piegato prima di considerare chiuso un minuto
+BACKFILL       = 24 * 3600    # primo avvio: baseline dalle ultime 24h di rollup
+MAX_MINUTES    = 1440         # minuti per esecuzione (recupero graduale)
+MAX_FINDINGS   = 500
+REPORT_MAX_AGE = 3600         # in recupero arretrato non si segnalano minuti più vecchi
+
+# stato per chiave: [media, varianza, minuti osservati, ultimo minuto con valore > 0]
+Baseline = List[float]
+
+def _load(path, default):
+    try:
+        return json.loads(path.read_text("utf-8"))
+    except Exception:
+        return default
+
+def _save(path, obj):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(obj), encoding="utf-8")
+    os.replace(tmp, path)
+
+def _z(bl: Baseline, x: float) -> float:
+    mean, var = bl[0], bl[1]
+    std = max(math.sqrt(max(var, 0.0)), 0.1 * mean, 1.0)
+    return (x - mean) / std
+
+def _update(bl: Baseline, x: float, minute: int):
+    diff = x - bl[0]
+    incr = ALPHA * diff
+    bl[0] += incr
+    bl[1] = (1 - ALPHA) * (bl[1] + diff * incr)
+    bl[2] += 1
+    if x > 0:
+        bl[3] = minute
+
+def _human(n: float) -> str:
+    for u in ("B", "KB", "MB", "GB"):
+        if n < 1024:
+            return f"{n:.1f} {u}"
+        n /= 1024
+    return f"{n:.1f} TB"
+
+class Detector:
+    def __init__(self, keys: Optional[Dict[str, Baseline]] = None):
+        self.keys: Dict[str, Baseline] = keys or {}
+
+    def _cap(self):
+        if len(self.keys) <= MAX_TRACKED:
+            return
+        drop = sorted((k for k in self.keys if not k.startswith("_:")),
+                      key=lambda k: (self.keys[k][3], self.keys[k][0]))
+        for k in drop[:len(self.keys) - MAX_TRACKED]:
+            del self.keys[k]
+
+    def observe(self, minute: int, b: flowrollup.Bucket) -> List[dict]:
+        """Aggiorna le baseline con un bucket da 1 minuto; ritorna i finding del minuto."""
+        found: List[dict] = []
+        total = b["tot"][0] or 0  # type: ignore
+        series = {
+            "src": {k: v[0] for k, v in b["src"].items() if k != flowrollup.OTHER},        # type: ignore
+            "port": {k: v[0] for k, v in b["port"].items() if k != flowrollup.OTHER},      # type: ignore
+            "srcflows": {k: v[2] for k, v in b["src"].items() if k != flowrollup.OTHER},   # type: ignore
+        }
+        nports = len(b["port"])  # type: ignore
+        gl_ports = self.keys.setdefault("_:ports", [float(nports), 0.0, 0, minute])
+        ports_z = _z(gl_ports, nports) if gl_ports[2] >= WARMUP else 0.0
+        _update(gl_ports, nports, minute)
+        _update(self.keys.setdefault("_:flows", [0.0, 0.0, 0, minute]), b["tot"][2], minute)  # type: ignore
+
+        for dim, values in series.items():
+            prefix = dim + ":"
+            # chiavi già seguite: assenti nel minuto = 0
+            for key in [k for k in self.keys if k.startswith(prefix)]:
+                name = key[len(prefix):]
+                x = float(values.pop(name, 0))
+                bl = self.keys[key]
+                if bl[2] >= WARMUP and x >= ALERT_MIN[dim]:
+                    z = _z(bl, x)
+                    if z >= Z_ALERT:
+                        f = self._finding(dim, name, x, bl, z, ports_z, nports)
+                        if f:
+                            found.append(f)
+                _update(bl, x, minute)
+            # chiavi nuove
+            for name, x in values.items():
+                if x < TRACK_MIN[dim]:
+                    continue
+                if dim == "src" and (x >= HEAVY_BYTES or (total and x >= HEAVY_SHARE * total and x >= ALERT_MIN["src"])):
+                    found.append({"kind": "heavy", "key": name, "value": x, "mean": 0.0, "z": None,
+                                  "msg": f"Nuovo heavy talker {name}: {_human(x)}/min "
+                                         f"({100 * x / max(total, 1):.0f}% del traffico)"})
+                self.keys[prefix + name] = [float(x), 0.0, 1, minute]
+        self._cap()
+        for f in found:
+            f["ts"] = minute
+        return found
+
+    @staticmethod
+    def _finding(dim: str, name: str, x: float, bl: Baseline, z: float, ports_z: float, nports: int) -> Optional[dict]:
+        if dim == "src":
+            return {"kind": "egress", "key": name, "value": x, "mean": bl[0], "z": round(z, 1),
+                    "msg": f"Picco traffico da {name}: {_human(x)}/min (media {_human(bl[0])}, z={z:.1f})"}
+        if dim == "port":
+            return {"kind": "port", "key": name, "value": x, "mean": bl[0], "z": round(z, 1),
+                    "msg": f"Picco traffico su porta {name}: {_human(x)}/min (media {_human(bl[0])}, z={z:.1f})"}
+        if dim == "srcflows" and ports_z >= SCAN_PORTS_Z:
+            return {"kind": "scan", "key": name, "value": x, "mean": bl[0], "z": round(z, 1),
+                    "msg": f"Possibile port scan da {name}: {int(x)} flussi/min (media {bl[0]:.0f}), "
+                           f"{nports} porte dst distinte"}
+        return None
+
+def run(now: Optional[float] = None) -> dict:
+    """Elabora i minuti chiusi non ancora visti; aggiorna stato e FINDINGS_FILE."""
+    now = time.time() if now is None else now
+    cov = flowrollup.coverage()
+    last_file = nfcapd.file_time(cov["last"]) if cov["last"] else None
+    if not last_file:
+        return {"ok": True, "minutes": 0, "findings": 0}
+    horizon = last_file - LAG
+    horizon -= horizon % 60
+    st = _load(STATE_FILE, {})
+    det = Detector(st.get("keys") or {})
+    minute = int(st.get("minute") or 0) + 60
+    if minute <= 60:
+        minute = max(int(cov["first"]), horizon - BACKFILL)
+        minute -= minute % 60
+    done, new = 0, []
+    while minute <= horizon and done < MAX_MINUTES:
+        b = flowrollup.read_bucket(60, minute)
+        if b:
+            found = det.observe(minute, b)
+            if minute >= now - REPORT_MAX_AGE:
+                new += found
+        st["minute"] = minute
+        minute += 60
+        done += 1
+    st["keys"] = det.keys
+    _save(STATE_FILE, st)
+    if new:
+        data = _load(FINDINGS_FILE, {"findings": []})
+        data["findings"] = (data.get("findings") or []) + new
+        data["findings"] = data["findings"][-MAX_FINDINGS:]
+        data["updated"] = int(now)
+        _save(FINDINGS_FILE, data)
+    return {"ok": True, "minutes": done, "findings": len(new), "tracked": len(det.keys)}
+
+def recent(seconds: int = 3600) -> List[dict]:
+    cut = time.time() - seconds
+    return [f for f in (_load(FINDINGS_FILE, {}).get("findings") or []) if f.get("ts", 0) >= cut]
@@ -0,0 +1,392 @@
+# /opt/netprobe/app/util/flowcollector.py
+"""
+Collector NetFlow v9 / IPFIX in-process (asyncio UDP), alternativo a nfcapd.
+
+- template per (versione, exporter, source id/domain, template id); i record a lunghezza
+  fissa si decodificano in blocco con np.frombuffer e un dtype costruito dal template
+- i flussi finiscono come array nfcapd.FLOW_DTYPE in una finestra live in memoria
+  (ultimi LIVE_SECONDS, per dashboard sotto il secondo) e, a minuto chiuso, in segmenti
+  colonnari su disco: SEG_DIR/YYYYmmdd/<minuto>/<colonna>.npy (np.load con mmap), che
+  flowrollup.fold_new piega nei rollup come i file nfcapd
+- i dati dei template "options" (tabelle sampler/interfacce) non sono flussi: si scartano
+
+Attivazione nel processo API con NETPROBE_FLOW_LISTEN="0.0.0.0:2056" (vuoto = spento).
+Per provarlo in locale: jobs/flowcollectord.py + jobs/flowreplay.py verso 127.0.0.1.
+"""
+from __future__ import annotations
+import os, time, struct, asyncio, logging, threading, datetime
+from collections import deque
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from util import nfcapd
+
+np = nfcapd.np
+log = logging.getLogger("netprobe.flowcollector")
+
+LISTEN        = os.environ.get("NETPROBE_FLOW_LISTEN", "")
+SEG_DIR       = Path(os.environ.get("NETPROBE_FLOWSEG_DIR", "/var/lib/netprobe/flowseg"))
+LIVE_SECONDS  = 300
+LIVE_MAX_ROWS = 2_000_000     # tetto memoria della finestra live (si scartano i più vecchi)
+FLUSH_EVERY   = 5             # s tra i controlli dei minuti chiusi da scrivere
+VARLEN        = 65535
+
+# Information Element usati (stessi numeri in v9 e IPFIX)
+IE_BYTES, IE_PKTS, IE_PROTO, IE_SPORT, IE_SRC4, IE_DPORT, IE_DST4 = 1, 2, 4, 7, 8, 11, 12
+IE_LAST_UP, IE_FIRST_UP, IE_SRC6, IE_DST6 = 21, 22, 27, 28
+IE_BYTES_TOT, IE_PKTS_TOT = 85, 86
+IE_START_S, IE_END_S, IE_START_MS, IE_END_MS, IE_SYSINIT_MS = 150, 151, 152, 153, 160
+_ADDR_IES = (IE_SRC4, IE_DST4, IE_SRC6, IE_DST6)
+
+_V9_HDR    = struct.Struct("!HHIIII")   # version, count, sysUptime, unix_secs, seq, source_id
+_IPFIX_HDR = struct.Struct("!HHIII")    # version, length, export_time, seq, domain
+_SET_HDR   = struct.Struct("!HH")
+
+# ----------------- template -----------------
+class _Template:
+    __slots__ = ("fields", "fixed", "size", "dtype", "options")
+
+    def __init__(self, fields: List[Tuple[int, int, int]], options: bool = False):
+        self.fields = fields                       # [(ie, length, enterprise)]
+        self.options = options
+        self.fixed = all(ln != VARLEN for _, ln, _ in fields)
+        self.size = sum(ln for _, ln, _ in fields) if self.fixed else 0
+        self.dtype = _template_dtype([f for f in fields if f[1] != VARLEN]) if np is not None else None
+
+def _template_dtype(fields: List[Tuple[int, int, int]]):
+    names, formats = [], []
+    for i, (ie, ln, ent) in enumerate(fields):
+        names.append(f"f{i}")
+        if ent == 0 and ln in (1, 2, 4, 8) and ie not in _ADDR_IES:
+            formats.append(f">u{ln}")
+        else:
+            formats.append(f"V{ln}")
+    return np.dtype({"names": names, "formats": formats})
+
+def _uint(col, ln: int):
+    if col.dtype.kind == "u":
+        return col.astype(np.uint64)
+    raw = np.frombuffer(col.tobytes(), np.uint8).reshape(-1, ln)[:, -8:].astype(np.uint64)
+    out = np.zeros(len(col), np.uint64)
+    for i in range(raw.shape[1]):
+        out = (out << np.uint64(8)) | raw[:, i]
+    return out
+
+def _addr16(col, ln: int):
+    n = len(col)
+    raw = np.frombuffer(col.tobytes(), np.uint8).reshape(n, ln)
+    out = np.zeros((n, 16), np.uint8)
+    if ln == 4:
+        out[:, 10:12] = 0xFF
+        out[:, 12:] = raw
+    elif ln == 16:
+        out[:] = raw
+    return out.view("V16").ravel()
+
+def _to_flows(recs, fields: List[Tuple[int, int, int]], ctx: dict):
+    """Array di record del template -> array nfcapd.FLOW_DTYPE (vettoriale)."""
+    n = len(recs)
+    cols = {}
+    for i, (ie, ln, ent) in enumerate(fields):
+        if ent == 0 and ie not in cols:
+            cols[ie] = (recs[f"f{i}"], ln)
+
+    def u(*ies):
+        for ie in ies:
+            if ie in cols:
+                return _uint(*cols[ie])
+        return None
+
+    out = np.zeros(n, nfcapd.FLOW_DTYPE)
+    for name, ies in (("bytes", (IE_BYTES, IE_BYTES_TOT)), ("pkts", (IE_PKTS, IE_PKTS_TOT)),
+                      ("sport", (IE_SPORT,)), ("dport", (IE_DPORT,)), ("proto", (IE_PROTO,))):
+        v = u(*ies)
+        if v is not None:
+            out[name] = v
+    for name, ies in (("src", (IE_SRC4, IE_SRC6)), ("dst", (IE_DST4, IE_DST6))):
+        for ie in ies:
+            if ie in cols:
+                out[name] = _addr16(*cols[ie])
+                break
+
+    now_ms = np.uint64(ctx["export_ms"])
+    for name, ms_ie, s_ie, up_ie in (("first", IE_START_MS, IE_START_S, IE_FIRST_UP),
+                                     ("last", IE_END_MS, IE_END_S, IE_LAST_UP)):
+        if ms_ie in cols:
+            out[name] = u(ms_ie)
+        elif s_ie in cols:
+            out[name] = u(s_ie) * np.uint64(1000)
+        elif up_ie in cols:
+            sw = u(up_ie).astype(np.int64)
+            if "uptime" in ctx:     # v9: sysUptime dell'header
+                age = (np.int64(ctx["uptime"]) - sw) & 0xFFFFFFFF
+                out[name] = (np.int64(ctx["export_ms"]) - age).astype(np.uint64)
+            elif IE_SYSINIT_MS in cols:   # IPFIX: relativo a systemInitTimeMilliseconds
+                out[name] = u(IE_SYSINIT_MS) + sw.astype(np.uint64)
+            else:
+                out[name] = now_ms
+        else:
+            out[name] = now_ms
+    return out
+
+class Decoder:
+    """Decodifica datagrammi v9/IPFIX in array FLOW_DTYPE; tiene la cache dei template."""
+
+    def __init__(self):
+        self.templates: Dict[tuple, _Template] = {}
+        self.stats = {"packets": 0, "flows": 0, "errors": 0, "no_template": 0, "options": 0}
+
+    def decode(self, data: bytes, exporter: str) -> List["np.ndarray"]:
+        self.stats["packets"] += 1
+        try:
+            if len(data) < 4:
+                raise ValueError("datagramma corto")
+            version = struct.unpack_from("!H", data)[0]
+            if version == 9:
+                _, _, uptime, secs, _, src_id = _V9_HDR.unpack_from(data)
+                ctx = {"uptime": uptime, "export_ms": secs * 1000}
+                out = self._sets(data, _V9_HDR.size, len(data), (9, exporter, src_id), ctx, 0, 1)
+            elif version == 10:
+                _, length, etime, _, domain = _IPFIX_HDR.unpack_from(data)
+                ctx = {"export_ms": etime * 1000}
+                out = self._sets(data, _IPFIX_HDR.size, min(length, len(data)), (10, exporter, domain), ctx, 2, 3)
+            else:
+                raise ValueError(f"versione {version} non gestita")
+        except (ValueError, struct.error, IndexError):
+            self.stats["errors"] += 1
+            return []
+        self.stats["flows"] += sum(len(a) for a in out)
+        return out
+
+    def _sets(self, data: bytes, off: int, end: int, key: tuple, ctx: dict, tpl_id: int, opt_id: int):
+        ipfix = key[0] == 10
+        out = []
+        while off + 4 <= end:
+            sid, slen = _SET_HDR.unpack_from(data, off)
+            if slen < 4 or off + slen > end:
+                break
+            body, bend = off + 4, off + slen
+            if sid == tpl_id:
+                self._templates(data, body, bend, key, ipfix, options=False)
+            elif sid == opt_id:
+                self._templates(data, body, bend, key, ipfix, options=True)
+            elif sid >= 256:
+                t = self.templates.get(key + (sid,))
+                if t is None:
+                    self.stats["no_template"] += 1
+                elif t.options:
+                    self.stats["options"] += 1      # record di servizio, non flussi
+                else:
+                    a = self._data(data, body, bend, t, ctx)
+                    if a is not None and len(a):
+                        out.append(a)
+            off = bend
+        return out
+
+    def _templates(self, data: bytes, off: int, end: int, key: tuple, ipfix: bool, options: bool):
+        while off + 4 <= end:
+            if options and not ipfix:   # v9: tid, scope_len (byte), option_len (byte)
+                tid, scope_len, opt_len = struct.unpack_from("!HHH", data, off); off += 6
+                count = (scope_len + opt_len) // 4
+            else:
+                tid, count = _SET_HDR.unpack_from(data, off); off += 4
+                if options:             # IPFIX: + scope field count
+                    off += 2
+            if tid < 256:
+                break                   # padding
+            if count == 0:              # IPFIX: ritiro del template
+                self.templates.pop(key + (tid,), None)
+                continue
+            fields = []
+            for _ in range(count):
+                ie, ln = _SET_HDR.unpack_from(data, off); off += 4
+                ent = 0
+                if ipfix and ie & 0x8000:
+                    ent = struct.unpack_from("!I", data, off)[0]; off += 4
+                    ie &= 0x7FFF
+                fields.append((ie, ln, ent))
+            if off > end:
+                raise ValueError("template troncato")
+            self.templates[key + (tid,)] = _Template(fields, options)
+
+    def _data(self, data: bytes, off: int, end: int, t: _Template, ctx: dict):
+        if t.fixed:
+            if not t.size:
+                return None
+            n = (end - off) // t.size       # il resto è padding
+            if not n:
+                return None
+            recs = np.frombuffer(data, dtype=t.dtype, count=n, offset=off)
+            return _to_flows(recs, t.fields, ctx)
+        # campi a lunghezza variabile (solo IPFIX): si riportano i campi fissi in un buffer compatto
+        packed, n = bytearray(), 0
+        while off < end:
+            rec = bytearray()
+            try:
+                for ie, ln, _ in t.fields:
+                    if ln == VARLEN:
+                        ln = data[off]; off += 1
+                        if ln == 255:
+                            ln = struct.unpack_from("!H", data, off)[0]; off += 2
+                        off += ln
+                    else:
+                        rec += data[off:off + ln]; off += ln
+            except IndexError:
+                break
+            if off > end:
+                break
+            packed += rec; n += 1
+        if not n:
+            return None
+        fixed = [f for f in t.fields if f[1] != VARLEN]
+        recs = np.frombuffer(bytes(packed), dtype=t.dtype, count=n)
+        return _to_flows(recs, fixed, ctx)
+
+# ----------------- segmenti su disco -----------------
+def write_segment(a, minute: int, root: Path = SEG_DIR) -> Path:
+    day = time.strftime("%Y%m%d", time.localtime(minute))
+    base = root / day / str(minute)
+    dst, k = base, 0
+    while dst.exists():
+        k += 1
+        dst = base.with_name(f"{minute}.{k}")
+    tmp = dst.with_name(dst.name + ".tmp")
+    tmp.mkdir(parents=True, exist_ok=True)
+    for col in a.dtype.names:
+        np.save(tmp / f"{col}.npy", np.ascontiguousarray(a[col]))
+    os.replace(tmp, dst)
+    return dst
+
+def _segment_minute(name: str) -> Optional[int]:
+    head = name.split(".")[0]
+    return int(head) if head.isdigit() and not name.endswith(".tmp") else None
+
+def segments(root: Path = SEG_DIR) -> Iterator[Tuple[int, Path]]:
+    """(minuto di ricezione, directory) dei segmenti completi, in ordine di tempo."""
+    if not root.is_dir():
+        return
+    for ddir in sorted(root.iterdir()):
+        if not ddir.is_dir():
+            continue
+        found = []
+        for sd in ddir.iterdir():
+            m = _segment_minute(sd.name)
+            if m is not None and sd.is_dir():
+                found.append((m, sd))
+        yield from sorted(found)
+
+def read_segment(path: Path) -> "np.ndarray":
+    cols = {c: np.load(path / f"{c}.npy", mmap_mode="r") for c in nfcapd.FLOW_DTYPE.names}
+    a = np.zeros(len(cols["bytes"]), nfcapd.FLOW_DTYPE)
+    for c, v in cols.items():
+        a[c] = v
+    return a
+
+def read_segments(t_start: int, t_end: int, root: Path = SEG_DIR) -> Iterator["np.ndarray"]:
+    """Segmenti (minuto di ricezione) in [t_start, t_end] come array FLOW_DTYPE."""
+    d0, d1 = (datetime.date.fromtimestamp(t).strftime("%Y%m%d") for t in (t_start, t_end))
+    for m, sd in segments(root):
+        if d0 <= sd.parent.name <= d1 and t_start - 60 < m <= t_end:
+            yield read_segment(sd)
+
+# ----------------- collector -----------------
+class FlowCollector(asyncio.DatagramProtocol):
+    def __init__(self, seg_dir: Path = SEG_DIR, live_seconds: int = LIVE_SECONDS):
+        self.decoder = Decoder()
+        self.seg_dir = seg_dir
+        self.live_seconds = live_seconds
+        self.listen = ""
+        self._lock = threading.Lock()           # live/pending letti dai thread delle API e del flush
+        self._live: deque = deque()             # (ts_ricezione, array)
+        self._live_rows = 0
+        self._pending: Dict[int, list] = {}     # minuto -> array da scrivere
+        self._transport = None
+        self._flusher: Optional[asyncio.Task] = None
+
+    # --- asyncio ---
+    def connection_made(self, transport):
+        self._transport = transport
+
+    def datagram_received(self, data: bytes, addr):
+        arrays = self.decoder.decode(data, addr[0])
+        if not arrays:
+            return
+        now = time.time()
+        a = arrays[0] if len(arrays) == 1 else np.concatenate(arrays)
+        with self._lock:
+            self._pending.setdefault(int(now) - int(now) % 60, []).append(a)
+            self._live.append((now, a))
+            self._live_rows += len(a)
+            self._trim(now)
+
+    def _trim(self, now: float):
+        while self._live and (self._live[0][0] < now - self.live_seconds or self._live_rows > LIVE_MAX_ROWS):
+            _, old = self._live.popleft()
+            self._live_rows -= len(old)
+
+    async def _flush_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(FLUSH_EVERY)
+            try:
+                await loop.run_in_executor(None, self.flush, False)
+            except Exception as e:
+                log.warning("flush segmenti fallito: %s", e)
+
+    def flush(self, all_minutes: bool = True) -> int:
+        """Scrive i minuti chiusi (o tutti) come segmenti colonnari; ritorna i segmenti scritti."""
+        cur = int(time.time()) // 60 * 60
+        with self._lock:
+            ready = {m: self._pending.pop(m) for m in sorted(self._pending) if all_minutes or m < cur}
+        for m, parts in ready.items():
+            write_segment(np.concatenate(parts), m, self.seg_dir)
+        return len(ready)
+
+    # --- query (thread-safe) ---
+    def live(self, seconds: float = 10) -> Tuple[list, list]:
+        """(timestamps di ricezione, array) degli ultimi `seconds` secondi."""
+        cut = time.time() - seconds
+        with self._lock:
+            items = [(t, a) for t, a in self._live if t >= cut]
+        return [t for t, _ in items], [a for _, a in items]
+
+    def status(self) -> dict:
+        with self._lock:
+            rows = self._live_rows
+        return {"listen": self.listen, "live_rows": rows, "templates": len(self.decoder.templates),
+                **self.decoder.stats}
+
+    def close(self):
+        if self._flusher:
+            self._flusher.cancel()
+        if self._transport:
+            self._transport.close()
+        self.flush(True)
+
+_collector: Optional[FlowCollector] = None
+
+def current() -> Optional[FlowCollector]:
+    return _collector
+
+async def start(listen: str = LISTEN, seg_dir: Path = SEG_DIR) -> Optional[FlowCollector]:
+    """Avvia il collector sul loop corrente se `listen` ("host:porta") è impostato."""
+    global _collector
+    if not listen or _collector is not None:
+        return _collector
+    if np is None:
+        log.warning("flow collector: numpy non disponibile, non avviato")
+        return None
+    host, _, port = listen.rpartition(":")
+    loop = asyncio.get_running_loop()
+    col = FlowCollector(seg_dir)
+    await loop.create_datagram_endpoint(lambda: col, local_addr=(host or "0.0.0.0", int(port)))
+    col.listen = listen
+    col._flusher = asyncio.ensure_future(col._flush_loop())
+    _collector = col
+    return col
+
+def stop():
+    global _collector
+    if _collector is not None:
+        _collector.close()
+        _collector = None
@@ -0,0 +1,136 @@
+# /opt/netprobe/app/util/flowparts.py
+"""
+Partizioni dei flussi per exporter/interfaccia.
+
+Ogni netprobe-flow-exporter@IFACE con partizione dedicata manda a una propria istanza
+netprobe-flow-partition@IFACE (nfcapd su una porta assegnata qui) che scrive in
+FLOWS_DIR/if-IFACE; il resto resta nel collector condiviso alla radice di FLOWS_DIR.
+Il fold dei rollup cammina già su tutto l'albero, quindi le partizioni finiscono nei
+rollup globali senza altro lavoro.
+
+Le finestre dai file grezzi si leggono partizione per partizione in parallelo (pool di
+processi: il decoder nativo è Python puro e con i thread resterebbe seriale sul GIL),
+poi top-N e serie si ricalcolano sull'unione. Con un filtro interfaccia si legge solo
+quella partizione.
+"""
+from __future__ import annotations
+import os, re, json, multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from util import flowrollup, flowseries, nfcapd
+
+PART_PREFIX = "if-"
+ROOT_PART   = ""               # collector condiviso (radice di FLOWS_DIR)
+CFG_FILE    = Path("/etc/netprobe/flow-partitions.json")   # {"ports": {iface: porta}}
+ENV_DIR     = Path("/etc/netprobe/flow-partitions")        # <iface>.env letto dalle unit
+PORT_BASE   = 2060
+PORT_MAX    = 2099
+MAX_WORKERS = max(1, min(4, os.cpu_count() or 1))
+
+_IFACE_RE = re.compile(r"^[A-Za-z0-9_.:-]{1,32}$")
+_pool: Optional[ProcessPoolExecutor] = None
+
+def valid_iface(iface: str) -> bool:
+    return bool(iface) and bool(_IFACE_RE.match(iface))
+
+def part_dir(iface: str, root: str = flowrollup.FLOWS_DIR) -> str:
+    return os.path.join(root, PART_PREFIX + iface) if iface else root
+
+def partitions(root: str = flowrollup.FLOWS_DIR) -> List[str]:
+    """Interfacce con una directory di partizione; ROOT_PART se la radice ha file propri."""
+    out = []
+    try:
+        entries = sorted(os.scandir(root), key=lambda e: e.name)
+    except OSError:
+        return out
+    shared = False
+    for e in entries:
+        if e.is_dir(follow_symlinks=True) and e.name.startswith(PART_PREFIX):
+            out.append(e.name[len(PART_PREFIX):])
+        elif e.name.isdigit() or e.name.startswith("nfcapd."):
+            shared = True
+    return ([ROOT_PART] if shared else []) + out
+
+# ----------------- porte / unit -----------------
+def _load_cfg() -> dict:
+    try:
+        cfg = json.loads(CFG_FILE.read_text("utf-8"))
+        return cfg if isinstance(cfg, dict) else {}
+    except Exception:
+        return {}
+
+def ports() -> Dict[str, int]:
+    return {k: int(v) for k, v in (_load_cfg().get("ports") or {}).items()}
+
+def assign(iface: str) -> int:
+    """Porta nfcapd della partizione (stabile nel tempo) e file env per le unit systemd."""
+    if not valid_iface(iface):
+        raise ValueError(f"interfaccia non valida: {iface!r}")
+    cfg = _load_cfg()
+    table = {k: int(v) for k, v in (cfg.get("ports") or {}).items()}
+    port = table.get(iface)
+    if port is None:
+        used = set(table.values())
+        port = next((p for p in range(PORT_BASE, PORT_MAX + 1) if p not in used), None)
+        if port is None:
+            raise ValueError("porte per le partizioni esaurite")
+        table[iface] = port
+        cfg["ports"] = table
+        CFG_FILE.parent.mkdir(parents=True, exist_ok=True)
+        tmp = CFG_FILE.with_suffix(".tmp")
+        tmp.write_text(json.dumps(cfg, indent=2), encoding="utf-8")
+        os.replace(tmp, CFG_FILE)
+    ENV_DIR.mkdir(parents=True, exist_ok=True)
+    (ENV_DIR / f"{iface}.env").write_text(
+        f"FLOW_PORT={port}\nFLOW_PART_DIR={part_dir(iface)}\n", encoding="utf-8")
+    return port
+
+def release(iface: str):
+    """Exporter riportato sul collector condiviso (la porta resta riservata, i dati restano)."""
+    if valid_iface(iface):
+        try:
+            (ENV_DIR / f"{iface}.env").unlink()
+        except FileNotFoundError:
+            pass
+
+def dedicated(iface: str) -> bool:
+    return valid_iface(iface) and (ENV_DIR / f"{iface}.env").exists()
+
+# ----------------- query parallele -----------------
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: il processo web ha thread attivi, fork non è sicuro
+        _pool = ProcessPoolExecutor(MAX_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+def scan_raw(t_start: int, t_end: int, step: int = 60, n: int = 100, root: str = flowrollup.FLOWS_DIR,
+             stack: Optional[str] = None, k: int = 5, ifaces: Optional[List[str]] = None) -> dict:
+    """
+    Come flowrollup.scan_raw() ma su più partizioni (tutte, o solo `ifaces`) in parallelo.
+    ValueError se il lettore nativo non è disponibile o una partizione non è leggibile.
+    """
+    if not nfcapd.available():
+        raise ValueError("lettore nfcapd nativo non disponibile")
+    parts = partitions(root) if ifaces is None else [i for i in ifaces if i == ROOT_PART or valid_iface(i)]
+    # la radice esclude le sottodirectory di partizione, lette dai rispettivi worker
+    jobs = [(part_dir(p, root), t_start, t_end, PART_PREFIX if p == ROOT_PART else "") for p in parts]
+    if len(jobs) > 1:
+        results = list(_get_pool().map(flowrollup.scan_root, *zip(*jobs)))
+    else:
+        results = [flowrollup.scan_root(*j) for j in jobs]
+    acc = flowrollup._empty()
+    for b, _ in results:
+        flowrollup.merge(acc, b)
+    np = nfcapd.np
+    flows = np.concatenate([f for _, f in results]) if results else np.zeros(0, nfcapd.FLOW_DTYPE)
+    return {"top": flowrollup._top(acc, n),
+            "series": flowseries.series_from_array(flows, t_start, t_end, step, stack, k)}
@@ -0,0 +1,198 @@
+# /opt/netprobe/app/util/flowretention.py
+"""
+Retention dei dati di flusso a budget di byte.
+
+- grezzi (file nfcapd + segmenti del collector in-process): si eliminano i più vecchi
+  finché il totale sta nel budget; mai file o segmenti non ancora piegati nei rollup
+- rollup: i bucket giornalieri mancanti si compattano dagli orari (giorni già chiusi), poi
+  ogni risoluzione scade secondo flowrollup.KEEP (1m settimane, 1h mesi, 1d per sempre)
+
+Gira da jobs/flowrollupd.py ogni RUN_EVERY secondi e su richiesta da /flow/admin/retention,
+sempre sotto il lock del fold (LOCK_FILE): compattazione e cancellazioni non si sovrappongono
+mai a un fold che scrive gli stessi bucket.
+"""
+from __future__ import annotations
+import os, json, time, shutil, fcntl
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from util import flowrollup, flowcollector, nfcapd
+
+CFG_FILE   = Path("/etc/netprobe/flow-retention.json")
+STATE_FILE = flowrollup.ROLLUP_DIR / "retention.state.json"
+DEFAULT_CFG = {"raw_budget_mb": 4096}
+RUN_EVERY  = 600
+LOCK_FILE  = flowrollup.ROLLUP_DIR / ".fold.lock"     # lo stesso di jobs/flowrollupd.py
+DAY        = 86400
+
+def load_cfg() -> dict:
+    try:
+        cfg = json.loads(CFG_FILE.read_text("utf-8"))
+    except Exception:
+        cfg = {}
+    return {**DEFAULT_CFG, **(cfg if isinstance(cfg, dict) else {})}
+
+def save_cfg(cfg: dict):
+    CFG_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp = CFG_FILE.with_suffix(".tmp")
+    tmp.write_text(json.dumps({**load_cfg(), **cfg}, indent=2), encoding="utf-8")
+    os.replace(tmp, CFG_FILE)
+
+def _load_state() -> dict:
+    try:
+        return json.loads(STATE_FILE.read_text("utf-8"))
+    except Exception:
+        return {}
+
+def _save_state(st: dict):
+    STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp = STATE_FILE.with_suffix(".tmp")
+    tmp.write_text(json.dumps(st, indent=2), encoding="utf-8")
+    os.replace(tmp, STATE_FILE)
+
+def _dir_size(p: Path) -> int:
+    total = 0
+    for f in p.iterdir():
+        try:
+            total += f.stat().st_size
+        except OSError:
+            pass
+    return total
+
+# (ts, tipo, path, bytes, piegato?) ordinati dal più vecchio
+def raw_items() -> List[Tuple[int, str, str, int, bool]]:
+    st = flowrollup._load_state()
+    flowrollup._migrate_state(st)
+    out = []
+    for fn, fp in flowrollup._rotated_files(flowrollup.FLOWS_DIR):
+        ts = nfcapd.file_time(fn)
+        if ts is None:
+            continue
+        try:
+            out.append((ts, "nfcapd", fp, os.path.getsize(fp), flowrollup.is_folded(st, fp, ts)))
+        except OSError:
+            continue
+    for m, sd in flowcollector.segments():
+        out.append((m, "segment", str(sd), _dir_size(sd), flowrollup.is_folded(st, str(sd), m)))
+    out.sort()
+    return out
+
+def usage() -> dict:
+    items = raw_items()
+    roll = 0
+    for dirpath, _, files in os.walk(flowrollup.ROLLUP_DIR):
+        for f in files:
+            try:
+                roll += os.path.getsize(os.path.join(dirpath, f))
+            except OSError:
+                pass
+    return {
+        "raw_bytes": sum(i[3] for i in items),
+        "raw_files": len(items),
+        "raw_oldest": items[0][0] if items else None,
+        "rollup_bytes": roll,
+        "rollup_first": flowrollup.coverage()["first"],
+        "budget_mb": int(load_cfg()["raw_budget_mb"]),
+        "last_run": _load_state().get("last_run"),
+    }
+
+def _prune_empty_dirs(root: str):
+    for dirpath, dirnames, files in os.walk(root, topdown=False):
+        if dirpath != root and not dirnames and not files:
+            try:
+                os.rmdir(dirpath)
+            except OSError:
+                pass
+
+def enforce_raw(budget_bytes: int) -> dict:
+    items = raw_items()
+    total = sum(i[3] for i in items)
+    removed, freed, blocked = 0, 0, 0
+    for ts, kind, path, size, folded in items:
+        if total <= budget_bytes:
+            break
+        if not folded:
+            blocked += 1      # non ancora nei rollup: cancellarlo perderebbe storia
+            continue
+        try:
+            if kind == "segment":
+                shutil.rmtree(path)
+            else:
+                os.unlink(path)
+        except OSError:
+            continue
+        total -= size; freed += size; removed += 1
+    if removed:
+        _prune_empty_dirs(flowrollup.FLOWS_DIR)
+    return {"removed": removed, "freed": freed, "raw_bytes": total, "blocked": blocked}
+
+def compact_days(st: dict) -> int:
+    """
+    Bucket giornalieri ricostruiti dagli orari per i giorni chiusi che non li hanno (storico
+    piegato prima che esistesse la risoluzione 1d); fold_new scrive già anche il giornaliero.
+    """
+    cov = flowrollup.coverage()
+    last_file = nfcapd.file_time(cov["last"]) if cov["last"] else None
+    if not cov["first"] or not last_file:
+        return 0
+    day = max(int(st.get("compacted_until") or 0) + DAY, cov["first"] - cov["first"] % DAY)
+    built = 0
+    while day + DAY <= last_file - 3600:      # giorno chiuso e piegato (margine flussi tardivi)
+        if flowrollup._bucket_path(DAY, day).exists():
+            st["compacted_until"] = day
+            day += DAY
+            continue
+        acc = flowrollup._empty()
+        found = False
+        for h in range(day, day + DAY, 3600):
+            b = flowrollup.read_bucket(3600, h)
+            if b:
+                flowrollup.merge(acc, b); found = True
+        if found:
+            flowrollup.write_bucket(DAY, day, acc)
+            built += 1
+        st["compacted_until"] = day
+        day += DAY
+    return built
+
+def expire_rollups(now: float) -> int:
+    removed = 0
+    for res, keep in flowrollup.KEEP.items():
+        if not keep:
+            continue
+        d = flowrollup.ROLLUP_DIR / str(res)
+        if not d.is_dir():
+            continue
+        cut = now - keep
+        for f in d.iterdir():
+            head = f.name.split(".")[0]
+            if head.isdigit() and int(head) + res <= cut:
+                try:
+                    f.unlink(); removed += 1
+                except OSError:
+                    pass
+    return removed
+
+def run(budget_mb: Optional[int] = None, force: bool = False) -> dict:
+    """Retention sotto il lock del fold; {"ok": False, "busy": True} se fold o retention sono già in corso."""
+    flowrollup.ROLLUP_DIR.mkdir(parents=True, exist_ok=True)
+    with open(LOCK_FILE, "w") as lk:
+        try:
+            fcntl.flock(lk.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return {"ok": False, "busy": True, "error": "fold o retention in corso, riprovare tra poco"}
+        return _run(budget_mb, force)
+
+def _run(budget_mb: Optional[int], force: bool) -> dict:
+    st = _load_state()
+    now = time.time()
+    if not force and now - float(st.get("last_run") or 0) < RUN_EVERY:
+        return {"ok": True, "skipped": True}
+    budget = int(budget_mb if budget_mb is not None else load_cfg()["raw_budget_mb"]) * 1048576
+    res = {"ok": True, "raw": enforce_raw(budget)}
+    res["days_compacted"] = compact_days(st)
+    res["rollups_expired"] = expire_rollups(now)
+    st["last_run"] = int(now)
+    st["last_result"] = res
+    _save_state(st)
+    return res
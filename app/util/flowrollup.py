@@ -0,0 +1,554 @@
+# /opt/netprobe/app/util/flowrollup.py
+"""
+Rollup incrementali dei flussi NetFlow (1m / 5m / 1h).
+
+Ogni file nfcapd ruotato (e ogni segmento del collector in-process, util/flowcollector.py)
+viene "piegato" in bucket per minuto, 5 minuti e ora con
+bytes/pacchetti/flussi per src, dst, porta dst e protocollo. Ogni bucket è un file
+binario compatto (array uint64 + tabella chiavi) sotto ROLLUP_DIR/<res>/<ts>.rlp,
+così una finestra di 7 giorni costa ~170 letture invece di un nfdump su tutti i flussi.
+"""
+from __future__ import annotations
+import os, sys, json, time, struct, datetime, subprocess
+from array import array
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from util import nfcapd, flowseries, flowcollector
+
+FLOWS_DIR   = os.environ.get("NETPROBE_FLOWS_DIR", "/var/lib/netprobe/flows")
+ROLLUP_DIR  = Path(os.environ.get("NETPROBE_ROLLUP_DIR", "/var/lib/netprobe/flowrollup"))
+STATE_FILE  = ROLLUP_DIR / "state.json"   # {"last": "nfcapd.YYYYMMDDhhmm", "folded": {path: ts}, "horizon": ts,
+                                          #  "first": ts, "updated": ts}
+
+RESOLUTIONS = (60, 300, 3600, 86400)
+# età massima dei bucket per risoluzione (0 = per sempre), applicata da util/flowretention.py
+KEEP        = {60: 14 * 86400, 300: 60 * 86400, 3600: 400 * 86400, 86400: 0}
+DIMS        = ("src", "dst", "port", "proto")
+MAX_KEYS    = 20000          # chiavi per dimensione/bucket; il resto confluisce in OTHER (totali esatti)
+OTHER       = "__other__"
+_MAGIC      = b"NPR1"
+_FOLD_MAX_FILES = 500        # file per esecuzione (recupero arretrato graduale)
+FOLDED_HORIZON  = 2 * 86400  # elementi piegati ricordati per path; prima di "horizon" contano tutti come piegati
+
+# bucket in memoria: {"tot": [bytes, pkts, flows], "src": {key: [bytes, pkts, flows]}, ...}
+Bucket = Dict[str, object]
+
+def _empty() -> Bucket:
+    return {"tot": [0, 0, 0], **{d: {} for d in DIMS}}
+
+# ----------------- formato file -----------------
+def _bucket_path(res: int, ts: int) -> Path:
+    return ROLLUP_DIR / str(res) / f"{ts}.rlp"
+
+def _u64(values: List[int]) -> bytes:
+    a = array("Q", values)
+    if sys.byteorder == "big":
+        a.byteswap()
+    return a.tobytes()
+
+def _from_u64(buf: bytes) -> array:
+    a = array("Q")
+    a.frombytes(buf)
+    if sys.byteorder == "big":
+        a.byteswap()
+    return a
+
+def _encode(b: Bucket) -> bytes:
+    tot = b["tot"]  # type: ignore
+    out = [_MAGIC, struct.pack("<QQQB", tot[0], tot[1], tot[2], len(DIMS))]
+    for d in DIMS:
+        tbl: Dict[str, List[int]] = b[d]  # type: ignore
+        keys = list(tbl.keys())
+        blob = "\n".join(keys).encode("utf-8")
+        name = d.encode()
+        vals = [0] * (3 * len(keys))
+        for i, k in enumerate(keys):
+            v = tbl[k]
+            vals[i], vals[len(keys) + i], vals[2 * len(keys) + i] = v[0], v[1], v[2]
+        out += [struct.pack("<B", len(name)), name, struct.pack("<II", len(keys), len(blob)), blob, _u64(vals)]
+    return b"".join(out)
+
+def _decode(buf: bytes, totals_only: bool = False) -> Bucket:
+    if buf[:4] != _MAGIC:
+        raise ValueError("bad rollup file")
+    b0, p0, f0, ndims = struct.unpack_from("<QQQB", buf, 4)
+    b = _empty()
+    b["tot"] = [b0, p0, f0]
+    if totals_only:
+        return b
+    off = 4 + struct.calcsize("<QQQB")
+    for _ in range(ndims):
+        ln = buf[off]; off += 1
+        name = buf[off:off + ln].decode(); off += ln
+        n, blen = struct.unpack_from("<II", buf, off); off += 8
+        keys = buf[off:off + blen].decode("utf-8").split("\n") if n else []; off += blen
+        vals = _from_u64(buf[off:off + 24 * n]); off += 24 * n
+        if name in DIMS:
+            b[name] = {k: [vals[i], vals[n + i], vals[2 * n + i]] for i, k in enumerate(keys)}
+    return b
+
+def read_bucket(res: int, ts: int, totals_only: bool = False) -> Optional[Bucket]:
+    p = _bucket_path(res, ts)
+    try:
+        with open(p, "rb") as f:
+            buf = f.read(4 + struct.calcsize("<QQQB")) if totals_only else f.read()
+        return _decode(buf, totals_only)
+    except (FileNotFoundError, ValueError, struct.error):
+        return None
+
+def write_bucket(res: int, ts: int, b: Bucket):
+    p = _bucket_path(res, ts)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    tmp = p.with_suffix(".tmp")
+    tmp.write_bytes(_encode(b))
+    os.replace(tmp, p)
+
+def _cap(tbl: Dict[str, List[int]]) -> Dict[str, List[int]]:
+    if len(tbl) <= MAX_KEYS:
+        return tbl
+    items = sorted(tbl.items(), key=lambda kv: kv[1][0], reverse=True)
+    keep = dict(items[:MAX_KEYS - 1])
+    rest = keep.pop(OTHER, None) or [0, 0, 0]
+    for _, v in items[MAX_KEYS - 1:]:
+        rest = [rest[0] + v[0], rest[1] + v[1], rest[2] + v[2]]
+    keep[OTHER] = rest
+    return keep
+
+def merge(dst: Bucket, src: Bucket) -> Bucket:
+    t, s = dst["tot"], src["tot"]  # type: ignore
+    dst["tot"] = [t[0] + s[0], t[1] + s[1], t[2] + s[2]]  # type: ignore
+    for d in DIMS:
+        tbl: Dict[str, List[int]] = dst[d]  # type: ignore
+        for k, v in src[d].items():  # type: ignore
+            cur = tbl.get(k)
+            if cur is None:
+                tbl[k] = list(v)
+            else:
+                cur[0] += v[0]; cur[1] += v[1]; cur[2] += v[2]
+        dst[d] = _cap(tbl)
+    return dst
+
+# ----------------- lettura flussi -----------------
+_ts_memo: Dict[str, int] = {}
+
+def nfdump_epoch(s: str) -> Optional[int]:
+    """'YYYY-mm-dd HH:MM:SS[.mmm]' (ora locale, come stampa nfdump) -> epoch; memo per secondo."""
+    s = s.split(".")[0]
+    v = _ts_memo.get(s)
+    if v is None:
+        try:
+            v = int(datetime.datetime.strptime(s, "%Y-%m-%d %H:%M:%S").timestamp())
+        except Exception:
+            return None
+        if len(_ts_memo) > 100000:
+            _ts_memo.clear()
+        _ts_memo[s] = v
+    return v
+
+def read_flows(path: str) -> Iterator[Tuple[int, str, str, str, str, int, int]]:
+    """
+    (te_epoch, sa, da, dp, pr, bytes, pkts) per ogni flusso del file nfcapd. Senza -q: serve
+    la riga di intestazione "ts,..." per mappare le colonne. RuntimeError se nfdump fallisce,
+    così il file non risulta piegato con zero flussi.
+    """
+    p = subprocess.Popen(["nfdump", "-r", path, "-o", "csv"], stdout=subprocess.PIPE,
+                         stderr=subprocess.DEVNULL, text=True)
+    header = None
+    done = False
+    try:
+        for raw in p.stdout:  # type: ignore
+            ln = raw.strip()
+            if not ln:
+                continue
+            if ln.lower().startswith("ts,"):
+                header = [h.strip() for h in ln.split(",")]
+                continue
+            if ln.startswith("Summary") or ln.lower().startswith("flows,bytes"):
+                done = True
+                break
+            if header is None:
+                continue
+            parts = [x.strip() for x in ln.split(",")]
+            if len(parts) != len(header):
+                continue
+            r = dict(zip(header, parts))
+            te = nfdump_epoch(r.get("te") or "")
+            if te is None:
+                continue
+            try:
+                byt = int(float(r.get("ibyt") or r.get("bytes") or 0))
+                pkt = int(float(r.get("ipkt") or r.get("pkts") or 0))
+            except Exception:
+                continue
+            yield (te, r.get("sa") or "", r.get("da") or "", r.get("dp") or "", r.get("pr") or "", byt, pkt)
+    finally:
+        if p.poll() is None:
+            p.kill()
+        rc = p.wait()
+    if not done and rc != 0:
+        raise RuntimeError(f"nfdump -r {path}: rc={rc}")
+
+# ----------------- fold -----------------
+def _load_state() -> dict:
+    try:
+        return json.loads(STATE_FILE.read_text("utf-8"))
+    except Exception:
+        return {"last": "", "first": 0, "updated": 0}
+
+def _save_state(st: dict):
+    ROLLUP_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = STATE_FILE.with_suffix(".tmp")
+    tmp.write_text(json.dumps(st, indent=2), encoding="utf-8")
+    os.replace(tmp, STATE_FILE)
+
+def fold_flows(flows) -> Dict[int, Bucket]:
+    """Aggrega una sequenza di flussi in bucket da 1 minuto (per tempo di fine flusso)."""
+    minutes: Dict[int, Bucket] = {}
+    for te, sa, da, dp, pr, byt, pkt in flows:
+        ts = te - te % 60
+        b = minutes.get(ts)
+        if b is None:
+            b = minutes[ts] = _empty()
+        t = b["tot"]; t[0] += byt; t[1] += pkt; t[2] += 1  # type: ignore
+        for d, k in (("src", sa), ("dst", da), ("port", dp), ("proto", pr)):
+            if not k:
+                continue
+            tbl = b[d]  # type: ignore
+            v = tbl.get(k)
+            if v is None:
+                tbl[k] = [byt, pkt, 1]
+            else:
+                v[0] += byt; v[1] += pkt; v[2] += 1
+    return minutes
+
+def _fold_group(a) -> Bucket:
+    """Un array nfcapd.FLOW_DTYPE -> un bucket, con np.unique + somme per chiave distinta."""
+    np = nfcapd.np
+    b = _empty()
+    b["tot"] = [int(a["bytes"].sum()), int(a["pkts"].sum()), int(len(a))]
+    if not len(a):
+        return b
+    ports = a["dport"].astype(np.uint32)
+    icmp = (a["proto"] == 1) | (a["proto"] == 58)
+    if icmp.any():
+        ports = np.where(icmp, ports | (a["proto"].astype(np.uint32) << 16), ports)
+    for d, keys, name in (("src", a["src"], nfcapd.ip_str), ("dst", a["dst"], nfcapd.ip_str),
+                          ("port", ports, lambda v: nfcapd.port_key(v >> 16, v & 0xFFFF)),
+                          ("proto", a["proto"], nfcapd.proto_name)):
+        uniq, inv = np.unique(keys, return_inverse=True)
+        inv = inv.ravel()
+        byt = np.zeros(len(uniq), np.uint64); np.add.at(byt, inv, a["bytes"])
+        pkt = np.zeros(len(uniq), np.uint64); np.add.at(pkt, inv, a["pkts"])
+        cnt = np.bincount(inv, minlength=len(uniq))
+        tbl: Dict[str, List[int]] = b[d]  # type: ignore
+        for i, k in enumerate(uniq.tolist()):
+            k = name(k)
+            if not k:
+                continue
+            v = tbl.get(k)
+            if v is None:
+                tbl[k] = [int(byt[i]), int(pkt[i]), int(cnt[i])]
+            else:   # chiavi raw diverse con la stessa stringa (es. porte ICMP)
+                v[0] += int(byt[i]); v[1] += int(pkt[i]); v[2] += int(cnt[i])
+        b[d] = _cap(tbl)
+    return b
+
+def fold_array(a, minutes: Optional[Dict[int, Bucket]] = None) -> Dict[int, Bucket]:
+    """Come fold_flows() ma vettoriale, su un array del lettore nativo nfcapd."""
+    np = nfcapd.np
+    minutes = {} if minutes is None else minutes
+    te = (a["last"] // 1000).astype(np.int64)
+    mins = te - te % 60
+    for m in np.unique(mins).tolist():
+        g = _fold_group(a[mins == m])
+        cur = minutes.get(m)
+        minutes[m] = merge(cur, g) if cur else g
+    return minutes
+
+def _fold_native(path: str) -> Optional[Dict[int, Bucket]]:
+    """Bucket per minuto dal lettore nativo; None se non disponibile/formato non gestito."""
+    if not nfcapd.available():
+        return None
+    try:
+        arrays = list(nfcapd.read(path))
+    except Exception:
+        return None
+    minutes: Dict[int, Bucket] = {}
+    for a in arrays:
+        fold_array(a, minutes)
+    return minutes
+
+def fold_minutes(minutes: Dict[int, Bucket]) -> int:
+    """Somma i bucket da 1 minuto nei file di tutte le risoluzioni; ritorna il bucket più vecchio toccato."""
+    oldest = 0
+    for res in RESOLUTIONS:
+        grouped: Dict[int, Bucket] = {}
+        for ts, b in minutes.items():
+            key = ts - ts % res
+            grouped[key] = merge(grouped.get(key) or _empty(), b)
+        for ts, b in grouped.items():
+            cur = read_bucket(res, ts)
+            write_bucket(res, ts, merge(cur, b) if cur else b)
+    if minutes:
+        oldest = min(minutes)
+    return oldest
+
+def _rotated_files(root: str) -> List[Tuple[str, str]]:
+    out = []
+    for dirpath, _, files in os.walk(root, followlinks=True):
+        for fn in files:
+            if fn.startswith("nfcapd.") and fn[7:].isdigit():
+                out.append((fn, os.path.join(dirpath, fn)))
+    out.sort()
+    return out
+
+def is_folded(st: dict, path: str, ts: int) -> bool:
+    """Elemento grezzo (file nfcapd o segmento del collector) già nei rollup secondo lo stato `st`."""
+    return ts < int(st.get("horizon") or 0) or path in (st.get("folded") or {})
+
+def _advance_horizon(st: dict, now: float, pending: List[int]):
+    # l'orizzonte non supera mai un elemento ancora da piegare (arretrato oltre _FOLD_MAX_FILES)
+    h = int(now) - FOLDED_HORIZON
+    if pending:
+        h = min(h, min(pending))
+    st["horizon"] = max(int(st.get("horizon") or 0), h)
+    st["folded"] = {p: t for p, t in (st.get("folded") or {}).items() if t >= st["horizon"]}
+
+def _note_folded(st: dict, minutes: Dict[int, Bucket]):
+    oldest = fold_minutes(minutes)
+    if oldest and (not st.get("first") or oldest < st["first"]):
+        st["first"] = oldest
+    st["updated"] = int(time.time())
+
+def _migrate_state(st: dict):
+    # stato a watermark unico ("last" + "last_paths" dello slot): prima dello slot tutto piegato
+    if "last_paths" in st:
+        t = nfcapd.file_time(st.get("last") or "") or 0
+        st["horizon"] = max(int(st.get("horizon") or 0), t)
+        st.setdefault("folded", {}).update({p: t for p in st.pop("last_paths") or []})
+
+def fold_new(max_files: int = _FOLD_MAX_FILES) -> dict:
+    """
+    Piega i file nfcapd ruotati e i segmenti del collector non ancora elaborati (in ordine
+    temporale). Ogni file è segnato per path in "folded": un nfcapd ruotato in ritardo, o di
+    una partizione rimasta indietro, si piega comunque anche se ne sono già arrivati di più recenti.
+    """
+    st = _load_state()
+    _migrate_state(st)
+    done = segs = 0
+    pending: List[int] = []
+    for fn, fp in _rotated_files(FLOWS_DIR):
+        ts = nfcapd.file_time(fn)
+        if ts is None or is_folded(st, fp, ts):
+            continue
+        if done >= max_files:
+            pending.append(ts)
+            continue
+        minutes = _fold_native(fp)
+        if minutes is None:
+            try:
+                minutes = fold_flows(read_flows(fp))
+            except (OSError, RuntimeError):
+                pending.append(ts)      # nfdump assente o fallito: si riprova al prossimo run
+                continue
+        _note_folded(st, minutes)
+        st.setdefault("folded", {})[fp] = ts
+        st["last"] = max(st.get("last") or "", fn)
+        _save_state(st)
+        done += 1
+    if nfcapd.np is not None:
+        for m, sd in flowcollector.segments():
+            if is_folded(st, str(sd), m):
+                continue
+            if done >= max_files:
+                pending.append(m)
+                continue
+            try:
+                _note_folded(st, fold_array(flowcollector.read_segment(sd)))
+            except (OSError, ValueError):
+                pass                    # segmento illeggibile: segnato comunque, non si riprova a ogni run
+            st.setdefault("folded", {})[str(sd)] = m
+            _save_state(st)
+            done += 1; segs += 1
+    _advance_horizon(st, time.time(), pending)
+    _save_state(st)
+    return {"ok": True, "folded": done, "segments": segs, "last": st.get("last")}
+
+# ----------------- query -----------------
+def coverage() -> dict:
+    st = _load_state()
+    return {"first": int(st.get("first") or 0), "last": st.get("last") or "", "updated": int(st.get("updated") or 0)}
+
+def _kept(res: int, t: int, now: float) -> bool:
+    return not KEEP.get(res) or t >= now - KEEP[res]
+
+def cover(t_start: int, t_end: int, now: Optional[float] = None) -> List[Tuple[int, int]]:
+    """
+    Copertura greedy di [t_start, t_end) con il minor numero di bucket (1d > 1h > 5m > 1m),
+    usando solo le risoluzioni ancora conservate a quell'età (KEEP).
+    """
+    now = time.time() if now is None else now
+    t = -(-t_start // 60) * 60
+    end = t_end - t_end % 60
+    out = []
+    while t < end:
+        allowed = [r for r in RESOLUTIONS if _kept(r, t, now)] or [RESOLUTIONS[-1]]
+        for res in reversed(allowed):
+            if t % res == 0 and t + res <= end:
+                out.append((res, t)); t += res
+                break
+        else:
+            # risoluzioni fini già scadute: si usa il bucket più fine rimasto anche se sborda
+            res = allowed[0]
+            ts = t - t % res
+            out.append((res, ts)); t = ts + res
+    return out
+
+def _top(acc: Bucket, n: int) -> dict:
+    def topn(tbl: Dict[str, List[int]]):
+        items = [(k, v[0]) for k, v in tbl.items() if k != OTHER]
+        return sorted(items, key=lambda kv: kv[1], reverse=True)[:n]
+
+    tot = acc["tot"]  # type: ignore
+    return {
+        "totals": {"flows": tot[2], "bytes": tot[0], "packets": tot[1]},
+        "srcip": topn(acc["src"]),    # type: ignore
+        "dstip": topn(acc["dst"]),    # type: ignore
+        "dstport": topn(acc["port"]), # type: ignore
+        "proto": topn(acc["proto"]),  # type: ignore
+    }
+
+def summarize(arrays, n: int = 100) -> dict:
+    """Totali e top-N (forma di query()) da array nfcapd.FLOW_DTYPE già in memoria."""
+    acc = _empty()
+    for a in arrays:
+        if len(a):
+            merge(acc, _fold_group(a))
+    return _top(acc, n)
+
+def query(t_start: int, t_end: int, n: int = 100, extra: Optional[Dict[int, Bucket]] = None) -> dict:
+    """
+    Totali esatti e top-N per dimensione nella finestra, stessa forma di flow._scan()['top'].
+    `extra`: bucket per minuto non ancora piegati (unfolded()) sommati ai rollup.
+    """
+    acc = _empty()
+    for res, ts in cover(t_start, t_end):
+        b = read_bucket(res, ts)
+        if b:
+            merge(acc, b)
+    for b in (extra or {}).values():
+        merge(acc, b)
+    return _top(acc, n)
+
+def series(t_start: int, t_end: int, step: int = 60, stack: Optional[str] = None,
+           keys: Optional[List[str]] = None, extra: Optional[Dict[int, Bucket]] = None) -> dict:
+    """
+    Serie bytes/pacchetti/flussi per step alla risoluzione più adatta (solo header dei bucket).
+    Con stack ('proto'|'src'|'dst') e le chiavi da impilare legge i bucket completi: una serie
+    per chiave più "altri" (= totale - chiavi). Nessuno spalmamento: i rollup sono per fine flusso.
+    `extra` come in query().
+    """
+    step = max(60, step - step % 60)
+    bins = list(range(t_start - t_start % step, t_end + 1, step))
+    now = time.time()
+    fits = [r for r in RESOLUTIONS if r <= step and step % r == 0 and _kept(r, t_start, now)]
+    res = max(fits) if fits else min(r for r in RESOLUTIONS if _kept(r, t_start, now))
+    out = {"t": bins, "bytes": [0] * len(bins), "packets": [0] * len(bins), "flows": [0] * len(bins), "stack": None}
+    if not bins:
+        return out
+    dim = stack if stack in ("proto", "src", "dst") else None
+    keys = list(keys or []) if dim else []
+    per = {k: [[0] * len(bins) for _ in range(3)] for k in keys}
+
+    def add(ts: int, b: Bucket):
+        i = (ts - bins[0]) // step
+        if 0 <= i < len(bins):
+            tot = b["tot"]  # type: ignore
+            out["bytes"][i] += tot[0]; out["packets"][i] += tot[1]; out["flows"][i] += tot[2]
+            for k in keys:
+                v = b[dim].get(k)  # type: ignore
+                if v:
+                    ks = per[k]
+                    ks[0][i] += v[0]; ks[1][i] += v[1]; ks[2][i] += v[2]
+
+    for ts in range(bins[0] - bins[0] % res, t_end + 1, res):
+        b = read_bucket(res, ts, totals_only=not dim)
+        if b:
+            add(ts, b)
+    for ts, b in (extra or {}).items():
+        add(ts, b)
+    if dim:
+        rest = [[out[m][i] - sum(per[k][j][i] for k in keys) for i in range(len(bins))]
+                for j, m in enumerate(flowseries.METRICS)]
+        other = any(any(r) for r in rest)
+        out["stack"] = {"by": dim, "keys": keys + ([flowseries.OTHER_LABEL] if other else []),
+                        **{m: [per[k][j] for k in keys] + ([rest[j]] if other else [])
+                           for j, m in enumerate(flowseries.METRICS)}}
+    return out
+
+# ----------------- finestra dai file grezzi -----------------
+_LATE = 300   # un flusso può finire in un file ruotato fino a ~active timeout dopo la sua fine
+
+def scan_root(root: str, t_start: int, t_end: int, exclude: str = ""):
+    """(bucket piegato, flussi FLOW_DTYPE) con fine in [t_start, t_end] dai file sotto `root`."""
+    np = nfcapd.np
+    arrays = []
+    acc = _empty()
+    for fp in nfcapd.files_between(root, t_start - 60, t_end + _LATE, exclude=exclude):
+        for a in nfcapd.read(fp):
+            te = (a["last"] // 1000).astype(np.int64)
+            sel = (te >= t_start) & (te <= t_end)
+            if not sel.any():
+                continue
+            a = a[sel]
+            arrays.append(a)
+            merge(acc, _fold_group(a))
+    flows = np.concatenate(arrays) if arrays else np.zeros(0, nfcapd.FLOW_DTYPE)
+    return acc, flows
+
+def unfolded(t_start: int, t_end: int) -> Dict[int, Bucket]:
+    """
+    Bucket per minuto dei flussi con fine in [t_start, t_end] nei file nfcapd e nei segmenti del
+    collector non ancora piegati: la coda della finestra che i rollup non hanno (fold in ritardo
+    di una rotazione più il timer, o fermo). ValueError se il lettore nativo non è disponibile.
+    """
+    if not nfcapd.available():
+        raise ValueError("lettore nfcapd nativo non disponibile")
+    np = nfcapd.np
+    st = _load_state()
+    _migrate_state(st)
+    minutes: Dict[int, Bucket] = {}
+
+    def add(a):
+        te = (a["last"] // 1000).astype(np.int64)
+        sel = (te >= t_start) & (te <= t_end)
+        if sel.any():
+            fold_array(a[sel], minutes)
+
+    for fp in nfcapd.files_between(FLOWS_DIR, t_start - 60, t_end + _LATE):
+        ts = nfcapd.file_time(os.path.basename(fp))
+        if ts is None or is_folded(st, fp, ts):
+            continue
+        for a in nfcapd.read(fp):
+            add(a)
+    for m, sd in flowcollector.segments():
+        if t_start - 60 < m <= t_end + _LATE and not is_folded(st, str(sd), m):
+            try:
+                add(flowcollector.read_segment(sd))
+            except (OSError, ValueError):
+                continue                # come in fold_new(): segmento illeggibile ignorato
+    return minutes
+
+def scan_raw(t_start: int, t_end: int, step: int = 60, n: int = 100, root: str = FLOWS_DIR,
+             stack: Optional[str] = None, k: int = 5) -> dict:
+    """
+    Top-N e serie (flowseries, flussi lunghi spalmati) di [t_start, t_end] letti direttamente
+    dai file nfcapd col lettore nativo; flussi selezionati per tempo di fine, come nfdump CSV.
+    Solleva ValueError se il lettore non è disponibile o un file non è leggibile: il
+    chiamante ripiega su nfdump.
+    """
+    if not nfcapd.available():
+        raise ValueError("lettore nfcapd nativo non disponibile")
+    acc, flows = scan_root(root, t_start, t_end)
+    return {"top": _top(acc, n), "series": flowseries.series_from_array(flows, t_start, t_end, step, stack, k)}
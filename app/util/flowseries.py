@@ -0,0 +1,114 @@
+# /opt/netprobe/app/util/flowseries.py
+"""
+Serie temporali dei flussi (bytes / pacchetti / flussi per step), vettoriali con NumPy.
+
+Bytes e pacchetti di un flusso lungo vengono spalmati sui bin che attraversa, in
+proporzione alla sovrapposizione (rate costante tra inizio e fine); il conteggio flussi
+va nel bin in cui il flusso termina. Con `keys` la serie è impilata per gruppo: le top-K
+chiavi per bytes più "altri". Nessun loop Python per flusso: bincount + differenze cumulate.
+"""
+from __future__ import annotations
+from typing import Callable, Optional
+
+from util import nfcapd
+
+np = nfcapd.np
+OTHER_LABEL = "altri"
+METRICS = ("bytes", "packets", "flows")
+
+def available() -> bool:
+    return np is not None
+
+def bins_for(t_start: int, t_end: int, step: int) -> list:
+    t0 = t_start - t_start % step
+    return list(range(t0, t_end + 1, step))
+
+def group_top(keys, weights, k: int):
+    """(indice gruppo per elemento, chiavi top-K, c'è 'altri'): gruppo k = tutto il resto."""
+    if not len(keys):
+        return np.zeros(0, np.int64), [], False
+    if keys.dtype.kind == "V" and keys.dtype.itemsize == 16:
+        # indirizzi a 16 byte: unique su un hash uint64 (molto più veloce del confronto a byte)
+        h = np.ascontiguousarray(keys).view("<u8").reshape(-1, 2)
+        h = h[:, 0] * np.uint64(0x9E3779B97F4A7C15) ^ h[:, 1]
+        _, first, inv = np.unique(h, return_index=True, return_inverse=True)
+        uniq = keys[first]
+    else:
+        uniq, inv = np.unique(keys, return_inverse=True)
+    inv = inv.ravel()
+    w = np.bincount(inv, weights=np.asarray(weights, np.float64), minlength=len(uniq))
+    order = np.argsort(-w, kind="stable")[:max(1, k)]
+    mapping = np.full(len(uniq), len(order), np.int64)
+    mapping[order] = np.arange(len(order))
+    return mapping[inv], [uniq[i] for i in order], len(uniq) > len(order)
+
+def bin_flows(first, last, byts, pkts, t0: int, step: int, nbins: int,
+              groups=None, ngroups: int = 1) -> dict:
+    """Matrici (ngroups, nbins) float di bytes/pacchetti spalmati e flussi per bin di fine."""
+    s = np.asarray(first, np.float64)
+    e = np.maximum(np.asarray(last, np.float64), s)
+    g = np.zeros(len(s), np.int64) if groups is None else np.asarray(groups, np.int64)
+    width = nbins + 1                       # colonna extra: le differenze non sconfinano nel gruppo dopo
+    size = ngroups * width
+    xs = (s - t0) / step
+    xe = (e - t0) / step
+    i_s = np.floor(xs).astype(np.int64)
+    i_e = np.floor(xe).astype(np.int64)
+    in_e = (i_e >= 0) & (i_e < nbins)
+    base = g * width
+
+    def put(idx, w, mask):
+        # con selezione vuota bincount ignora i pesi e torna int64: sempre float
+        return np.bincount(base[mask] + idx[mask], weights=w[mask], minlength=size).astype(np.float64, copy=False)
+
+    out = {"flows": np.bincount(base[in_e] + i_e[in_e], minlength=size).astype(np.float64)}
+    same = i_s == i_e
+    multi = ~same
+    span = np.where(multi, xe - xs, 1.0)
+    lo = np.clip(i_s + 1, 0, nbins)
+    hi = np.clip(i_e, 0, nbins)
+    full = multi & (lo < hi)
+    in_s = multi & (i_s >= 0) & (i_s < nbins)
+    in_last = multi & in_e
+    for name, vals in (("bytes", byts), ("packets", pkts)):
+        v = np.asarray(vals, np.float64)
+        r = v / span                        # quota per unità di bin
+        acc = put(i_e, v, same & in_e)
+        acc += put(i_s, r * (i_s + 1 - xs), in_s)
+        acc += put(i_e, r * (xe - i_e), in_last)
+        diff = put(lo, r, full) - put(hi, r, full)
+        acc += np.cumsum(diff.reshape(ngroups, width), axis=1).ravel()
+        out[name] = acc
+    return {m: out[m].reshape(ngroups, width)[:, :nbins] for m in METRICS}
+
+def series(first, last, byts, pkts, t_start: int, t_end: int, step: int,
+           keys=None, k: int = 5, label: Callable = str, by: Optional[str] = None) -> dict:
+    """
+    Serie della finestra: {"t", "bytes", "packets", "flows", "stack"}; first/last in secondi.
+    Con `keys` lo "stack" contiene le stesse metriche per ciascuna delle top-K chiavi.
+    """
+    step = max(1, int(step))
+    t = bins_for(t_start, t_end, step)
+    groups, top, other = None, [], False
+    if keys is not None:
+        groups, top, other = group_top(keys, byts, k)
+    ng = len(top) + (1 if other else 0) if keys is not None else 1
+    m = bin_flows(first, last, byts, pkts, t[0] if t else t_start, step, len(t), groups, max(1, ng))
+    out = {"t": t}
+    for name in METRICS:
+        out[name] = [int(x) for x in np.rint(m[name].sum(axis=0))]
+    out["stack"] = None
+    if keys is not None:
+        out["stack"] = {"by": by, "keys": [label(x) for x in top] + ([OTHER_LABEL] if other else []),
+                        **{name: [[int(x) for x in row] for row in np.rint(m[name])] for name in METRICS}}
+    return out
+
+def series_from_array(a, t_start: int, t_end: int, step: int, stack: Optional[str] = None, k: int = 5) -> dict:
+    """series() su un array nfcapd.FLOW_DTYPE; stack = None | 'proto' | 'src' | 'dst'."""
+    keys, label = None, str
+    if stack == "proto":
+        keys, label = a["proto"], nfcapd.proto_name
+    elif stack in ("src", "dst"):
+        keys, label = a[stack], lambda v: nfcapd.ip_str(v.tobytes()) or "-"
+    return series(a["first"] / 1000.0, a["last"] / 1000.0, a["bytes"], a["pkts"],
+                  t_start, t_end, step, keys, k, label, stack)
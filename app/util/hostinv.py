@@ -0,0 +1,189 @@
+# /opt/netprobe/app/util/hostinv.py
+"""
+Inventario host persistente del Net Mapper.
+
+Chiave: MAC (minuscolo) o "ip:<ip>" per gli host senza MAC noto (reti instradate). Ogni
+record tiene ip, mac, vendor, hostname, os, ttl, porte aperte e servizi correnti,
+first_seen/last_seen e uno storico breve dei cambi di porte (al massimo HISTORY_MAX voci).
+
+Il file è JSON con scrittura atomica; gli aggiornamenti passano da un lock fcntl perché
+lo scrivono le scansioni e altri processi. Le scansioni incrementali confrontano la
+ricognizione leggera (MAC, porte aperte, TTL) con l'inventario e rilanciano -sV/-O solo
+sugli host nuovi o cambiati (needs_probe). L'ascolto passivo (util/passive.py) aggiorna
+gli stessi record con observe(), senza toccare porte e servizi.
+"""
+from __future__ import annotations
+import os, json, fcntl, ipaddress
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+INV_FILE    = Path(os.environ.get("NETPROBE_INVENTORY", "/var/lib/netprobe/netmap/inventory.json"))
+HISTORY_MAX = 20
+
+def _empty() -> Dict[str, Any]:
+    return {"hosts": {}}
+
+def load() -> Dict[str, Any]:
+    try:
+        inv = json.loads(INV_FILE.read_text("utf-8"))
+        return inv if isinstance(inv, dict) and isinstance(inv.get("hosts"), dict) else _empty()
+    except Exception:
+        return _empty()
+
+def _save(inv: Dict[str, Any]):
+    tmp = INV_FILE.with_suffix(".tmp")
+    tmp.write_text(json.dumps(inv, separators=(",", ":")), encoding="utf-8")
+    os.replace(tmp, INV_FILE)
+
+@contextmanager
+def locked():
+    """Inventario in lettura/scrittura esclusiva; salvato all'uscita senza eccezioni."""
+    INV_FILE.parent.mkdir(parents=True, exist_ok=True)
+    with open(INV_FILE.with_suffix(".lock"), "a") as lk:
+        fcntl.flock(lk.fileno(), fcntl.LOCK_EX)
+        try:
+            inv = load()
+            yield inv
+            _save(inv)
+        finally:
+            fcntl.flock(lk.fileno(), fcntl.LOCK_UN)
+
+def key_for(mac: Optional[str], ip: Optional[str]) -> str:
+    return mac.lower() if mac else f"ip:{ip}"
+
+def ttl_class(ttl: Optional[int]) -> Optional[int]:
+    """TTL iniziale stimato (32/64/128/255): stabile rispetto al numero di hop."""
+    if not ttl:
+        return None
+    return next(c for c in (32, 64, 128, 255) if ttl <= c)
+
+def port_set(services: Iterable[Dict[str, Any]]) -> List[str]:
+    return sorted({f"{s.get('proto')}/{s.get('port')}" for s in services or [] if s.get("state", "open") == "open"},
+                  key=lambda p: (p.split("/")[0], int(p.split("/")[1])))
+
+def by_ip(inv: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """ip -> record attivo più recente con quell'IP."""
+    out: Dict[str, Dict[str, Any]] = {}
+    for rec in inv.get("hosts", {}).values():
+        ip = rec.get("ip")
+        if ip and not rec.get("gone") and (ip not in out or rec.get("last_seen", 0) > out[ip].get("last_seen", 0)):
+            out[ip] = rec
+    return out
+
+def needs_probe(rec: Optional[Dict[str, Any]], mac: Optional[str], ports: Optional[List[str]],
+                ttl: Optional[int]) -> List[str]:
+    """Motivi per rifare -sV/-O sull'host (vuoto = si riusa il record)."""
+    if rec is None:
+        return ["nuovo"]
+    why = []
+    if mac and rec.get("mac") and mac.lower() != rec["mac"]:
+        why.append("mac")
+    if ports is not None and ports != rec.get("ports", []):
+        why.append("porte")
+    if ttl_class(ttl) and rec.get("ttl") and ttl_class(ttl) != ttl_class(rec["ttl"]):
+        why.append("ttl")
+    if not rec.get("probed"):
+        why.append("mai analizzato")
+    return why
+
+def _in_scope(ip: Optional[str], net) -> bool:
+    try:
+        return bool(ip) and ipaddress.ip_address(ip) in net
+    except ValueError:
+        return False
+
+def record_scan(hosts: List[Dict[str, Any]], ts: int, cidr: Optional[str] = None, scan_id: str = "",
+                ports_known: bool = True) -> Dict[str, Any]:
+    """
+    Aggiorna l'inventario con gli host di una scansione e ritorna il diff
+    {"added", "removed", "changed"}; "removed" sono gli host attivi dentro `cidr` non visti.
+    Con cidr=None (discovery fallita) o nessun host trovato non si segna nessuno come sparito.
+    """
+    net = None
+    if cidr and hosts:
+        try:
+            net = ipaddress.ip_network(cidr, strict=False)
+        except ValueError:
+            pass
+    diff: Dict[str, List[Dict[str, Any]]] = {"added": [], "removed": [], "changed": []}
+    with locked() as inv:
+        recs = inv["hosts"]
+        seen = set()
+        for h in hosts:
+            ip, mac = h.get("ip"), (h.get("mac") or None)
+            key = key_for(mac, ip)
+            rec = recs.get(key)
+            if rec is None and mac and f"ip:{ip}" in recs:
+                rec = recs.pop(f"ip:{ip}")          # ora il MAC è noto: stessa identità
+            ports = port_set(h.get("services")) if ports_known else None
+            if rec is None or rec.get("gone"):
+                rec = rec or {"first_seen": ts, "history": []}
+                rec.pop("gone", None)
+                diff["added"].append({"ip": ip, "mac": mac, "vendor": h.get("vendor")})
+            else:
+                ch: Dict[str, Any] = {}
+                if rec.get("ip") != ip:
+                    ch["ip"] = [rec.get("ip"), ip]
+                if ports is not None and ports != rec.get("ports", []):
+                    old = set(rec.get("ports", []))
+                    ch["ports"] = {"added": [p for p in ports if p not in old],
+                                   "removed": [p for p in rec.get("ports", []) if p not in set(ports)]}
+                if ttl_class(h.get("ttl")) and rec.get("ttl") and ttl_class(h["ttl"]) != ttl_class(rec["ttl"]):
+                    ch["ttl"] = [rec["ttl"], h["ttl"]]
+                os_new = (h.get("os") or {}).get("name")
+                if os_new and os_new != (rec.get("os") or {}).get("name"):
+                    ch["os"] = [(rec.get("os") or {}).get("name"), os_new]
+                if ch:
+                    diff["changed"].append({"ip": ip, "mac": mac, **ch})
+                    if "ports" in ch:
+                        rec["history"] = (rec.get("history", []) + [{"ts": ts, "scan": scan_id, **ch["ports"]}])[-HISTORY_MAX:]
+            rec.update({"ip": ip, "mac": mac or rec.get("mac"), "last_seen": ts, "last_scan": scan_id})
+            for f in ("vendor", "hostname", "os", "ttl", "asn", "as_org", "country"):
+                if h.get(f):
+                    rec[f] = h[f]
+            if ports is not None:
+                rec["ports"] = ports
+                rec["services"] = h.get("services") or []
+            if h.get("probed"):
+                rec["probed"] = ts
+            recs[key] = rec
+            seen.add(key)
+        for key, rec in recs.items():
+            if key not in seen and not rec.get("gone") and net is not None and _in_scope(rec.get("ip"), net):
+                rec["gone"] = ts
+                diff["removed"].append({"ip": rec.get("ip"), "mac": rec.get("mac"), "last_seen": rec.get("last_seen")})
+    return diff
+
+def observe(items: List[Dict[str, Any]], iface: str = "") -> int:
+    """
+    Osservazioni passive {mac, ip, ip6, names, services, dhcp_vendor, first_seen, last_seen, via}:
+    last_seen, nomi e indirizzi aggiornati, host "spariti" di nuovo attivi. Ritorna i nuovi host.
+    """
+    new = 0
+    with locked() as inv:
+        recs = inv["hosts"]
+        for o in items:
+            mac, ip = o.get("mac"), o.get("ip")
+            key = key_for(mac, ip)
+            rec = recs.get(key)
+            if rec is None and mac and ip and f"ip:{ip}" in recs:
+                rec = recs.pop(f"ip:{ip}")
+            if rec is None:
+                rec = {"first_seen": o.get("first_seen") or o.get("last_seen"), "history": []}
+                new += 1
+            rec.pop("gone", None)
+            rec["last_seen"] = max(rec.get("last_seen") or 0, o.get("last_seen") or 0)
+            for f in ("mac", "ip", "ip6", "dhcp_vendor", "vendor"):
+                if o.get(f):
+                    rec[f] = o[f]
+            if o.get("names"):
+                rec["names"] = {**(rec.get("names") or {}), **o["names"]}
+                if not rec.get("hostname"):
+                    names = rec["names"]
+                    rec["hostname"] = names.get("dhcp") or names.get("mdns") or names.get("llmnr") or names.get("netbios")
+            if o.get("services"):
+                rec["mdns_services"] = o["services"]
+            rec["passive"] = {"iface": iface, "via": o.get("via"), "ts": o.get("last_seen")}
+            recs[key] = rec
+    return new
@@ -0,0 +1,273 @@
+# /opt/netprobe/app/util/ipenrich.py
+"""
+Arricchimento offline IP -> ASN / paese da file .mmdb locali (MaxMind GeoLite2/GeoIP2
+ASN e Country/City, ipinfo country_asn/lite): nessuna chiamata di rete.
+
+Lettore MMDB minimale in puro Python sul file mappato in memoria (mmap): si attraversa
+l'albero di ricerca bit per bit e si decodifica solo il record trovato. Davanti c'è una
+cache LRU per IP; i file vengono ricaricati (e la cache svuotata) quando cambiano.
+
+Mettere i .mmdb in DB_DIR (default /var/lib/netprobe/geoip); il tipo si riconosce dal
+database_type dei metadati, o dai campi del record.
+"""
+from __future__ import annotations
+import os, mmap, struct, time, threading, ipaddress
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+DB_DIR      = Path(os.environ.get("NETPROBE_GEOIP_DIR", "/var/lib/netprobe/geoip"))
+CACHE_SIZE  = 65536
+CHECK_EVERY = 60               # s tra i controlli di file nuovi/aggiornati
+OTHER_LABEL = "altri"
+
+_META_MARKER = b"\xab\xcd\xefMaxMind.com"
+_DATA_SEP    = 16              # 16 byte a zero tra albero e sezione dati
+
+class MMDB:
+    """Un file .mmdb aperto in sola lettura e mappato in memoria."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = self._buf
+        at = buf.rfind(_META_MARKER, max(0, len(buf) - 128 * 1024))
+        if at < 0:
+            raise ValueError(f"{path}: metadati MaxMind non trovati")
+        meta_start = at + len(_META_MARKER)
+        self.meta, _ = self._decode(meta_start, meta_start)
+        self.node_count = int(self.meta["node_count"])
+        self.record_size = int(self.meta["record_size"])
+        if self.record_size not in (24, 28, 32):
+            raise ValueError(f"{path}: record_size {self.record_size} non supportato")
+        self.ip_version = int(self.meta.get("ip_version", 6))
+        self.db_type = str(self.meta.get("database_type", ""))
+        self._node_bytes = self.record_size // 4
+        self._tree_size = self._node_bytes * self.node_count
+        self._data = self._tree_size + _DATA_SEP
+        self._v4_start = 0
+        if self.ip_version == 6:
+            # IPv4 nei db v6: nodo raggiunto dopo 96 bit a zero
+            node = 0
+            for _ in range(96):
+                if node >= self.node_count:
+                    break
+                node = self._record(node, 0)
+            self._v4_start = node
+
+    def close(self):
+        self._buf.close()
+
+    # ----- albero di ricerca -----
+    def _record(self, node: int, bit: int) -> int:
+        b = self._buf
+        off = node * self._node_bytes
+        if self.record_size == 24:
+            p = off + bit * 3
+            return (b[p] << 16) | (b[p + 1] << 8) | b[p + 2]
+        if self.record_size == 28:
+            mid = b[off + 3]
+            if bit == 0:
+                return ((mid & 0xF0) << 20) | (b[off] << 16) | (b[off + 1] << 8) | b[off + 2]
+            return ((mid & 0x0F) << 24) | (b[off + 4] << 16) | (b[off + 5] << 8) | b[off + 6]
+        return struct.unpack_from(">I", b, off + bit * 4)[0]
+
+    def get(self, ip: str) -> Optional[dict]:
+        addr = ipaddress.ip_address(ip)
+        if addr.version == 6 and addr.ipv4_mapped:
+            addr = addr.ipv4_mapped
+        if addr.version == 6 and self.ip_version == 4:
+            return None
+        packed = addr.packed
+        node = self._v4_start if addr.version == 4 else 0
+        for i in range(len(packed) * 8):
+            if node >= self.node_count:
+                break
+            node = self._record(node, (packed[i >> 3] >> (7 - (i & 7))) & 1)
+        if node <= self.node_count:
+            return None     # == node_count: nessun dato per l'indirizzo
+        rec, _ = self._decode(self._data + node - self.node_count - _DATA_SEP, self._data)
+        return rec if isinstance(rec, dict) else None
+
+    # ----- sezione dati -----
+    def _decode(self, off: int, base: int):
+        """(valore, offset successivo); i puntatori sono relativi a `base`."""
+        b = self._buf
+        ctrl = b[off]; off += 1
+        typ = ctrl >> 5
+        if typ == 1:   # puntatore
+            ss, v = (ctrl >> 3) & 3, ctrl & 7
+            if ss == 0:
+                ptr = (v << 8) | b[off]
+            elif ss == 1:
+                ptr = ((v << 16) | (b[off] << 8) | b[off + 1]) + 2048
+            elif ss == 2:
+                ptr = ((v << 24) | (b[off] << 16) | (b[off + 1] << 8) | b[off + 2]) + 526336
+            else:
+                ptr = struct.unpack_from(">I", b, off)[0]
+            val, _ = self._decode(base + ptr, base)
+            return val, off + ss + 1
+        if typ == 0:   # tipo esteso
+            typ = 7 + b[off]; off += 1
+        size = ctrl & 0x1F
+        if size >= 29:
+            n = size - 28
+            extra = int.from_bytes(b[off:off + n], "big"); off += n
+            size = (29, 285, 65821)[n - 1] + extra
+        if typ == 2:
+            return b[off:off + size].decode("utf-8", "replace"), off + size
+        if typ == 7:
+            out = {}
+            for _ in range(size):
+                k, off = self._decode(off, base)
+                out[k], off = self._decode(off, base)
+            return out, off
+        if typ == 11:
+            arr = []
+            for _ in range(size):
+                v, off = self._decode(off, base)
+                arr.append(v)
+            return arr, off
+        if typ in (5, 6, 9, 10):
+            return int.from_bytes(b[off:off + size], "big"), off + size
+        if typ == 8:
+            return int.from_bytes(b[off:off + size], "big", signed=size == 4), off + size
+        if typ == 3:
+            return struct.unpack_from(">d", b, off)[0], off + 8
+        if typ == 15:
+            return struct.unpack_from(">f", b, off)[0], off + 4
+        if typ == 14:
+            return bool(size), off
+        if typ == 4:
+            return bytes(b[off:off + size]), off + size
+        raise ValueError(f"tipo mmdb {typ} non supportato")
+
+# ----------------- db caricati -----------------
+_lock = threading.Lock()
+_dbs: List[MMDB] = []
+_sig: Tuple = ()
+_checked = 0.0
+
+def _signature() -> Tuple:
+    try:
+        files = sorted(p for p in DB_DIR.iterdir() if p.suffix == ".mmdb")
+    except OSError:
+        return ()
+    out = []
+    for p in files:
+        try:
+            st = p.stat()
+            out.append((str(p), st.st_mtime_ns, st.st_size))
+        except OSError:
+            pass
+    return tuple(out)
+
+def _refresh():
+    global _dbs, _sig, _checked
+    now = time.monotonic()
+    if now - _checked < CHECK_EVERY and _checked:
+        return
+    with _lock:
+        _checked = now
+        sig = _signature()
+        if sig == _sig:
+            return
+        old, new = _dbs, []
+        for path, _, _ in sig:
+            try:
+                new.append(MMDB(path))
+            except Exception:
+                continue
+        _dbs, _sig = new, sig
+        _lookup.cache_clear()
+        for db in old:
+            try:
+                db.close()
+            except Exception:
+                pass
+
+def available() -> bool:
+    _refresh()
+    return bool(_dbs)
+
+def databases() -> List[dict]:
+    _refresh()
+    return [{"file": os.path.basename(d.path), "type": d.db_type,
+             "build": d.meta.get("build_epoch"), "nodes": d.node_count} for d in _dbs]
+
+def _merge_record(info: dict, rec: dict):
+    # MaxMind ASN
+    if "autonomous_system_number" in rec:
+        info["asn"] = info["asn"] or int(rec["autonomous_system_number"])
+        info["as_org"] = info["as_org"] or str(rec.get("autonomous_system_organization") or "")
+    # ipinfo: "asn": "AS123", "as_name"
+    asn = rec.get("asn")
+    if isinstance(asn, str) and asn.upper().startswith("AS") and asn[2:].isdigit():
+        info["asn"] = info["asn"] or int(asn[2:])
+        info["as_org"] = info["as_org"] or str(rec.get("as_name") or "")
+    # MaxMind Country/City: {"country": {"iso_code"}} ; ipinfo: "country_code" / "country"
+    c = rec.get("country")
+    if isinstance(c, dict):
+        info["country"] = info["country"] or str(c.get("iso_code") or "")
+    elif isinstance(rec.get("country_code"), str):
+        info["country"] = info["country"] or rec["country_code"]
+    elif isinstance(c, str) and len(c) == 2:
+        info["country"] = info["country"] or c
+    if not info["country"] and isinstance(rec.get("registered_country"), dict):
+        info["country"] = str(rec["registered_country"].get("iso_code") or "")
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _lookup(ip: str) -> Tuple[Optional[int], str, str]:
+    info = {"asn": None, "as_org": "", "country": ""}
+    for db in _dbs:
+        try:
+            rec = db.get(ip)
+        except Exception:
+            continue
+        if rec:
+            _merge_record(info, rec)
+    return info["asn"], info["as_org"], info["country"]
+
+def lookup(ip: str) -> Optional[dict]:
+    """{"asn", "as_org", "country"} per un IP pubblico; None se privato/non valido/senza db."""
+    _refresh()
+    if not _dbs or not ip:
+        return None
+    try:
+        addr = ipaddress.ip_address(ip)
+    except ValueError:
+        return None
+    if addr.version == 6 and addr.ipv4_mapped:
+        addr = addr.ipv4_mapped
+    if not addr.is_global:
+        return None
+    asn, org, country = _lookup(str(addr))
+    if asn is None and not country:
+        return None
+    return {"asn": asn, "as_org": org, "country": country}
+
+def annotate(ips: Iterable[str]) -> Dict[str, dict]:
+    """Mappa ip -> info per gli IP che hanno un risultato."""
+    out = {}
+    for ip in ips:
+        if ip not in out:
+            info = lookup(ip)
+            if info:
+                out[ip] = info
+    return out
+
+def group_key(info: Optional[dict], by: str) -> str:
+    if not info:
+        return OTHER_LABEL
+    if by == "asn":
+        return f"AS{info['asn']} {info['as_org']}".strip() if info.get("asn") else OTHER_LABEL
+    return info.get("country") or OTHER_LABEL
+
+def aggregate(items: Iterable[Tuple[str, int]], by: str, n: int = 20) -> List[Tuple[str, int]]:
+    """[(ip, valore)] -> [(ASN o paese, somma)] decrescente; privati/sconosciuti in "altri"."""
+    acc: Dict[str, int] = {}
+    for ip, v in items:
+        k = group_key(lookup(ip), by)
+        acc[k] = acc.get(k, 0) + int(v)
+    return sorted(acc.items(), key=lambda kv: kv[1], reverse=True)[:n]
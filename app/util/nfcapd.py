@@ -0,0 +1,253 @@
+# /opt/netprobe/app/util/nfcapd.py
+"""
+Lettore nativo dei file nfcapd (layout nfdump 1.7, record V3).
+
+Legge header, blocchi dati (non compressi, LZ4, LZO, BZ2, ZSTD) e i record V3
+estraendo solo i campi che aggreghiamo; ogni blocco diventa un array strutturato
+NumPy (FLOW_DTYPE). Niente subprocess nfdump né conversione CSV -> testo -> int.
+
+Indirizzi in "src"/"dst" come 16 byte (IPv4 mappato ::ffff:a.b.c.d), così np.unique
+lavora sui byte grezzi e la stringa si costruisce solo per le chiavi distinte.
+Formati non gestiti (layout 1.6, cifratura, LZO senza python-lzo) -> ValueError:
+il chiamante ripiega su nfdump.
+"""
+from __future__ import annotations
+import os, bz2, struct, datetime, ipaddress
+from typing import Iterator, List, Optional
+
+try:
+    import numpy as np
+except Exception:  # numpy opzionale: senza, il lettore nativo non è disponibile
+    np = None  # type: ignore
+try:
+    import lz4.block as _lz4  # type: ignore
+except Exception:
+    _lz4 = None
+try:
+    import lzo as _lzo  # type: ignore  (python-lzo)
+except Exception:
+    _lzo = None
+try:
+    import zstandard as _zstd  # type: ignore
+except Exception:
+    _zstd = None
+
+MAGIC            = 0xA50C
+LAYOUT_VERSION_2 = 2
+NOT_COMPRESSED, LZO_COMPRESSED, BZ2_COMPRESSED, LZ4_COMPRESSED, ZSTD_COMPRESSED = 0, 1, 2, 3, 4
+DATA_BLOCK_TYPE_3 = 3
+BLOCK_UNCOMPRESSED = 0x1       # dataBlock.flags bit 0: blocco scritto senza compressione
+V3_RECORD  = 11
+EX_GENERIC, EX_IPV4, EX_IPV6 = 1, 2, 3
+_BUFFSIZE  = 5 * 1048576       # BUFFSIZE di nfdump: massimo blocco decompresso
+
+_FILE_HDR  = struct.Struct("<HHIQBBHIQII")   # fileHeaderV2_t (40 byte)
+_BLOCK_HDR = struct.Struct("<IIHH")          # dataBlock_t (12 byte)
+_REC_HDR   = struct.Struct("<HH")            # recordHeader_t
+_ELEM_HDR  = struct.Struct("<HH")            # elementHeader_t (length include l'header)
+_V3_HDR_SIZE = 12                            # recordHeaderV3_t
+_GENERIC   = struct.Struct("<QQQQQHHBBBB")   # EXgenericFlow_t
+_IPV4      = struct.Struct("<II")            # EXipv4Flow_t (ordine host)
+_IPV6      = struct.Struct("<QQQQ")          # EXipv6Flow_t (2 x uint64 ordine host per indirizzo)
+_V4_PREFIX = b"\0" * 10 + b"\xff\xff"
+_NO_ADDR   = b"\0" * 16
+
+FLOW_DTYPE = None if np is None else np.dtype([
+    ("first", "<u8"), ("last", "<u8"),       # epoch ms
+    ("pkts", "<u8"), ("bytes", "<u8"),
+    ("sport", "<u2"), ("dport", "<u2"), ("proto", "u1"),
+    ("src", "V16"), ("dst", "V16"),
+])
+
+# nomi come li stampa nfdump (colonna "pr"), per chiavi coerenti con il percorso CSV
+PROTO_NAMES = {1: "ICMP", 2: "IGMP", 4: "IPIP", 6: "TCP", 17: "UDP", 41: "IPv6", 47: "GRE",
+               50: "ESP", 51: "AH", 58: "ICMP6", 89: "OSPF", 103: "PIM", 112: "VRRP", 132: "SCTP"}
+
+def available() -> bool:
+    return np is not None
+
+def proto_name(p: int) -> str:
+    return PROTO_NAMES.get(int(p), str(int(p)))
+
+def port_key(proto: int, dport: int) -> str:
+    """Porta dst come stringa; per ICMP nfdump codifica tipo.codice nella porta."""
+    if proto in (1, 58):
+        return f"{dport >> 8}.{dport & 0xFF}"
+    return str(int(dport))
+
+def ip_str(raw: bytes) -> str:
+    if raw == _NO_ADDR:
+        return ""
+    if raw[:12] == _V4_PREFIX:
+        return str(ipaddress.IPv4Address(raw[12:]))
+    return str(ipaddress.IPv6Address(raw))
+
+# ----------------- decompressione -----------------
+def _lz4_py(src: bytes) -> bytes:
+    """Decompressore LZ4 block puro Python (se manca il modulo lz4)."""
+    dst = bytearray()
+    i, n = 0, len(src)
+    while i < n:
+        tok = src[i]; i += 1
+        lit = tok >> 4
+        if lit == 15:
+            while True:
+                b = src[i]; i += 1; lit += b
+                if b != 255:
+                    break
+        dst += src[i:i + lit]; i += lit
+        if i >= n:
+            break
+        off = src[i] | (src[i + 1] << 8); i += 2
+        ml = tok & 15
+        if ml == 15:
+            while True:
+                b = src[i]; i += 1; ml += b
+                if b != 255:
+                    break
+        ml += 4
+        start = len(dst) - off
+        if off <= 0 or start < 0:
+            raise ValueError("LZ4: offset non valido")
+        if off >= ml:
+            dst += dst[start:start + ml]
+        else:
+            seg = dst[start:]
+            dst += (seg * (ml // off + 1))[:ml]
+    return bytes(dst)
+
+def _decompress(kind: int, data: bytes, bufsize: int) -> bytes:
+    if kind == NOT_COMPRESSED:
+        return data
+    if kind == LZ4_COMPRESSED:
+        return _lz4.decompress(data, uncompressed_size=bufsize) if _lz4 else _lz4_py(data)
+    if kind == LZO_COMPRESSED:
+        if _lzo is None:
+            raise ValueError("file LZO: serve python-lzo")
+        return _lzo.decompress(data, False, bufsize)
+    if kind == BZ2_COMPRESSED:
+        return bz2.decompress(data)
+    if kind == ZSTD_COMPRESSED:
+        if _zstd is None:
+            raise ValueError("file ZSTD: serve zstandard")
+        return _zstd.ZstdDecompressor().decompress(data, max_output_size=bufsize)
+    raise ValueError(f"compressione {kind} non supportata")
+
+# ----------------- record -----------------
+def _v3_row(buf: bytes, off: int, end: int):
+    nel = buf[off + 4]
+    p = off + _V3_HDR_SIZE
+    gen = None
+    src = dst = _NO_ADDR
+    for _ in range(nel):
+        if p + 4 > end:
+            break
+        etype, elen = _ELEM_HDR.unpack_from(buf, p)
+        if elen < 4 or p + elen > end:
+            break
+        if etype == EX_GENERIC:
+            gen = _GENERIC.unpack_from(buf, p + 4)
+        elif etype == EX_IPV4:
+            s, d = _IPV4.unpack_from(buf, p + 4)
+            src = _V4_PREFIX + s.to_bytes(4, "big")
+            dst = _V4_PREFIX + d.to_bytes(4, "big")
+        elif etype == EX_IPV6:
+            s0, s1, d0, d1 = _IPV6.unpack_from(buf, p + 4)
+            src = s0.to_bytes(8, "big") + s1.to_bytes(8, "big")
+            dst = d0.to_bytes(8, "big") + d1.to_bytes(8, "big")
+        p += elen
+    if gen is None:
+        return None
+    first, last, _recv, pkts, byts, sport, dport, proto = gen[:8]
+    return (first, last, pkts, byts, sport, dport, proto, src, dst)
+
+def _block_rows(buf: bytes, nrec: int) -> List[tuple]:
+    rows = []
+    off, end = 0, len(buf)
+    for _ in range(nrec):
+        if off + 4 > end:
+            break
+        rtype, rsize = _REC_HDR.unpack_from(buf, off)
+        if rsize < 4 or off + rsize > end:
+            raise ValueError("record corrotto")
+        if rtype == V3_RECORD:
+            row = _v3_row(buf, off, off + rsize)
+            if row is not None:
+                rows.append(row)
+        off += rsize
+    return rows
+
+# ----------------- file -----------------
+def read(path: str) -> Iterator["np.ndarray"]:
+    """Un array FLOW_DTYPE per blocco dati del file (blocchi senza flussi saltati)."""
+    if np is None:
+        raise ValueError("numpy non disponibile")
+    with open(path, "rb") as f:
+        hdr = f.read(_FILE_HDR.size)
+        if len(hdr) < _FILE_HDR.size:
+            raise ValueError("header troncato")
+        (magic, version, _nfdv, _created, compression, encryption,
+         _nappx, _creator, off_appendix, block_size, _nblocks) = _FILE_HDR.unpack(hdr)
+        if magic != MAGIC:
+            raise ValueError("non è un file nfcapd")
+        if version != LAYOUT_VERSION_2:
+            raise ValueError(f"layout {version} non supportato (serve nfdump >= 1.7)")
+        if encryption:
+            raise ValueError("file cifrato")
+        bufsize = max(block_size or 0, _BUFFSIZE)
+        pos = _FILE_HDR.size
+        while not off_appendix or pos < off_appendix:
+            bh = f.read(_BLOCK_HDR.size)
+            if len(bh) < _BLOCK_HDR.size:
+                break
+            nrec, size, btype, flags = _BLOCK_HDR.unpack(bh)
+            data = f.read(size)
+            if len(data) < size:
+                break   # file in scrittura/troncato: ci fermiamo all'ultimo blocco completo
+            pos += _BLOCK_HDR.size + size
+            if btype != DATA_BLOCK_TYPE_3 or not nrec:
+                continue
+            buf = data if flags & BLOCK_UNCOMPRESSED else _decompress(compression, data, bufsize)
+            rows = _block_rows(buf, nrec)
+            if rows:
+                yield np.array(rows, dtype=FLOW_DTYPE)
+
+def file_time(name: str) -> Optional[int]:
+    """nfcapd.YYYYMMDDhhmm (ora locale, inizio slot) -> epoch."""
+    if not name.startswith("nfcapd.") or not name[7:].isdigit() or len(name) != 19:
+        return None
+    try:
+        return int(datetime.datetime.strptime(name[7:], "%Y%m%d%H%M").timestamp())
+    except Exception:
+        return None
+
+def files_between(root: str, t_start: int, t_end: int, exclude: str = "") -> List[str]:
+    """
+    File ruotati con slot in [t_start, t_end], in ordine; pota le dir %Y/%m/%d fuori range
+    e, con `exclude`, le sottodirectory di primo livello con quel prefisso.
+    """
+    days = set()
+    d = datetime.date.fromtimestamp(t_start)
+    last = datetime.date.fromtimestamp(t_end)
+    while d <= last:
+        days.update({d.strftime("%Y"), d.strftime("%Y/%m"), d.strftime("%Y/%m/%d")})
+        d += datetime.timedelta(days=1)
+    out = []
+    for dirpath, dirnames, files in os.walk(root, followlinks=True):
+        rel = os.path.relpath(dirpath, root)
+        keep = []
+        for dn in dirnames:
+            if exclude and rel == "." and dn.startswith(exclude):
+                continue
+            sub = dn if rel == "." else f"{rel}/{dn}"
+            parts = sub.split("/")
+            if all(p.isdigit() for p in parts) and len(parts) <= 3 and sub not in days:
+                continue
+            keep.append(dn)
+        dirnames[:] = keep
+        for fn in files:
+            ts = file_time(fn)
+            if ts is not None and t_start <= ts <= t_end:
+                out.append((fn, os.path.join(dirpath, fn)))
+    out.sort()
+    return [fp for _, fp in out]
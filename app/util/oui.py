@@ -0,0 +1,202 @@
+# /opt/netprobe/app/util/oui.py
+"""
+Vendor da MAC con tabella OUI precompilata (MA-L 24 bit, MA-M 28 bit, MA-S 36 bit).
+
+I file IEEE (oui.txt, mam.txt, oui36.txt del pacchetto ieee-data) vengono compilati una
+volta in TABLE_FILE: record ordinati (bits << 48 | inizio prefisso nello spazio MAC a
+48 bit, offset del nome) + tabella nomi deduplicata. A runtime il file è mappato in
+memoria al primo lookup (nessun costo all'avvio dell'API) e si fa una ricerca binaria
+per lunghezza di prefisso, dalla più specifica. Se i sorgenti sono più recenti della
+tabella, questa viene ricompilata (file temporaneo per processo: API e netmappassived
+possono farlo insieme). Se TABLE_FILE non è scrivibile la tabella resta solo in memoria;
+senza sorgenti né tabella si riprova dopo RETRY secondi.
+"""
+from __future__ import annotations
+import os, re, mmap, time, struct, tempfile, threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+SOURCES = [
+    "/usr/share/ieee-data/oui.txt", "/usr/share/ieee-data/mam.txt", "/usr/share/ieee-data/oui36.txt",
+    "/usr/share/ieee-oui/oui.txt",
+]
+TABLE_FILE = Path(os.environ.get("NETPROBE_OUI_TABLE", "/var/lib/netprobe/oui.bin"))
+RETRY      = 300
+
+_MAGIC = b"NPOUI01\0"
+_HDR   = struct.Struct("<8sIIQ")     # magic, record, offset nomi, mtime sorgenti (ns)
+_REC   = struct.Struct("<QI")        # chiave (bits << 48 | inizio), offset nome
+_BITS  = (36, 28, 24)
+
+_HEX_RE  = re.compile(r"^([0-9A-F]{2})-([0-9A-F]{2})-([0-9A-F]{2})\s+\(hex\)\s+(.*)$", re.I)
+_B16_RE  = re.compile(r"^([0-9A-F]{6})(?:-([0-9A-F]{6}))?\s+\(base 16\)\s*(.*)$", re.I)
+
+def _src_mtime(sources: List[str]) -> int:
+    m = 0
+    for p in sources:
+        try:
+            m = max(m, os.stat(p).st_mtime_ns)
+        except OSError:
+            pass
+    return m
+
+def parse(path: str) -> List[Tuple[int, int, str]]:
+    """[(bits, inizio a 48 bit, vendor)] da un file IEEE; il range "(base 16)" dà MA-M/MA-S."""
+    out = []
+    oui, vendor = None, ""
+    with open(path, encoding="utf-8", errors="ignore") as f:
+        for line in f:
+            s = line.strip()
+            m = _HEX_RE.match(s)
+            if m:
+                oui = int(m.group(1) + m.group(2) + m.group(3), 16)
+                vendor = m.group(4).strip()
+                continue
+            m = _B16_RE.match(s)
+            if not m or oui is None:
+                continue
+            if m.group(2):
+                lo, hi = int(m.group(1), 16), int(m.group(2), 16)
+                bits = 48 - (hi - lo + 1).bit_length() + 1
+                start = (oui << 24) | lo
+            else:
+                bits, start = 24, oui << 24
+            if bits in _BITS:
+                out.append((bits, start, vendor or m.group(3).strip()))
+            oui = None
+    return out
+
+def build(sources: List[str]) -> bytes:
+    """Tabella compilata (header + record + nomi) dai sorgenti indicati."""
+    entries: Dict[int, str] = {}
+    for p in sources:
+        for bits, start, vendor in parse(p):
+            entries.setdefault((bits << 48) | start, vendor)
+    names: Dict[str, int] = {}
+    blob = bytearray()
+    recs = []
+    for key in sorted(entries):
+        name = entries[key].encode("utf-8")[:255]
+        off = names.get(entries[key])
+        if off is None:
+            off = names[entries[key]] = len(blob)
+            blob += bytes([len(name)]) + name
+        recs.append(_REC.pack(key, off))
+    names_off = _HDR.size + _REC.size * len(recs)
+    return _HDR.pack(_MAGIC, len(recs), names_off, _src_mtime(sources)) + b"".join(recs) + bytes(blob)
+
+def _write(data: bytes, dest: Path):
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=dest.name + ".", suffix=".tmp", dir=dest.parent)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, dest)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+def compile_table(sources: Optional[List[str]] = None, dest: Path = TABLE_FILE) -> int:
+    """Compila i sorgenti presenti in `dest` (scrittura atomica); ritorna il numero di prefissi."""
+    sources = [p for p in (sources or SOURCES) if os.path.exists(p)]
+    data = build(sources)
+    _write(data, dest)
+    return _HDR.unpack_from(data, 0)[1]
+
+class _Table:
+    def __init__(self, buf):
+        self.buf = buf          # mmap del file o bytes (tabella solo in memoria)
+        magic, self.count, self.names, self.src_mtime = _HDR.unpack_from(self.buf, 0)
+        if magic != _MAGIC:
+            raise ValueError("tabella OUI non valida")
+
+    @classmethod
+    def open(cls, path: Path) -> "_Table":
+        with open(path, "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return cls(buf)
+        except Exception:
+            buf.close()
+            raise
+
+    def close(self):
+        if isinstance(self.buf, mmap.mmap):
+            self.buf.close()
+
+    def _key(self, i: int) -> int:
+        return _REC.unpack_from(self.buf, _HDR.size + i * _REC.size)[0]
+
+    def get(self, key: int) -> Optional[str]:
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo >= self.count or self._key(lo) != key:
+            return None
+        off = self.names + _REC.unpack_from(self.buf, _HDR.size + lo * _REC.size)[1]
+        n = self.buf[off]
+        return self.buf[off + 1:off + 1 + n].decode("utf-8", "replace")
+
+_table: Optional[_Table] = None
+_next_try = 0.0         # monotonic; inf = tabella caricata
+_lock = threading.Lock()
+
+def _load() -> Optional[_Table]:
+    global _table, _next_try
+    if time.monotonic() < _next_try:
+        return _table
+    with _lock:
+        if time.monotonic() < _next_try:
+            return _table
+        t = None
+        try:
+            sources = [p for p in SOURCES if os.path.exists(p)]
+            src = _src_mtime(sources)
+            try:
+                t = _Table.open(TABLE_FILE) if TABLE_FILE.exists() else None
+            except (OSError, ValueError):
+                t = None
+            if t is None or (src and t.src_mtime < src):
+                if src:
+                    data = build(sources)
+                    if t is not None:
+                        t.close()
+                    try:
+                        _write(data, TABLE_FILE)
+                        t = _Table.open(TABLE_FILE)
+                    except OSError:
+                        t = _Table(data)    # directory non scrivibile: tabella solo in memoria
+        except Exception:
+            pass
+        _table = t
+        _next_try = float("inf") if t is not None else time.monotonic() + RETRY
+    return _table
+
+def _mac_int(mac: str) -> Optional[int]:
+    h = re.sub(r"[^0-9A-Fa-f]", "", mac or "")
+    if len(h) < 12:
+        return None
+    return int(h[:12], 16)
+
+def vendor(mac: Optional[str]) -> Optional[str]:
+    """Vendor del prefisso più specifico (36 > 28 > 24 bit), None se sconosciuto."""
+    m = _mac_int(mac or "")
+    if m is None:
+        return None
+    t = _load()
+    if t is None:
+        return None
+    for bits in _BITS:
+        mask = ((1 << bits) - 1) << (48 - bits)
+        v = t.get((bits << 48) | (m & mask))
+        if v:
+            return v
+    return None
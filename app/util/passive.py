@@ -0,0 +1,297 @@
+# /opt/netprobe/app/util/passive.py
+"""
+Scoperta passiva degli host: ARP, DHCP, mDNS, LLMNR e NetBIOS (NS/datagram).
+
+Socket AF_PACKET con un filtro BPF classico agganciato nel kernel (SO_ATTACH_FILTER):
+in userspace arrivano solo ARP e i datagrammi UDP sulle porte di FILTER_PORTS (IPv4 e
+IPv6 senza header di estensione), tutto il resto viene scartato prima della copia.
+
+parse() trasforma un frame in osservazioni {mac, ip, ...}; Tracker le accumula per MAC
+con campi fissi (servizi mDNS limitati a MAX_SERVICES, al più MAX_HOSTS host, i meno
+recenti escono per primi) e drain() restituisce i record cambiati da passare a
+hostinv.observe().
+"""
+from __future__ import annotations
+import ctypes, socket, struct, ipaddress
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+FILTER_PORTS = (67, 68, 137, 138, 5353, 5355)
+SNAPLEN      = 2048
+MAX_HOSTS    = 65536
+MAX_SERVICES = 8
+
+ETH_P_ALL        = 0x0003
+SO_ATTACH_FILTER = 26
+PACKET_OUTGOING  = 4
+
+# ----------------- filtro BPF -----------------
+_LD_H_ABS, _LD_B_ABS, _LD_H_IND, _LDX_B_MSH = 0x28, 0x30, 0x48, 0xb1
+_JA, _JEQ, _JSET, _RET = 0x05, 0x15, 0x45, 0x06
+
+def _asm(prog: List[tuple]) -> bytes:
+    """(code, jt, jf, k) o ("label", nome); jt/jf (e k di JA) possono essere nomi di etichetta."""
+    labels, pc = {}, 0
+    for ins in prog:
+        if ins[0] == "label":
+            labels[ins[1]] = pc
+        else:
+            pc += 1
+    out, pc = [], 0
+    for ins in prog:
+        if ins[0] == "label":
+            continue
+        code, jt, jf, k = ins
+        jt, jf, k = [t if isinstance(t, int) else labels[t] - pc - 1 for t in (jt, jf, k)]
+        out.append(struct.pack("HBBI", code, jt, jf, k))
+        pc += 1
+    return b"".join(out)
+
+def _port_checks() -> List[tuple]:
+    return [(_JEQ, "accept", 0, p) for p in FILTER_PORTS]
+
+def bpf_program() -> bytes:
+    """arp or (udp and (src or dst port in FILTER_PORTS)), IPv4 non frammentato o IPv6."""
+    return _asm([
+        (_LD_H_ABS, 0, 0, 12),
+        (_JEQ, "accept", 0, 0x0806),
+        (_JEQ, 0, "ip6", 0x0800),
+        (_LD_B_ABS, 0, 0, 23),
+        (_JEQ, 0, "drop", 17),
+        (_LD_H_ABS, 0, 0, 20),
+        (_JSET, "drop", 0, 0x1fff),
+        (_LDX_B_MSH, 0, 0, 14),
+        (_LD_H_IND, 0, 0, 14),
+        *_port_checks(),
+        (_LD_H_IND, 0, 0, 16),
+        *_port_checks(),
+        (_JA, 0, 0, "drop"),
+        ("label", "ip6"),
+        (_JEQ, 0, "drop", 0x86dd),
+        (_LD_B_ABS, 0, 0, 20),
+        (_JEQ, 0, "drop", 17),
+        (_LD_H_ABS, 0, 0, 54),
+        *_port_checks(),
+        (_LD_H_ABS, 0, 0, 56),
+        *_port_checks(),
+        ("label", "drop"),
+        (_RET, 0, 0, 0),
+        ("label", "accept"),
+        (_RET, 0, 0, SNAPLEN),
+    ])
+
+def open_socket(iface: str) -> socket.socket:
+    """Socket raw sull'interfaccia con il filtro già nel kernel (serve CAP_NET_RAW)."""
+    sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+    prog = bpf_program()
+    buf = ctypes.create_string_buffer(prog)
+    fprog = struct.pack("HL", len(prog) // 8, ctypes.addressof(buf))
+    sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+    sock.bind((iface, ETH_P_ALL))
+    # frame arrivati tra socket() e il filtro: si scartano
+    sock.setblocking(False)
+    try:
+        while sock.recv(SNAPLEN):
+            pass
+    except BlockingIOError:
+        pass
+    return sock
+
+# ----------------- parser -----------------
+def _mac(b: bytes) -> Optional[str]:
+    if len(b) != 6 or b[0] & 1 or b == b"\0" * 6:
+        return None         # multicast/broadcast/nullo: non identifica un host
+    return ":".join(f"{x:02x}" for x in b)
+
+def _ip4(b: bytes) -> Optional[str]:
+    return socket.inet_ntoa(b) if len(b) == 4 and b != b"\0\0\0\0" and b != b"\xff\xff\xff\xff" else None
+
+def _dns_name(buf: bytes, off: int) -> Tuple[str, int]:
+    labels, end, hops = [], None, 0
+    while True:
+        ln = buf[off]
+        if ln & 0xC0 == 0xC0:
+            if end is None:
+                end = off + 2
+            off = ((ln & 0x3F) << 8) | buf[off + 1]
+            hops += 1
+            if hops > 32:
+                raise ValueError("loop di compressione")
+            continue
+        off += 1
+        if ln == 0:
+            break
+        labels.append(buf[off:off + ln].decode("utf-8", "replace"))
+        off += ln
+    return ".".join(labels), (end if end is not None else off)
+
+def _dns(p: bytes, src: bytes) -> Tuple[Optional[str], List[str]]:
+    """(nome con A/AAAA = indirizzo sorgente, tipi di servizio DNS-SD) da una risposta mDNS/LLMNR."""
+    _, flags, qd, an, ns, ar = struct.unpack_from("!HHHHHH", p, 0)
+    if not flags & 0x8000:
+        return None, []
+    off = 12
+    for _ in range(qd):
+        _, off = _dns_name(p, off)
+        off += 4
+    name, services = None, []
+    for _ in range(an + ns + ar):
+        owner, off = _dns_name(p, off)
+        rtype, _, _, rdlen = struct.unpack_from("!HHIH", p, off)
+        off += 10
+        rdata = p[off:off + rdlen]
+        if rtype in (1, 28) and rdata == src and not name:
+            name = owner
+        elif rtype == 12 and owner.startswith("_") and "._" in owner:
+            svc = ".".join(owner.split(".")[:2])
+            if svc not in services and not svc.startswith("_services"):
+                services.append(svc)
+        off += rdlen
+    if name:
+        name = name[:-6] if name.endswith(".local") else name
+    return name, services[:MAX_SERVICES]
+
+def _nb_decode(p: bytes, off: int) -> Tuple[Optional[str], int, int]:
+    """Nome NetBIOS di primo livello -> (nome, suffisso, offset dopo il nome)."""
+    if p[off] != 0x20:
+        return None, 0, off
+    enc = p[off + 1:off + 33]
+    raw = bytes(((enc[i] - 0x41) << 4) | (enc[i + 1] - 0x41) for i in range(0, 32, 2))
+    return raw[:15].decode("ascii", "replace").strip(), raw[15], off + 34
+
+def _nbns(p: bytes) -> Optional[Tuple[str, Optional[str]]]:
+    """Registrazioni/refresh e risposte positive: (nome unico, indirizzo)."""
+    _, flags, qd, an, ns, ar = struct.unpack_from("!HHHHHH", p, 0)
+    opcode, rcode = (flags >> 11) & 0xF, flags & 0xF
+    if rcode or not ((opcode in (5, 8, 9) and qd and ar) or (flags & 0x8000 and opcode == 0 and an)):
+        return None
+    name, suffix, off = _nb_decode(p, 12)
+    if name is None or suffix not in (0x00, 0x20) or name.startswith("\x01"):
+        return None
+    if qd:
+        off += 4                # tipo/classe della domanda
+        off += 2                # puntatore al nome nel record aggiuntivo
+    off += 4 + 4 + 2            # tipo, classe, ttl, rdlength
+    nb_flags = struct.unpack_from("!H", p, off)[0]
+    if nb_flags & 0x8000:       # nome di gruppo (workgroup/dominio)
+        return None
+    return name, _ip4(p[off + 2:off + 6])
+
+def parse(frame: bytes) -> List[Dict[str, Any]]:
+    """Osservazioni {mac, ip|ip6, via, names?, services?, dhcp_vendor?} da un frame Ethernet."""
+    try:
+        return _parse(frame)
+    except (IndexError, struct.error, ValueError):
+        return []
+
+def _parse(f: bytes) -> List[Dict[str, Any]]:
+    etype = struct.unpack_from("!H", f, 12)[0]
+    src_mac = _mac(f[6:12])
+    if etype == 0x0806:
+        if struct.unpack_from("!HHBB", f, 14) != (1, 0x0800, 6, 4):
+            return []
+        mac, ip = _mac(f[22:28]), _ip4(f[28:32])
+        return [{"mac": mac, "ip": ip, "via": "arp"}] if mac and ip else []
+    if etype == 0x0800:
+        ihl = (f[14] & 0xF) * 4
+        src, l4 = f[26:30], 14 + ihl
+        obs: Dict[str, Any] = {"mac": src_mac, "ip": _ip4(src)}
+    elif etype == 0x86DD:
+        src, l4 = f[22:38], 54
+        obs = {"mac": src_mac, "ip6": str(ipaddress.IPv6Address(src))}
+    else:
+        return []
+    sport, dport = struct.unpack_from("!HH", f, l4)
+    p = f[l4 + 8:]
+    ports = {sport, dport}
+    out = []
+    if ports & {67, 68} and etype == 0x0800:
+        out += _dhcp(p)
+        obs["via"] = "dhcp"
+    elif ports & {5353, 5355}:
+        via = "mdns" if 5353 in ports else "llmnr"
+        name, services = _dns(p, src)
+        obs["via"] = via
+        if name:
+            obs["names"] = {via: name}
+        if services:
+            obs["services"] = services
+    elif sport == 137 or dport == 137:
+        nb = _nbns(p)
+        obs["via"] = "netbios"
+        if nb and (nb[1] is None or nb[1] == obs.get("ip")):
+            obs["names"] = {"netbios": nb[0]}
+    elif sport == 138 and p[0] in (0x10, 0x11, 0x12):
+        name, suffix, _ = _nb_decode(p, 14)
+        obs["via"] = "netbios"
+        if name and suffix in (0x00, 0x20):
+            obs["names"] = {"netbios": name}
+    if obs["mac"] and (obs.get("ip") or obs.get("ip6")):
+        out.append(obs)
+    return out
+
+def _dhcp(p: bytes) -> List[Dict[str, Any]]:
+    if len(p) < 240 or p[236:240] != b"\x63\x82\x53\x63" or p[1] != 1 or p[2] != 6:
+        return []
+    op, mac = p[0], _mac(p[28:34])
+    opts, off = {}, 240
+    while off < len(p) and p[off] != 255:
+        if p[off] == 0:
+            off += 1
+            continue
+        code, ln = p[off], p[off + 1]
+        opts[code] = p[off + 2:off + 2 + ln]
+        off += 2 + ln
+    mtype = opts.get(53, b"\0")[0]
+    if not mac:
+        return []
+    if op == 1:                                    # client: nome, vendor class, IP richiesto
+        o: Dict[str, Any] = {"mac": mac, "ip": _ip4(p[12:16]) or _ip4(opts.get(50, b"")), "via": "dhcp"}
+        if 12 in opts:
+            o["names"] = {"dhcp": opts[12].decode("utf-8", "replace").strip("\0 ")}
+        if 60 in opts:
+            o["dhcp_vendor"] = opts[60].decode("utf-8", "replace").strip("\0 ")[:64]
+        return [o] if o["ip"] or len(o) > 3 else []
+    if op == 2 and mtype == 5:                     # DHCPACK: assegnazione certa
+        ip = _ip4(p[16:20])
+        return [{"mac": mac, "ip": ip, "via": "dhcp"}] if ip else []
+    return []
+
+# ----------------- stato per host -----------------
+class Tracker:
+    """Ultimo stato per MAC (campi fissi) e insieme dei MAC da scrivere nell'inventario."""
+
+    def __init__(self, max_hosts: int = MAX_HOSTS):
+        self.max_hosts = max_hosts
+        self.hosts: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.dirty: set = set()
+        self.frames = 0
+
+    def update(self, o: Dict[str, Any], ts: int):
+        mac = o.get("mac")
+        if not mac:
+            return
+        rec = self.hosts.get(mac)
+        if rec is None:
+            rec = self.hosts[mac] = {"mac": mac, "first_seen": ts, "names": {}, "services": []}
+            if len(self.hosts) > self.max_hosts:
+                old, _ = self.hosts.popitem(last=False)
+                self.dirty.discard(old)
+        else:
+            self.hosts.move_to_end(mac)
+        rec["last_seen"] = ts
+        rec["via"] = o.get("via")
+        for f in ("ip", "ip6", "dhcp_vendor"):
+            if o.get(f):
+                rec[f] = o[f]
+        rec["names"].update(o.get("names") or {})
+        for s in o.get("services") or []:
+            if s not in rec["services"] and len(rec["services"]) < MAX_SERVICES:
+                rec["services"].append(s)
+        self.dirty.add(mac)
+
+    def drain(self) -> List[Dict[str, Any]]:
+        out = [dict(self.hosts[m], names=dict(self.hosts[m]["names"]), services=list(self.hosts[m]["services"]))
+               for m in self.dirty if m in self.hosts]
+        self.dirty.clear()
+        return out
@@ -0,0 +1,189 @@
+# /opt/netprobe/app/util/rdns.py
+"""
+Risoluzione inversa (PTR) concorrente con cache TTL condivisa tra le scansioni.
+
+Client DNS minimale su UDP con asyncio: al massimo CONCURRENCY query in volo, timeout
+per query con un tentativo in più, TTL della risposta rispettato (cache negativa con il
+minimo del SOA per NXDOMAIN/NODATA, NEG_TTL se manca). Nessun subprocess dig.
+
+Il server è il primo nameserver di /etc/resolv.conf; `server=(host, porta)` permette di
+puntare a un resolver stub locale.
+"""
+from __future__ import annotations
+import asyncio, random, struct, threading, time, ipaddress
+from typing import Dict, Iterable, List, Optional, Tuple
+
+CONCURRENCY = 32
+TIMEOUT     = 1.5          # s per tentativo
+RETRIES     = 1
+NEG_TTL     = 300          # s per errori/timeout e negativi senza SOA
+MIN_TTL     = 30
+MAX_TTL     = 86400
+CACHE_MAX   = 20000
+RESOLV_CONF = "/etc/resolv.conf"
+
+_QTYPE_PTR, _QTYPE_SOA, _QCLASS_IN = 12, 6, 1
+_HDR = struct.Struct("!HHHHHH")
+_RR  = struct.Struct("!HHIH")
+
+_cache: Dict[str, Tuple[float, Optional[str]]] = {}   # ip -> (scadenza, nome | None)
+_cache_lock = threading.Lock()
+
+def system_server() -> Tuple[str, int]:
+    try:
+        with open(RESOLV_CONF, encoding="utf-8") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0] == "nameserver":
+                    return parts[1].split("%")[0], 53
+    except OSError:
+        pass
+    return "127.0.0.1", 53
+
+# ----------------- wire format -----------------
+def _query(qid: int, name: str) -> bytes:
+    q = b"".join(bytes([len(l)]) + l.encode("ascii") for l in name.rstrip(".").split(".")) + b"\0"
+    return _HDR.pack(qid, 0x0100, 1, 0, 0, 0) + q + struct.pack("!HH", _QTYPE_PTR, _QCLASS_IN)
+
+def _name(buf: bytes, off: int) -> Tuple[str, int]:
+    """Nome (con compressione) -> (nome, offset dopo il nome nel punto di partenza)."""
+    labels, end, hops = [], None, 0
+    while True:
+        ln = buf[off]
+        if ln & 0xC0 == 0xC0:
+            if end is None:
+                end = off + 2
+            off = ((ln & 0x3F) << 8) | buf[off + 1]
+            hops += 1
+            if hops > 32:
+                raise ValueError("loop di compressione")
+            continue
+        off += 1
+        if ln == 0:
+            break
+        labels.append(buf[off:off + ln].decode("ascii", "replace"))
+        off += ln
+    return ".".join(labels), (end if end is not None else off)
+
+def _parse(buf: bytes, qid: int) -> Tuple[bool, Optional[str], int]:
+    """(risposta valida, nome PTR | None, ttl)."""
+    rid, flags, qd, an, ns, _ = _HDR.unpack_from(buf, 0)
+    if rid != qid or not flags & 0x8000:
+        return False, None, 0
+    rcode = flags & 0xF
+    if rcode not in (0, 3):
+        return True, None, NEG_TTL        # SERVFAIL/REFUSED: negativo breve
+    off = _HDR.size
+    for _ in range(qd):
+        _, off = _name(buf, off)
+        off += 4
+    ptr, ttl = None, None
+    for _ in range(an):
+        _, off = _name(buf, off)
+        rtype, _, rttl, rdlen = _RR.unpack_from(buf, off); off += _RR.size
+        if rtype == _QTYPE_PTR and ptr is None:
+            ptr, _ = _name(buf, off)
+            ttl = rttl
+        off += rdlen
+    if ptr:
+        return True, ptr, ttl or 0
+    # negativo: TTL = min(TTL del SOA, minimum) dall'authority (RFC 2308)
+    for _ in range(ns):
+        _, off = _name(buf, off)
+        rtype, _, rttl, rdlen = _RR.unpack_from(buf, off); off += _RR.size
+        if rtype == _QTYPE_SOA:
+            _, p = _name(buf, off)
+            _, p = _name(buf, p)
+            minimum = struct.unpack_from("!I", buf, p + 16)[0]
+            return True, None, min(rttl, minimum)
+        off += rdlen
+    return True, None, NEG_TTL
+
+class _Proto(asyncio.DatagramProtocol):
+    def __init__(self, qid: int):
+        self.qid = qid
+        self.fut: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    def datagram_received(self, data, addr):
+        try:
+            ok, name, ttl = _parse(data, self.qid)
+        except Exception:
+            return
+        if ok and not self.fut.done():
+            self.fut.set_result((name, ttl))
+
+    def error_received(self, exc):
+        if not self.fut.done():
+            self.fut.set_exception(exc)
+
+async def _ask(ip: str, server: Tuple[str, int]) -> Tuple[Optional[str], int]:
+    loop = asyncio.get_running_loop()
+    rname = ipaddress.ip_address(ip).reverse_pointer
+    for _ in range(RETRIES + 1):
+        qid = random.randrange(1 << 16)
+        tr, pr = await loop.create_datagram_endpoint(lambda: _Proto(qid), remote_addr=server)
+        try:
+            tr.sendto(_query(qid, rname))
+            return await asyncio.wait_for(pr.fut, TIMEOUT)
+        except (asyncio.TimeoutError, OSError):
+            continue
+        finally:
+            tr.close()
+    return None, NEG_TTL
+
+# ----------------- API -----------------
+def _cached(ip: str, now: float):
+    with _cache_lock:
+        hit = _cache.get(ip)
+    if hit and hit[0] > now:
+        return True, hit[1]
+    return False, None
+
+def _store(ip: str, name: Optional[str], ttl: int, now: float):
+    ttl = max(MIN_TTL, min(int(ttl), MAX_TTL))
+    with _cache_lock:
+        if len(_cache) >= CACHE_MAX:
+            for k in [k for k, v in _cache.items() if v[0] <= now] or list(_cache)[:CACHE_MAX // 10]:
+                _cache.pop(k, None)
+        _cache[ip] = (now + ttl, name.rstrip(".") if name else None)
+
+async def resolve_many(ips: Iterable[str], server: Optional[Tuple[str, int]] = None,
+                       concurrency: int = CONCURRENCY) -> Dict[str, Optional[str]]:
+    """ip -> nome PTR (None se assente/timeout); dalla cache quando ancora valida."""
+    server = server or system_server()
+    now = time.time()
+    out: Dict[str, Optional[str]] = {}
+    todo: List[str] = []
+    for ip in dict.fromkeys(ips):
+        try:
+            ipaddress.ip_address(ip)
+        except ValueError:
+            out[ip] = None
+            continue
+        hit, name = _cached(ip, now)
+        if hit:
+            out[ip] = name
+        else:
+            todo.append(ip)
+    sem = asyncio.Semaphore(max(1, concurrency))
+
+    async def one(ip: str):
+        async with sem:
+            try:
+                name, ttl = await _ask(ip, server)
+            except Exception:
+                name, ttl = None, NEG_TTL
+        _store(ip, name, ttl, time.time())
+        out[ip] = name.rstrip(".") if name else None
+
+    await asyncio.gather(*(one(ip) for ip in todo))
+    return out
+
+def lookup_many(ips: Iterable[str], server: Optional[Tuple[str, int]] = None,
+                concurrency: int = CONCURRENCY) -> Dict[str, Optional[str]]:
+    """Versione sincrona per i thread di scansione (event loop proprio)."""
+    return asyncio.run(resolve_many(list(ips), server, concurrency))
+
+def cache_clear():
+    with _cache_lock:
+        _cache.clear()
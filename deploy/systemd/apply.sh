@@ -16,6 +16,10 @@ UNIT_API_SVC="netprobe-api.service"
 UNIT_API_SOCK="netprobe-api.socket"
 UNIT_COLLECTOR="netprobe-flow-collector.service"
 UNIT_EXPORTER_TMPL="netprobe-flow-exporter@.service"
+UNIT_PARTITION_TMPL="netprobe-flow-partition@.service"
+UNIT_PASSIVE_TMPL="netprobe-netmap-passive@.service"
+UNIT_ROLLUP_SVC="netprobe-flow-rollup.service"
+UNIT_ROLLUP_TIMER="netprobe-flow-rollup.timer"
 
 # --- copia unit file ---
 log "Copio unit file in ${SYSTEMD_DIR}…"
@@ -23,6 +27,10 @@ install -D -m 0644 "${SCRIPT_DIR}/${UNIT_API_SVC}"       "${SYSTEMD_DIR}/${UNIT_
 install -D -m 0644 "${SCRIPT_DIR}/${UNIT_API_SOCK}"      "${SYSTEMD_DIR}/${UNIT_API_SOCK}"
 install -D -m 0644 "${SCRIPT_DIR}/${UNIT_COLLECTOR}"     "${SYSTEMD_DIR}/${UNIT_COLLECTOR}"
 install -D -m 0644 "${SCRIPT_DIR}/${UNIT_EXPORTER_TMPL}" "${SYSTEMD_DIR}/${UNIT_EXPORTER_TMPL}"
+install -D -m 0644 "${SCRIPT_DIR}/${UNIT_PARTITION_TMPL}" "${SYSTEMD_DIR}/${UNIT_PARTITION_TMPL}"
+install -D -m 0644 "${SCRIPT_DIR}/${UNIT_PASSIVE_TMPL}"  "${SYSTEMD_DIR}/${UNIT_PASSIVE_TMPL}"
+install -D -m 0644 "${SCRIPT_DIR}/${UNIT_ROLLUP_SVC}"    "${SYSTEMD_DIR}/${UNIT_ROLLUP_SVC}"
+install -D -m 0644 "${SCRIPT_DIR}/${UNIT_ROLLUP_TIMER}"  "${SYSTEMD_DIR}/${UNIT_ROLLUP_TIMER}"
 
 # --- copia eventuali drop-in dal repo ---
 copy_dropins() {
@@ -84,6 +92,11 @@ netprobe ALL=(root) NOPASSWD: \
   /usr/bin/systemctl start netprobe-flow-exporter@*, \
   /usr/bin/systemctl stop netprobe-flow-exporter@*, \
   /usr/bin/systemctl restart netprobe-flow-exporter@*, \
+  /usr/bin/systemctl start netprobe-flow-partition@*, \
+  /usr/bin/systemctl stop netprobe-flow-partition@*, \
+  /usr/bin/systemctl restart netprobe-flow-partition@*, \
+  /usr/bin/systemctl enable --now netprobe-netmap-passive@*, \
+  /usr/bin/systemctl disable --now netprobe-netmap-passive@*, \
   /usr/bin/fuser -k -n udp 2055, \
   /usr/bin/install -d -m 2770 -o netprobe -g netprobe /var/lib/nfsen-ng/profiles-data/live/netprobe, \
   /bin/ln -snf /var/lib/nfsen-ng/profiles-data/live/netprobe /var/lib/netprobe/flows
@@ -127,6 +140,10 @@ systemctl stop "${UNIT_API_SVC}" 2>/dev/null || true
 log "Abilito e (ri)avvio il collector…"
 systemctl enable --now "${UNIT_COLLECTOR}" || true
 
+# --- Rollup flussi: timer ogni minuto ---
+log "Abilito il timer dei rollup flussi…"
+systemctl enable --now "${UNIT_ROLLUP_TIMER}" || true
+
 # --- Exporter: nessuna istanza abilitata al boot ---
 log "Stoppo ed eventuale disable di istanze exporter residue…"
 systemctl stop 'netprobe-flow-exporter@*' 2>/dev/null || true
@@ -117,7 +117,7 @@ python3 -m venv "${APP_DIR}/venv"
 if [[ -f "${APP_DIR}/requirements.txt" ]]; then
   "${APP_DIR}/venv/bin/pip" install -r "${APP_DIR}/requirements.txt"
 else
-  "${APP_DIR}/venv/bin/pip" install fastapi uvicorn jinja2 python-multipart speedtest-cli websockets wsproto scapy
+  "${APP_DIR}/venv/bin/pip" install fastapi uvicorn jinja2 python-multipart speedtest-cli websockets wsproto scapy numpy lz4
 fi
 chown -R "${APP_USER}:${APP_GROUP}" "${APP_DIR}"
 
@@ -184,6 +184,11 @@ netprobe ALL=(root) NOPASSWD: \
   /usr/bin/systemctl start netprobe-flow-exporter@*, \
   /usr/bin/systemctl stop netprobe-flow-exporter@*, \
   /usr/bin/systemctl restart netprobe-flow-exporter@*, \
+  /usr/bin/systemctl start netprobe-flow-partition@*, \
+  /usr/bin/systemctl stop netprobe-flow-partition@*, \
+  /usr/bin/systemctl restart netprobe-flow-partition@*, \
+  /usr/bin/systemctl enable --now netprobe-netmap-passive@*, \
+  /usr/bin/systemctl disable --now netprobe-netmap-passive@*, \
   /usr/bin/fuser -k -n udp 2055, \
   /usr/bin/install -d -m 2770 -o netprobe -g netprobe /var/lib/nfsen-ng/profiles-data/live/netprobe, \
   /bin/ln -snf /var/lib/nfsen-ng/profiles-data/live/netprobe /var/lib/netprobe/flows
@@ -226,6 +231,15 @@ Unit=netprobe-alertd.service
 WantedBy=timers.target
 EOF
 
+  # ------------------ FLOW ROLLUP: service + timer ------------------
+  step "Systemd: flow rollup (service + timer)"
+  install -D -m 0644 "${SCRIPT_DIR}/netprobe-flow-rollup.service" "${SYSTEMD_DIR}/netprobe-flow-rollup.service"
+  install -D -m 0644 "${SCRIPT_DIR}/netprobe-flow-rollup.timer"   "${SYSTEMD_DIR}/netprobe-flow-rollup.timer"
+
+  # ------------------ NET MAPPER: ascolto passivo (istanze dalla UI) ------------------
+  step "Systemd: netmap passive (template)"
+  install -D -m 0644 "${SCRIPT_DIR}/netprobe-netmap-passive@.service" "${SYSTEMD_DIR}/netprobe-netmap-passive@.service"
+
   # ------------------ SPEEDTESTD: service + timer ------------------
   step "Systemd: speedtestd (service + timer)"
   cat > /etc/systemd/system/netprobe-speedtestd.service <<'EOF'
@@ -475,6 +489,7 @@ install -d -m 0770 -o "${APP_USER}" -g "${APP_GROUP}" /var/lib/netprobe/speedtes
 install -d -m 0770 -o "${APP_USER}" -g "${APP_GROUP}" /var/lib/netprobe/voip /var/lib/netprobe/voip/captures
 install -d -m 0770 -o "${APP_USER}" -g "${APP_GROUP}" /var/lib/netprobe/netmap /var/lib/netprobe/netmap/scans
 install -d -m 0770 -o "${APP_USER}" -g "${APP_GROUP}" /var/lib/netprobe/logs
+install -d -m 0770 -o "${APP_USER}" -g "${APP_GROUP}" /var/lib/netprobe/flowrollup
 [[ -f /var/lib/netprobe/voip/captures.json ]] || { echo '{"captures":[]}' >/var/lib/netprobe/voip/captures.json; chown ${APP_USER}:${APP_GROUP} /var/lib/netprobe/voip/captures.json; chmod 0660 /var/lib/netprobe/voip/captures.json; }
 [[ -f /var/lib/netprobe/voip/index.json    ]] || { echo '{"calls":{}, "rtp_streams":[], "built_ts":0}' >/var/lib/netprobe/voip/index.json; chown ${APP_USER}:${APP_GROUP} /var/lib/netprobe/voip/index.json; chmod 0660 /var/lib/netprobe/voip/index.json; }
 [[ -f /var/lib/netprobe/netmap/index.json  ]] || { echo '{"scans":[]}' >/var/lib/netprobe/netmap/index.json; chown ${APP_USER}:${APP_GROUP} /var/lib/netprobe/netmap/index.json; chmod 0660 /var/lib/netprobe/netmap/index.json; }
@@ -506,6 +521,10 @@ Cmnd_Alias NP_SVC = \
   /bin/systemctl start netprobe-flow-exporter@*,  /usr/bin/systemctl start netprobe-flow-exporter@*, \
   /bin/systemctl stop  netprobe-flow-exporter@*,  /usr/bin/systemctl stop  netprobe-flow-exporter@*, \
   /bin/systemctl restart netprobe-flow-exporter@*, /usr/bin/systemctl restart netprobe-flow-exporter@*, \
+  /bin/systemctl restart netprobe-flow-partition@*, /usr/bin/systemctl restart netprobe-flow-partition@*, \
+  /bin/systemctl stop  netprobe-flow-partition@*,  /usr/bin/systemctl stop  netprobe-flow-partition@*, \
+  /bin/systemctl enable --now netprobe-netmap-passive@*,  /usr/bin/systemctl enable --now netprobe-netmap-passive@*, \
+  /bin/systemctl disable --now netprobe-netmap-passive@*, /usr/bin/systemctl disable --now netprobe-netmap-passive@*, \
   /bin/systemctl restart netprobe-api.service,     /usr/bin/systemctl restart netprobe-api.service, \
   /bin/systemctl start netprobe-dhcpsentinel.service, /usr/bin/systemctl start netprobe-dhcpsentinel.service
 Cmnd_Alias NP_TIME = /usr/bin/timedatectl *, /bin/timedatectl *
@@ -814,6 +833,7 @@ systemctl restart smokeping || true
 systemctl reload apache2 || systemctl restart apache2
 systemctl enable --now netprobe-alertd.timer  || true
 systemctl enable --now netprobe-speedtestd.timer || true
+systemctl enable --now netprobe-flow-rollup.timer || true
 systemctl enable --now netprobe-dhcpsentinel.timer || true
 systemctl enable --now netprobe-webtop.service || true
 
@@ -0,0 +1,29 @@
+# Regressioni di util.flowseries.bin_flows
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+np = pytest.importorskip("numpy")
+flowseries = pytest.importorskip("util.flowseries")
+
+
+def test_bin_flows_only_crossing_flows():
+    # nessun flusso interamente in un bin: gli accumulatori restano float
+    m = flowseries.bin_flows([30], [90], [1000], [10], 0, 60, 4)
+    assert m["bytes"].dtype == np.float64
+    assert m["bytes"][0].tolist() == pytest.approx([500.0, 500.0, 0.0, 0.0])
+    assert m["packets"][0].tolist() == pytest.approx([5.0, 5.0, 0.0, 0.0])
+    assert m["flows"][0].tolist() == [0.0, 1.0, 0.0, 0.0]
+
+
+def test_bin_flows_multi_bin_span():
+    m = flowseries.bin_flows([10, 50], [70, 130], [600, 800], [6, 8], 0, 60, 4)
+    assert m["bytes"].sum() == pytest.approx(1400.0)
+    assert m["flows"][0].tolist() == [0.0, 1.0, 1.0, 0.0]
+
+
+def test_bin_flows_mixed():
+    m = flowseries.bin_flows([0, 30], [10, 90], [100, 1000], [1, 10], 0, 60, 2)
+    assert m["bytes"][0].tolist() == pytest.approx([600.0, 500.0])